@@ -0,0 +1,12 @@
+# esegui_job.py
+# Esecuzione da riga di comando di backtest e ottimizzazioni descritti in file JSON o TOML, senza
+# Streamlit (formato dei job in utils/esecuzione_job.py).
+#
+# Uso: python esegui_job.py job.json [altri_job.toml ...] [--processi N] [--cartella-output DIR]
+
+import sys
+
+from utils.esecuzione_job import main
+
+if __name__ == '__main__':
+    sys.exit(main())
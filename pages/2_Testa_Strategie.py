@@ -16,10 +16,14 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Importa le funzioni dai moduli di utilità
-from utils.importazione_dati import load_tickers_from_csv, download_stock_data, get_ticker_list_for_selection, extract_symbol_from_selection
+from utils.importazione_dati import load_tickers_from_csv, download_stock_data, download_universe_data, get_ticker_list_for_selection, extract_symbol_from_selection
 from utils.strategies_config import STRATEGIE_DISPONIBILI
-from utils.backtesting_engine import run_backtest
+from utils.backtesting_engine import (
+    run_backtest, costruisci_trade_log, statistiche_trade,
+    MOTIVO_APERTA, MOTIVO_STOP_LOSS, MOTIVO_TAKE_PROFIT, MOTIVO_TRAILING_STOP
+)
 from utils.plotting_utils import plot_backtest_results, plot_equity_curves
+from utils.portfolio_engine import run_portfolio_backtest, genera_segnali_universo, tabella_trade_portafoglio
 
 # Per importare dinamicamente le classi delle strategie
 import importlib
@@ -243,8 +247,8 @@ if run_button:
                             if 'VOLUME' in df_for_backtest.columns:
                                 df_for_backtest.rename(columns={'VOLUME': 'Volume'}, inplace=True)
                             # --- Fine Adattamento ---
-                            # Esegui il backtest
-                            trade_log, equity_curve, buy_hold_equity_series, metrics = run_backtest(
+                            # Esegui il backtest (i trade tornano come round-trip colonnari)
+                            trade_round_trip, equity_curve, buy_hold_equity_series, metrics = run_backtest(
                                 dati=df_for_backtest,
                                 capitale_iniziale=initial_capital,
                                 commissione_percentuale=commissione_percentuale,
@@ -254,9 +258,11 @@ if run_button:
                                 take_profit_percent=take_profit_percent,
                                 trailing_stop_percent=trailing_stop_percent
                             )
-                            if not trade_log:
+                            if len(trade_round_trip) == 0:
                                 st.warning("Nessun trade eseguito durante il backtest con i parametri specificati.")
                             else:
+                                # Il trade log con le colonne di visualizzazione viene costruito solo qui
+                                trade_log = costruisci_trade_log(trade_round_trip, equity_curve, commissione_percentuale)
                                 st.success(f"Backtest completato! Eseguiti {len(trade_log)} trade.")
 
                                 # --- Dettaglio dei Trade con motivo di chiusura ---
@@ -296,14 +302,14 @@ if run_button:
                                 st.subheader("Metriche di Performance")
                                 
                                 # Calcola metriche aggiuntive
-                                total_commission = sum(trade.get('Comm. (€)', 0) for trade in trade_log)
-                                winning_trades = len([t for t in trade_log if t.get('P/L (€)', 0) > 0])
-                                losing_trades = len([t for t in trade_log if t.get('P/L (€)', 0) < 0])
-                                win_rate = (winning_trades / len(trade_log) * 100) if trade_log else 0
+                                statistiche = statistiche_trade(trade_round_trip, commissione_percentuale)
+                                total_commission = statistiche['Commissioni Totali (€)']
+                                winning_trades = statistiche['Num. Vincenti']
+                                losing_trades = statistiche['Num. Perdenti']
                                 
                                 # Calcola Profit Factor
-                                gross_profit = sum(t.get('P/L (€)', 0) for t in trade_log if t.get('P/L (€)', 0) > 0)
-                                gross_loss = abs(sum(t.get('P/L (€)', 0) for t in trade_log if t.get('P/L (€)', 0) < 0))
+                                gross_profit = statistiche['Profitto Lordo (€)']
+                                gross_loss = statistiche['Perdita Lorda (€)']
                                 profit_factor = gross_profit / gross_loss if gross_loss != 0 else float('inf')
                                 
                                 # Calcola Reward/Risk Ratio
@@ -385,81 +391,56 @@ if run_button:
                                 elif selected_strategy_name == "Livelli Stocastico (DIFF D-DD)":
                                     indicator_cols_to_plot = ['%K', '%D', '%DD']
 
-                                # Adatta il formato dei trade per il plotting
+                                # Adatta il formato dei trade per il plotting: un elemento per l'ingresso
+                                # e uno per l'uscita di ogni round-trip, letti direttamente dalle colonne
+                                date_trade = equity_curve.index
+                                nomi_motivo = {
+                                    MOTIVO_STOP_LOSS: 'Stop Loss',
+                                    MOTIVO_TAKE_PROFIT: 'Take Profit',
+                                    MOTIVO_TRAILING_STOP: 'Trailing Stop',
+                                }
                                 adapted_trades = []
-                                for i, trade in enumerate(trade_log):
-                                    # Determina la data di uscita dal trade successivo se disponibile
-                                    exit_date = None
-                                    exit_price = None
-                                    
-                                    # Se è un trade di apertura (BUY o SHORT), cerca la data di chiusura
-                                    if 'BUY' in trade['Tipo'] or 'SHORT' in trade['Tipo']:
-                                        if i < len(trade_log) - 1:
-                                            for j in range(i+1, len(trade_log)):
-                                                if ('SELL' in trade_log[j]['Tipo'] and 'BUY' in trade['Tipo']) or \
-                                                   ('COVER' in trade_log[j]['Tipo'] and 'SHORT' in trade['Tipo']):
-                                                    exit_date = trade_log[j]['Data']
-                                                    exit_price = trade_log[j]['Prezzo']
-                                                    break
-                                    
-                                    # Determina il motivo di chiusura per il trade
-                                    exit_reason = None
-                                    
-                                    # Estrai il motivo di chiusura dal tipo di trade
-                                    if 'Stop Loss' in trade.get('Tipo', ''):
-                                        exit_reason = 'Stop Loss'
-                                    elif 'Take Profit' in trade.get('Tipo', ''):
-                                        exit_reason = 'Take Profit'
-                                    elif 'Trailing Stop' in trade.get('Tipo', ''):
-                                        exit_reason = 'Trailing Stop'
-                                    
-                                    # Determina il tipo di trade
-                                    if 'BUY' in trade['Tipo']:
-                                        trade_type = 'LONG'
-                                    elif 'SHORT' in trade['Tipo']:
-                                        trade_type = 'SHORT'
-                                    elif 'SELL' in trade['Tipo']:
-                                        trade_type = 'SELL'
-                                    elif 'COVER' in trade['Tipo']:
-                                        trade_type = 'COVER'
-                                    else:
-                                        trade_type = 'UNKNOWN'
-                                    
-                                    adapted_trade = {
-                                        'entry_date': trade['Data'],
-                                        'entry_price': trade['Prezzo'],
-                                        'exit_date': exit_date,
-                                        'exit_price': exit_price,
-                                        'exit_reason': exit_reason,
-                                        'trade_type': trade_type,
-                                        'status': 'Closed' if exit_date is not None else 'Open' if ('BUY' in trade['Tipo'] or 'SHORT' in trade['Tipo']) else 'Closed',
-                                        'profit/loss_%': trade.get('P/L (€)', 0) / (trade['Prezzo'] * trade['Quantità']) * 100 if 'P/L (€)' in trade else 0
-                                    }
-                                    adapted_trades.append(adapted_trade)
-
-                                # Crea un dizionario per i marker di Stop Loss, Take Profit e Trailing Stop
-                                sl_markers = []
-                                tp_markers = []
-                                ts_markers = []
-                                
-                                # Identifica i trade con Stop Loss, Take Profit e Trailing Stop
-                                for trade in trade_log:
-                                    trade_type = trade.get('Tipo', '')
-                                    if 'Stop Loss' in trade_type:
-                                        sl_markers.append({
-                                            'date': pd.to_datetime(trade['Data']),
-                                            'price': trade['Prezzo']
-                                        })
-                                    elif 'Take Profit' in trade_type:
-                                        tp_markers.append({
-                                            'date': pd.to_datetime(trade['Data']),
-                                            'price': trade['Prezzo']
-                                        })
-                                    elif 'Trailing Stop' in trade_type:
-                                        ts_markers.append({
-                                            'date': pd.to_datetime(trade['Data']),
-                                            'price': trade['Prezzo']
-                                        })
+                                for barra_in, barra_out, direzione, quantita, prezzo_in, prezzo_out, motivo, pl in trade_round_trip.tolist():
+                                    aperto = motivo == MOTIVO_APERTA
+                                    adapted_trades.append({
+                                        'entry_date': date_trade[barra_in].date(),
+                                        'entry_price': prezzo_in,
+                                        'exit_date': None if aperto else date_trade[barra_out].date(),
+                                        'exit_price': None if aperto else prezzo_out,
+                                        'exit_reason': None,
+                                        'trade_type': 'LONG' if direzione > 0 else 'SHORT',
+                                        'status': 'Open' if aperto else 'Closed',
+                                        'profit/loss_%': 0
+                                    })
+                                    if aperto:
+                                        continue
+                                    adapted_trades.append({
+                                        'entry_date': date_trade[barra_out].date(),
+                                        'entry_price': prezzo_out,
+                                        'exit_date': None,
+                                        'exit_price': None,
+                                        'exit_reason': nomi_motivo.get(motivo),
+                                        'trade_type': 'SELL' if direzione > 0 else 'COVER',
+                                        'status': 'Closed',
+                                        'profit/loss_%': pl / (prezzo_out * quantita) * 100
+                                    })
+
+                                # Marker di Stop Loss, Take Profit e Trailing Stop dalle uscite con il relativo codice
+                                uscite = trade_round_trip[trade_round_trip['motivo_uscita'] != MOTIVO_APERTA]
+                                date_uscita = date_trade[uscite['barra_uscita']].normalize()
+                                marker_per_motivo = {
+                                    motivo: [
+                                        {'date': data_uscita, 'price': prezzo}
+                                        for data_uscita, prezzo in zip(
+                                            date_uscita[uscite['motivo_uscita'] == motivo],
+                                            uscite['prezzo_uscita'][uscite['motivo_uscita'] == motivo].tolist()
+                                        )
+                                    ]
+                                    for motivo in (MOTIVO_STOP_LOSS, MOTIVO_TAKE_PROFIT, MOTIVO_TRAILING_STOP)
+                                }
+                                sl_markers = marker_per_motivo[MOTIVO_STOP_LOSS]
+                                tp_markers = marker_per_motivo[MOTIVO_TAKE_PROFIT]
+                                ts_markers = marker_per_motivo[MOTIVO_TRAILING_STOP]
                                 
                                 # Aggiungi i marker direttamente al DataFrame
                                 if sl_markers or tp_markers or ts_markers:
@@ -511,4 +492,47 @@ if run_button:
                         st.error(f"Errore durante l'esecuzione della strategia o del backtest: {e}")
                         st.exception(e)
             else:
-                st.warning("Impossibile scaricare i dati o i dati sono vuoti per il simbolo e l'intervallo specificati. Riprova con altre selezioni.")
\ No newline at end of file
+                st.warning("Impossibile scaricare i dati o i dati sono vuoti per il simbolo e l'intervallo specificati. Riprova con altre selezioni.")
+
+# --- Backtest di portafoglio ---
+st.header("Backtest di Portafoglio")
+with st.expander("Strategia su più titoli con capitale condiviso"):
+    st.write("Applica la strategia e i parametri scelti a più titoli insieme: i titoli competono per lo stesso "
+             "capitale e per un numero massimo di posizioni aperte contemporaneamente (Stop Loss, Take Profit e "
+             "Trailing Stop non si applicano al portafoglio).")
+    titoli_portafoglio = st.multiselect(
+        "Titoli del portafoglio:",
+        options=tickers_for_selection or [],
+        default=[selected_ticker_display] if tickers_for_selection else []
+    )
+    max_posizioni = int(st.number_input(
+        "Numero massimo di posizioni aperte:", min_value=1, max_value=100, value=5, step=1,
+        help="Con importo fisso a 0 ogni nuova posizione usa equity / numero massimo di posizioni."
+    ))
+
+    if st.button("Esegui Backtest di Portafoglio", disabled=not titoli_portafoglio or not strategy_info):
+        if start_date >= end_date:
+            st.error("Errore: La data di inizio deve essere precedente alla data di fine.")
+        else:
+            simboli_portafoglio = [extract_symbol_from_selection(titolo) for titolo in titoli_portafoglio]
+            with st.spinner(f"Scaricamento dati e backtest di {len(simboli_portafoglio)} titoli..."):
+                dati_universo = download_universe_data(simboli_portafoglio, start_date, end_date)
+                dati_con_segnali = genera_segnali_universo(dati_universo, selected_strategy_name, strategy_parameters)
+            if not dati_con_segnali:
+                st.error("Nessun titolo con dati e segnali validi.")
+            else:
+                trade_portafoglio, equity_portafoglio, buy_hold_portafoglio, metriche_portafoglio = run_portfolio_backtest(
+                    dati_con_segnali,
+                    capitale_iniziale=initial_capital,
+                    commissione_percentuale=commissione_percentuale,
+                    abilita_short=abilita_short,
+                    max_posizioni=max_posizioni,
+                    investimento_fisso_per_trade=investimento_fisso_per_trade if investimento_fisso_per_trade > 0 else None
+                )
+                st.dataframe(pd.DataFrame({
+                    'Metrica': list(metriche_portafoglio.keys()),
+                    'Valore': [str(valore) for valore in metriche_portafoglio.values()]
+                }), use_container_width=True)
+                st.plotly_chart(plot_equity_curves(equity_portafoglio, buy_hold_portafoglio), use_container_width=True)
+                if len(trade_portafoglio) > 0:
+                    st.dataframe(tabella_trade_portafoglio(trade_portafoglio, equity_portafoglio.index), use_container_width=True)
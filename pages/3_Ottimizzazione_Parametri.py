@@ -11,11 +11,21 @@ import plotly.express as px
 import time
 
 # Importazioni dai moduli di utilità
-from utils.importazione_dati import load_tickers_from_csv, download_stock_data, get_ticker_list_for_selection, extract_symbol_from_selection
+from utils.importazione_dati import load_tickers_from_csv, download_stock_data, download_universe_data, get_ticker_list_for_selection, extract_symbol_from_selection
 from utils.strategies_config import STRATEGIE_DISPONIBILI
-from utils.ottimizzazione_engine import run_optimization
-from utils.backtesting_engine import run_backtest
+from utils.ottimizzazione_engine import run_optimization, valori_parametri
+from utils.campionamento import METODI_CAMPIONAMENTO, numero_combinazioni_valide
+from utils.ottimizzazione_surrogata import run_surrogate_optimization
+from utils.ottimizzazione_dimezzamento import run_successive_halving
+from utils.ottimizzazione_raffinamento import run_coarse_to_fine
+from utils.ottimizzazione_evolutiva import run_evolutionary_optimization
+from utils.ottimizzazione_multi_ticker import run_optimization_multi_ticker
+from utils.ottimizzazione_walk_forward import run_walk_forward
+from utils.frontiera_pareto import fronte_pareto, OBIETTIVI_PREDEFINITI
+from utils.backtesting_engine import run_backtest, costruisci_trade_log, statistiche_trade
 from utils.plotting_utils import plot_backtest_results, plot_equity_curves as plot_equity_comparison
+from utils import strumentazione
+from utils.cache_risultati import PERCORSO_PREDEFINITO as PERCORSO_CACHE_RISULTATI
 
 # --- Configurazione della pagina Streamlit ---
 st.set_page_config(
@@ -54,6 +64,8 @@ if 'best_buy_hold_equity' not in st.session_state:
     st.session_state.best_buy_hold_equity = pd.Series(dtype=float)
 if 'best_trades' not in st.session_state:
     st.session_state.best_trades = []
+if 'rapporto_strumentazione' not in st.session_state:
+    st.session_state.rapporto_strumentazione = None
 
 def reset_optimization_state():
     """Resetta lo stato dell'ottimizzazione"""
@@ -63,6 +75,7 @@ def reset_optimization_state():
     st.session_state.best_equity_curve = pd.Series(dtype=float)
     st.session_state.best_buy_hold_equity = pd.Series(dtype=float)
     st.session_state.best_trades = []
+    st.session_state.rapporto_strumentazione = None
     # Non resettare i dati scaricati
     # st.session_state.data_scaricati = pd.DataFrame()
 
@@ -187,18 +200,55 @@ with col_risk3:
 # --- UI per Esecuzione Ottimizzazione ---
 st.subheader("3. Esegui Ottimizzazione")
 
-# Calcola il numero di combinazioni da testare
-num_combinations = 1
-for param_name, param_config in optimization_config.items():
-    if 'min' in param_config and 'max' in param_config and 'step' in param_config:
-        min_val = param_config['min']
-        max_val = param_config['max']
-        step_val = param_config['step']
-        num_values = int((max_val - min_val) / step_val) + 1
-        num_combinations *= num_values
+# Calcola il numero di combinazioni da testare (escluse quelle che violano i vincoli della strategia)
+nomi_parametri_ottimizzati, valori_parametri_ottimizzati = valori_parametri(optimization_config)
+num_combinations = numero_combinazioni_valide(
+    nomi_parametri_ottimizzati, valori_parametri_ottimizzati,
+    STRATEGIE_DISPONIBILI[selected_strategy_name].get('constraints', [])
+)
+
+# Campionamento: griglia completa oppure un numero fisso di punti ben distribuiti nello spazio dei parametri
+METODI_CAMPIONAMENTO_UI = {
+    "Griglia completa": 'griglia',
+    "Casuale": 'casuale',
+    "Latin hypercube": 'lhs',
+    "Sobol": 'sobol',
+    "Guidata da modello surrogato": 'surrogato',
+    "Algoritmo evolutivo": 'evolutivo',
+    "Dimezzamento successivo": 'dimezzamento',
+    "Raffinamento progressivo della griglia": 'raffinamento',
+}
+metodo_campionamento_label = st.selectbox(
+    "Combinazioni da testare:",
+    list(METODI_CAMPIONAMENTO_UI.keys()),
+    help="Con le griglie grandi (es. 5 parametri) un campione di punti ben distribuiti trova buone zone "
+         "dello spazio dei parametri a una frazione del costo della griglia completa. "
+         "Con il modello surrogato (scikit-learn) le combinazioni vengono scelte a lotti in base ai risultati già ottenuti. "
+         "Con l'algoritmo evolutivo una popolazione di combinazioni evolve per selezione, incrocio e mutazione. "
+         "Con il dimezzamento successivo tutte le combinazioni vengono provate su un breve tratto di storico "
+         "e solo le migliori arrivano al periodo completo. "
+         "Con il raffinamento progressivo si valuta una griglia rada e la si infittisce solo attorno alle "
+         "combinazioni migliori, fino al passo indicato."
+)
+metodo_campionamento = METODI_CAMPIONAMENTO_UI[metodo_campionamento_label]
+max_combinazioni = None
+seme_campionamento = None
+combinazioni_da_testare = num_combinations
+if metodo_campionamento not in ('griglia', 'dimezzamento', 'raffinamento'):
+    col_campioni, col_seme = st.columns(2)
+    with col_campioni:
+        max_combinazioni = int(st.number_input(
+            "Numero di combinazioni:", min_value=1, max_value=max(1, num_combinations),
+            value=min(200, max(1, num_combinations)), step=10
+        ))
+    with col_seme:
+        seme_campionamento = int(st.number_input(
+            "Seme:", min_value=0, value=42, step=1, help="Stesso seme = stesse combinazioni estratte."
+        ))
+    combinazioni_da_testare = min(max_combinazioni, num_combinations)
 
 # Stima del tempo di elaborazione (assumendo circa 1 secondo per combinazione)
-tempo_stimato_sec = num_combinations * 1.0
+tempo_stimato_sec = combinazioni_da_testare * 1.0
 tempo_stimato_min = tempo_stimato_sec / 60
 
 if tempo_stimato_min < 1:
@@ -208,7 +258,20 @@ elif tempo_stimato_min < 60:
 else:
     stima_tempo = f"{tempo_stimato_min/60:.1f} ore"
 
-st.info(f"Numero di combinazioni da testare: {num_combinations} (tempo stimato: {stima_tempo})")
+st.info(f"Numero di combinazioni da testare: {combinazioni_da_testare} su {num_combinations} (tempo stimato: {stima_tempo})")
+
+usa_cache_risultati = st.checkbox(
+    "Salva e riprendi i risultati",
+    value=True,
+    help=f"Le combinazioni già valutate con gli stessi dati e impostazioni vengono lette da '{PERCORSO_CACHE_RISULTATI}': "
+         "un'ottimizzazione interrotta riprende da dove si era fermata e allargando i range vengono testati solo i valori nuovi. "
+         "Dopo una modifica al codice della strategia o del backtest i risultati vengono ricalcolati."
+)
+profila_ottimizzazione = st.checkbox(
+    "Profila l'ottimizzazione",
+    value=False,
+    help="Misura i tempi di preparazione dati, generazione segnali, simulazione e calcolo metriche."
+)
 
 # Modifica la condizione per abilitare il pulsante
 button_disabled = st.session_state.optimization_running or st.session_state.selected_ticker_symbol_opt is None or not optimization_config
@@ -335,8 +398,11 @@ if st.button("Avvia Ottimizzazione", type="primary", disabled=button_disabled):
         # Registra il tempo di inizio
         start_time = time.time()
         
-        # Calcola le metriche per ogni combinazione di parametri
-        best_params, best_metrics, all_results, *_ = run_optimization(
+        # Tempi per fase e contatori raccolti solo se richiesto
+        strumentazione.azzera()
+        strumentazione.abilita(profila_ottimizzazione)
+
+        parametri_ottimizzazione = dict(
             dati=dati_for_backtest,  # <-- Usa i dati con le colonne rinominate
             strategia_nome=selected_strategy_name,
             parametri_ottimizzazione_config=optimization_config,
@@ -349,8 +415,37 @@ if st.button("Avvia Ottimizzazione", type="primary", disabled=button_disabled):
             trailing_stop_percent=trailing_stop_percent,
             metrica_ottimizzazione="Rendimento della strategia (%)",
             progress_callback=update_progress,
-            total_combinations=num_combinations
+            cache_risultati=PERCORSO_CACHE_RISULTATI if usa_cache_risultati else None
         )
+
+        # Calcola le metriche per ogni combinazione di parametri
+        if metodo_campionamento == 'dimezzamento':
+            best_params, best_metrics, all_results, *_ = run_successive_halving(**parametri_ottimizzazione)
+        elif metodo_campionamento == 'raffinamento':
+            best_params, best_metrics, all_results, *_ = run_coarse_to_fine(**parametri_ottimizzazione)
+        elif metodo_campionamento == 'surrogato':
+            best_params, best_metrics, all_results, *_ = run_surrogate_optimization(
+                **parametri_ottimizzazione,
+                n_valutazioni=combinazioni_da_testare,
+                seme=seme_campionamento
+            )
+        elif metodo_campionamento == 'evolutivo':
+            best_params, best_metrics, all_results, *_ = run_evolutionary_optimization(
+                **parametri_ottimizzazione,
+                n_valutazioni=combinazioni_da_testare,
+                seme=seme_campionamento
+            )
+        else:
+            best_params, best_metrics, all_results, *_ = run_optimization(
+                **parametri_ottimizzazione,
+                total_combinations=combinazioni_da_testare,
+                max_combinazioni=max_combinazioni,
+                metodo_campionamento=metodo_campionamento,
+                seme_campionamento=seme_campionamento
+            )
+        strumentazione.disabilita()
+        if profila_ottimizzazione:
+            st.session_state.rapporto_strumentazione = strumentazione.rapporto()
         
         # Salva i risultati nello stato della sessione
         st.session_state.best_params = best_params
@@ -428,10 +523,136 @@ if st.button("Avvia Ottimizzazione", type="primary", disabled=button_disabled):
         progress_bar.progress(1.0)
         status_text.empty()
         st.session_state.optimization_running = False
+        strumentazione.disabilita()
+
+# --- Ottimizzazione robusta su più titoli ---
+with st.expander("Ottimizzazione robusta su più titoli"):
+    st.write("Valuta le stesse combinazioni su più titoli in un'unica esecuzione e sceglie la combinazione "
+             "con la migliore media, mediana o caso peggiore della metrica tra i titoli.")
+    titoli_robustezza = st.multiselect(
+        "Titoli:",
+        options=tickers_for_selection or [],
+        default=[selected_ticker_display] if tickers_for_selection else []
+    )
+    CRITERI_ROBUSTEZZA_UI = {"Mediana": 'mediana', "Media": 'media', "Caso peggiore": 'peggiore'}
+    col_rob1, col_rob2 = st.columns(2)
+    with col_rob1:
+        criterio_robustezza_label = st.selectbox("Scegli la combinazione con la migliore:", list(CRITERI_ROBUSTEZZA_UI.keys()))
+    with col_rob2:
+        usa_piu_processi = st.checkbox("Usa tutti i core", value=True, help="Titoli e combinazioni vengono distribuiti tra più processi.")
+
+    if st.button("Avvia Ottimizzazione Multi-Titolo", disabled=st.session_state.optimization_running or not titoli_robustezza or not optimization_config):
+        simboli_robustezza = [extract_symbol_from_selection(titolo) for titolo in titoli_robustezza]
+        with st.spinner(f"Scaricamento dati per {len(simboli_robustezza)} titoli..."):
+            dati_universo = download_universe_data(simboli_robustezza, start_date, end_date)
+        if not dati_universo:
+            st.error("Impossibile scaricare i dati per i titoli selezionati.")
+        else:
+            barra_robustezza = st.progress(0)
+            best_params_robusti, risultati_robusti = run_optimization_multi_ticker(
+                dati_universo,
+                strategia_nome=selected_strategy_name,
+                parametri_ottimizzazione_config=optimization_config,
+                capitale_iniziale=capitale_iniziale,
+                commissione_percentuale=commissione_percentuale,
+                abilita_short=abilita_short,
+                investimento_fisso_per_trade=investimento_fisso_per_trade if investimento_fisso_per_trade > 0 else None,
+                stop_loss_percent=stop_loss_percent,
+                take_profit_percent=take_profit_percent,
+                trailing_stop_percent=trailing_stop_percent,
+                metrica_ottimizzazione="Rendimento della strategia (%)",
+                criterio_robustezza=CRITERI_ROBUSTEZZA_UI[criterio_robustezza_label],
+                # Le modalità adattive valgono per un solo titolo: qui si usa il campione (o la griglia) scelto
+                max_combinazioni=max_combinazioni if metodo_campionamento in METODI_CAMPIONAMENTO else None,
+                metodo_campionamento=metodo_campionamento if metodo_campionamento in METODI_CAMPIONAMENTO else 'griglia',
+                seme_campionamento=seme_campionamento,
+                use_parallel=usa_piu_processi,
+                progress_callback=lambda correnti, totale: barra_robustezza.progress(min(correnti / totale, 1.0))
+            )
+            st.session_state.risultati_multi_titolo = (best_params_robusti, risultati_robusti)
+
+    if st.session_state.get('risultati_multi_titolo'):
+        best_params_robusti, risultati_robusti = st.session_state.risultati_multi_titolo
+        if best_params_robusti:
+            st.success(f"Combinazione più robusta: {best_params_robusti}")
+        else:
+            st.warning("Nessuna combinazione valida su almeno un titolo.")
+        st.dataframe(risultati_robusti)
+
+# --- Analisi walk-forward ---
+with st.expander("Analisi walk-forward"):
+    st.write("Divide lo storico del titolo selezionato in finestre: per ogni finestra sceglie la combinazione "
+             "migliore sul tratto in-sample e la applica al tratto out-of-sample successivo. L'equity dei tratti "
+             "out-of-sample concatenati stima la performance su dati non usati per l'ottimizzazione.")
+    col_wf1, col_wf2, col_wf3 = st.columns(3)
+    with col_wf1:
+        n_finestre_wf = int(st.number_input("Numero di finestre:", min_value=1, max_value=50, value=5, step=1))
+    with col_wf2:
+        rapporto_in_sample_wf = st.number_input(
+            "Rapporto in-sample / out-of-sample:", min_value=0.5, max_value=20.0, value=3.0, step=0.5,
+            help="Lunghezza di un tratto in-sample rispetto a un tratto out-of-sample."
+        )
+    with col_wf3:
+        ancorata_wf = st.checkbox("Finestre ancorate", value=False,
+                                  help="I tratti in-sample partono tutti dall'inizio dello storico e si allungano.")
+        usa_piu_processi_wf = st.checkbox("Usa tutti i core", value=True, key="usa_piu_processi_wf",
+                                          help="Le combinazioni vengono distribuite tra più processi.")
+
+    if st.button("Avvia Walk-Forward", disabled=button_disabled):
+        with st.spinner(f"Scaricamento dati per {st.session_state.selected_ticker_symbol_opt}..."):
+            dati_wf = download_stock_data(st.session_state.selected_ticker_symbol_opt, start_date, end_date)
+        if dati_wf is None or dati_wf.empty:
+            st.error("Impossibile scaricare i dati per il ticker selezionato.")
+        else:
+            if isinstance(dati_wf.columns, pd.MultiIndex):
+                dati_wf.columns = dati_wf.columns.get_level_values(0)
+            barra_wf = st.progress(0)
+            st.session_state.risultati_walk_forward = run_walk_forward(
+                dati_wf,
+                strategia_nome=selected_strategy_name,
+                parametri_ottimizzazione_config=optimization_config,
+                capitale_iniziale=capitale_iniziale,
+                commissione_percentuale=commissione_percentuale,
+                abilita_short=abilita_short,
+                investimento_fisso_per_trade=investimento_fisso_per_trade if investimento_fisso_per_trade > 0 else None,
+                stop_loss_percent=stop_loss_percent,
+                take_profit_percent=take_profit_percent,
+                trailing_stop_percent=trailing_stop_percent,
+                metrica_ottimizzazione="Rendimento della strategia (%)",
+                n_finestre=n_finestre_wf,
+                rapporto_in_sample=rapporto_in_sample_wf,
+                ancorata=ancorata_wf,
+                # Le modalità adattive valgono per una sola ottimizzazione: qui si usa il campione (o la griglia) scelto
+                max_combinazioni=max_combinazioni if metodo_campionamento in METODI_CAMPIONAMENTO else None,
+                metodo_campionamento=metodo_campionamento if metodo_campionamento in METODI_CAMPIONAMENTO else 'griglia',
+                seme_campionamento=seme_campionamento,
+                use_parallel=usa_piu_processi_wf,
+                progress_callback=lambda correnti, totale: barra_wf.progress(min(correnti / totale, 1.0))
+            )
+
+    if st.session_state.get('risultati_walk_forward'):
+        finestre_wf, metriche_wf, equity_wf, buy_hold_wf, _ = st.session_state.risultati_walk_forward
+        if finestre_wf.empty:
+            st.warning("Walk-forward non eseguito: storico troppo corto o nessuna combinazione valida.")
+        else:
+            st.dataframe(finestre_wf)
+            st.dataframe(pd.DataFrame({
+                'Metrica': list(metriche_wf.keys()),
+                'Valore': [str(valore) for valore in metriche_wf.values()]
+            }), use_container_width=True)
+            st.plotly_chart(plot_equity_comparison(equity_wf, buy_hold_wf), use_container_width=True)
 
 # --- Visualizzazione dei Risultati dell'Ottimizzazione ---
 if st.session_state.optimization_done:
     st.header("Risultati dell'Ottimizzazione")
+
+    # Profilazione dell'ultima ottimizzazione (se richiesta)
+    if st.session_state.rapporto_strumentazione:
+        with st.expander("Profilazione dell'ottimizzazione"):
+            rapporto = st.session_state.rapporto_strumentazione
+            st.dataframe(pd.DataFrame.from_dict(rapporto['fasi'], orient='index'))
+            if rapporto['contatori']:
+                st.write(rapporto['contatori'])
     
     # Mostra i migliori parametri trovati
     if st.session_state.best_params:
@@ -448,13 +669,19 @@ if st.session_state.optimization_done:
         st.subheader("Metriche di Performance con i Migliori Parametri")
         if st.session_state.best_metrics:
             # Calcola metriche aggiuntive per l'ottimizzazione
-            total_commission_opt = sum(trade.get('Comm. (€)', 0) for trade in st.session_state.best_trades) if st.session_state.best_trades else 0
-            winning_trades_opt = len([t for t in st.session_state.best_trades if t.get('P/L (€)', 0) > 0]) if st.session_state.best_trades else 0
-            losing_trades_opt = len([t for t in st.session_state.best_trades if t.get('P/L (€)', 0) < 0]) if st.session_state.best_trades else 0
+            # I trade del miglior backtest sono round-trip colonnari (array strutturato)
+            if len(st.session_state.best_trades) > 0:
+                statistiche_opt = statistiche_trade(st.session_state.best_trades, commissione_percentuale)
+            else:
+                statistiche_opt = {'Commissioni Totali (€)': 0, 'Num. Vincenti': 0, 'Num. Perdenti': 0,
+                                   'Profitto Lordo (€)': 0, 'Perdita Lorda (€)': 0}
+            total_commission_opt = statistiche_opt['Commissioni Totali (€)']
+            winning_trades_opt = statistiche_opt['Num. Vincenti']
+            losing_trades_opt = statistiche_opt['Num. Perdenti']
             
             # Calcola Profit Factor
-            gross_profit_opt = sum(t.get('P/L (€)', 0) for t in st.session_state.best_trades if t.get('P/L (€)', 0) > 0) if st.session_state.best_trades else 0
-            gross_loss_opt = abs(sum(t.get('P/L (€)', 0) for t in st.session_state.best_trades if t.get('P/L (€)', 0) < 0)) if st.session_state.best_trades else 0
+            gross_profit_opt = statistiche_opt['Profitto Lordo (€)']
+            gross_loss_opt = statistiche_opt['Perdita Lorda (€)']
             profit_factor_opt = gross_profit_opt / gross_loss_opt if gross_loss_opt != 0 else float('inf')
             
             # Calcola Reward/Risk Ratio
@@ -534,9 +761,11 @@ if st.session_state.optimization_done:
             st.plotly_chart(fig, use_container_width=True)
         
         # Mostra i trade eseguiti
-        if st.session_state.best_trades:
+        if len(st.session_state.best_trades) > 0:
             st.subheader("Trade Eseguiti con i Migliori Parametri")
-            trades_df = pd.DataFrame(st.session_state.best_trades)
+            trades_df = pd.DataFrame(costruisci_trade_log(
+                st.session_state.best_trades, st.session_state.best_equity_curve, commissione_percentuale
+            ))
             st.dataframe(trades_df)
     
     # Mostra tutti i risultati dell'ottimizzazione
@@ -638,3 +867,48 @@ if st.session_state.optimization_done:
                 fig.update_layout(annotations=annotations)
             
             st.plotly_chart(fig, use_container_width=True)
+
+    # Fronte di Pareto: il compromesso tra più obiettivi invece di un solo vincitore
+    if st.session_state.all_optimization_results:
+        st.subheader("Fronte di Pareto (ottimizzazione multi-obiettivo)")
+        risultati_pareto_df = pd.DataFrame(st.session_state.all_optimization_results)
+        nomi_parametri = list(optimization_config.keys())
+        metriche_disponibili = [
+            col for col in risultati_pareto_df.columns
+            if col not in nomi_parametri and pd.api.types.is_numeric_dtype(risultati_pareto_df[col])
+        ]
+        obiettivi_selezionati = st.multiselect(
+            "Obiettivi:",
+            metriche_disponibili,
+            default=[nome for nome in OBIETTIVI_PREDEFINITI if nome in metriche_disponibili],
+            help="Le combinazioni sul fronte non sono superate da nessun'altra su tutti gli obiettivi insieme. "
+                 "I drawdown vengono minimizzati, le altre metriche massimizzate."
+        )
+        if len(obiettivi_selezionati) >= 2:
+            fronte_df = fronte_pareto(risultati_pareto_df, obiettivi_selezionati)
+            st.write(f"Combinazioni non dominate: {len(fronte_df)} su {len(risultati_pareto_df)}")
+
+            asse_x, asse_y = obiettivi_selezionati[1], obiettivi_selezionati[0]
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(
+                x=risultati_pareto_df[asse_x], y=risultati_pareto_df[asse_y], mode='markers',
+                name="Tutte le combinazioni", marker=dict(color='lightgray', size=5)
+            ))
+            fig.add_trace(go.Scatter(
+                x=fronte_df[asse_x], y=fronte_df[asse_y], mode='markers', name="Fronte di Pareto",
+                marker=dict(
+                    size=9,
+                    color=fronte_df[obiettivi_selezionati[2]] if len(obiettivi_selezionati) > 2 else 'crimson',
+                    colorscale='Viridis',
+                    showscale=len(obiettivi_selezionati) > 2,
+                    colorbar=dict(title=obiettivi_selezionati[2]) if len(obiettivi_selezionati) > 2 else None
+                ),
+                text=[", ".join(f"{nome}={riga[nome]}" for nome in nomi_parametri if nome in riga)
+                      for _, riga in fronte_df.iterrows()],
+                hovertemplate="%{text}<br>" + f"{asse_x}: " + "%{x}<br>" + f"{asse_y}: " + "%{y}<extra></extra>"
+            ))
+            fig.update_layout(title=f"Fronte di Pareto: {asse_y} vs {asse_x}", xaxis_title=asse_x, yaxis_title=asse_y)
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(fronte_df)
+        else:
+            st.info("Seleziona almeno due obiettivi per calcolare il fronte di Pareto.")
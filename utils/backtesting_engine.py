@@ -5,613 +5,1256 @@ import numpy as np
 from pandas import Timestamp
 from datetime import date
 import datetime # Importa il modulo datetime per Timedelta
+import itertools
 
-def run_backtest(
-    dati: pd.DataFrame, # DataFrame con dati OHLCV, Indicatori, e colonna 'Signal'
-    capitale_iniziale: float,
-    commissione_percentuale: float,
-    abilita_short: bool,
-    investimento_fisso_per_trade: float = None, # Nuovo parametro: importo fisso per ogni trade
-    stop_loss_percent: float = None, # None se non abilitato
-    take_profit_percent: float = None, # None se non abilitato
-    trailing_stop_percent: float = None, # None se non abilitato
-    # Puoi aggiungere altri parametri qui se necessario in futuro (es. slippage)
-) -> tuple[list, pd.Series, pd.Series, dict]:
+from utils.metriche_backtest import calcola_metriche
+from utils import strumentazione
+
+# Codici del motivo di uscita di un round-trip (colonna 'motivo_uscita' di DTYPE_TRADE)
+MOTIVO_APERTA = -1          # Posizione ancora aperta a fine backtest (nessuna uscita)
+MOTIVO_SEGNALE = 0          # Segnale opposto
+MOTIVO_STOP_LOSS = 1
+MOTIVO_TAKE_PROFIT = 2
+MOTIVO_TRAILING_STOP = 3
+MOTIVO_CHIUSURA_FINALE = 4  # Chiusura forzata all'ultima barra
+
+# Trade log colonnare: un record per round-trip (ingresso + uscita).
+# Le barre sono posizioni nell'indice dei dati; 'direzione' vale 1 (LONG) o -1 (SHORT).
+# Per una posizione ancora aperta 'barra_uscita' vale -1 e 'prezzo_uscita'/'pl' sono NaN.
+DTYPE_TRADE = np.dtype([
+    ('barra_ingresso', np.int64),
+    ('barra_uscita', np.int64),
+    ('direzione', np.int8),
+    ('quantita', np.int64),
+    ('prezzo_ingresso', np.float64),
+    ('prezzo_uscita', np.float64),
+    ('motivo_uscita', np.int8),
+    ('pl', np.float64),
+])
+
+
+def _crea_array_trade(round_trip: list) -> np.ndarray:
     """
-    Esegue il backtest di una strategia di trading sui dati forniti.
+    Converte la lista di tuple (nell'ordine dei campi di DTYPE_TRADE) in un array strutturato.
+    """
+    return np.array(round_trip, dtype=DTYPE_TRADE)
+
+
+def _estrai_array_backtest(dati: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Estrae le colonne Open/High/Low/Close/Signal in array NumPy contigui (float64).
 
     Args:
-        dati (pd.DataFrame): DataFrame con dati storici (OHLCV) e colonna 'Signal' generata dalla strategia.
-        capitale_iniziale (float): Capitale iniziale per il backtest.
-        commissione_percentuale (float): Percentuale di commissione per operazione (ingresso e uscita).
-        abilita_short (bool): Se true, le posizioni Short sono permesse.
-        investimento_fisso_per_trade (float, optional): Importo fisso da investire per ogni trade.
-                                                        Se None o 0, usa una percentuale di capitale.
-        stop_loss_percent (float, optional): Percentuale di stop loss dal prezzo di ingresso.
-                                             Es. 1.0 per 1%. None se non abilitato.
-        take_profit_percent (float, optional): Percentuale di take profit dal prezzo di ingresso.
-                                               Es. 2.0 per 2%. None se non abilitato.
-        trailing_stop_percent (float, optional): Percentuale di trailing stop. Es. 0.5 per 0.5%. None se non abilitato.
+        dati (pd.DataFrame): DataFrame con colonne 'Open', 'High', 'Low', 'Close' e 'Signal'.
 
     Returns:
-        tuple[list, pd.Series, pd.Series, dict]: Una tupla contenente:
-            - trade_log (list): Lista di dizionari che rappresentano ogni trade eseguito.
-            - equity_curve (pd.Series): Serie temporale del capitale totale (equity) nel tempo.
-            - buy_hold_equity_series (pd.Series): Serie temporale del capitale se avessi fatto Buy & Hold.
-            - metriche_risultati (dict): Dizionario delle metriche di performance del backtest.
+        tuple: (apertura, massimo, minimo, chiusura, segnali) come array NumPy.
     """
-    capital_available = capitale_iniziale
-    in_position = False
-    shares_held = 0
-    entry_price = 0
-    trade_log = []
-    equity_curve_values = []
-    daily_returns = pd.Series(dtype=float) # Per calcolare lo Sharpe Ratio
+    with strumentazione.fase(strumentazione.FASE_PREPARAZIONE_DATI):
+        return tuple(
+            np.ascontiguousarray(dati[col].to_numpy(dtype=float))
+            for col in ('Open', 'High', 'Low', 'Close', 'Signal')
+        )
 
-    # Inizializzazione per Stop Loss / Take Profit / Trailing Stop
-    stop_loss_price = None
-    take_profit_price = None
-    trailing_stop_highest_price = None # Per posizioni LONG
-    trailing_stop_lowest_price = None # Per posizioni SHORT
 
-    # Verifica che la colonna 'Signal' esista
-    if 'Signal' not in dati.columns:
-        raise ValueError("Il DataFrame dati deve contenere una colonna 'Signal'.")
+class StatoBacktest:
+    """
+    Stato di un backtest barra per barra che può essere esteso con nuove barre senza ripartire dall'inizio.
 
-    # Assicurati che l'indice sia un DatetimeIndex per lavorare correttamente con le date
-    if not isinstance(dati.index, pd.DatetimeIndex):
-        dati.index = pd.to_datetime(dati.index)
+    Contiene capitale disponibile, posizione aperta, prezzo di ingresso, livelli di Take Profit e
+    Trailing Stop, il buffer dell'equity e i round-trip chiusi. Ogni chiamata ad aggiungi_barre
+    processa solo le barre nuove (costo proporzionale alle barre aggiunte), con la stessa logica
+    di run_backtest: alimentare lo stato un blocco alla volta dà lo stesso risultato di un unico backtest.
 
-    # Inizializza l'equity curve con il capitale iniziale
-    equity_curve_values.append(capitale_iniziale)
-    
-    previous_day_capital = capitale_iniziale # Per calcolo dei rendimenti giornalieri
-
-    for i, (index, row) in enumerate(dati.iterrows()):
-        current_close = row['Close']
-        current_open = row['Open']
-        current_high = row['High']
-        current_low = row['Low']
-        current_signal = row['Signal']
-        
-        # Calcola il capitale corrente (equity) prima di processare i segnali del giorno
-        # Equity = capitale disponibile + valore delle azioni detenute (che può essere negativo per short)
-        if shares_held > 0:  # Posizione LONG
-            current_equity = capital_available + (shares_held * current_close)
-        elif shares_held < 0:  # Posizione SHORT
-            # Per posizioni SHORT, il profitto è la differenza tra prezzo di entrata e prezzo corrente
-            unrealized_pnl = abs(shares_held) * (entry_price - current_close)
-            # Per le posizioni short, il capitale disponibile include il capitale bloccato come garanzia
-            current_equity = capital_available + unrealized_pnl
-        else:  # Nessuna posizione
-            current_equity = capital_available
-        equity_curve_values.append(current_equity)
-
-        # Calcolo del rendimento giornaliero per lo Sharpe Ratio
-        if previous_day_capital != 0:
-            daily_return = (current_equity - previous_day_capital) / previous_day_capital
-            daily_returns = pd.concat([daily_returns, pd.Series([daily_return], index=[index])])
-        previous_day_capital = current_equity
-
-
-        # Gestione dei segnali di trading
-        if not in_position:  # Se non siamo in posizione
-            if current_signal == 1:  # Segnale BUY
-                # Calcola il numero di azioni da acquistare
-                if investimento_fisso_per_trade is not None and investimento_fisso_per_trade > 0:
-                    shares_to_buy = int(investimento_fisso_per_trade / current_close)
-                else:
-                    shares_to_buy = int(capital_available * 0.95 / current_close)  # Usa il 95% del capitale disponibile
+    La chiusura finale della posizione LONG aperta viene applicata solo ai risultati restituiti
+    (round_trip / risultati), non allo stato, che resta pronto per le barre successive.
 
-                if shares_to_buy > 0: 
-                    cost = shares_to_buy * current_close * (1 + commissione_percentuale / 100)
-                    commission = (shares_to_buy * current_close * commissione_percentuale) / 100
-                    
-                    if cost <= capital_available:
-                        capital_available -= cost
-                        shares_held = shares_to_buy
-                        entry_price = current_close
-                        in_position = True
-                        
-                        # Imposta Stop Loss / Take Profit / Trailing Stop per LONG
-                        stop_loss_price = entry_price * (1 - stop_loss_percent / 100) if stop_loss_percent is not None else None
-                        take_profit_price = entry_price * (1 + take_profit_percent / 100) if take_profit_percent is not None else None
-                        trailing_stop_highest_price = current_high if trailing_stop_percent is not None else None
-                        
-                        trade_log.append({
-                            'Data': index.date(),
-                            'Tipo': 'BUY',
-                            'Prezzo': current_close,
-                            'Quantità': shares_to_buy,
-                            'Costo': cost,
-                            'Comm. (€)': commission,
-                            'Equity (€)': current_equity
-                        })
-
-            elif current_signal == -1 and abilita_short:  # Segnale SELL (SHORT)
-                # Calcola il numero di azioni da vendere allo scoperto
-                if investimento_fisso_per_trade is not None and investimento_fisso_per_trade > 0:
-                    shares_to_short = int(investimento_fisso_per_trade / current_close)
-                else:
-                    shares_to_short = int(capital_available * 0.95 / current_close)  # Usa il 95% del capitale disponibile
+    Esempio:
+        stato = StatoBacktest(capitale_iniziale=10000, commissione_percentuale=0.2, abilita_short=False)
+        stato.aggiungi_barre(dati_con_segnali)          # storico iniziale
+        stato.aggiungi_barre(dati_aggiornati)           # vengono processate solo le date successive all'ultima
+        trade, equity_curve, buy_hold, metriche = stato.risultati()
+    """
 
-                if shares_to_short > 0:
-                    # Per posizioni short, blocchiamo il 100% del valore come garanzia
-                    cost = shares_to_short * current_close * (1 + commissione_percentuale / 100)
-                    commission = (shares_to_short * current_close * commissione_percentuale) / 100
-                    
-                    if cost <= capital_available:
-                        # Non sottraiamo il costo dal capitale disponibile per le posizioni short
-                        # Il capitale rimane bloccato ma non viene sottratto
-                        shares_held = -shares_to_short  # Negativo per indicare posizione SHORT
-                        entry_price = current_close
-                        in_position = True
+    def __init__(
+        self,
+        capitale_iniziale: float,
+        commissione_percentuale: float,
+        abilita_short: bool,
+        investimento_fisso_per_trade: float = None,
+        stop_loss_percent: float = None,
+        take_profit_percent: float = None,
+        trailing_stop_percent: float = None,
+    ):
+        """
+        Args:
+            Gli argomenti hanno lo stesso significato di run_backtest.
+        """
+        self.capitale_iniziale = capitale_iniziale
+        self.commissione_percentuale = commissione_percentuale
+        self.abilita_short = abilita_short
+        self.investimento_fisso_per_trade = investimento_fisso_per_trade
+        self.stop_loss_percent = stop_loss_percent
+        self.take_profit_percent = take_profit_percent
+        self.trailing_stop_percent = trailing_stop_percent
+
+        # Stato della posizione
+        self.capital_available = capitale_iniziale
+        self.in_position = False
+        self.shares_held = 0
+        self.entry_price = 0
+        self.entry_bar = -1
+        self.take_profit_price = None
+        self.trailing_stop_highest_price = None # Per posizioni LONG
+        self.trailing_stop_lowest_price = None # Per posizioni SHORT
+        self.round_trip_chiusi = [] # Tuple nell'ordine dei campi di DTYPE_TRADE
+
+        # Buffer delle barre processate (capacità che raddoppia quando serve)
+        self.n_barre = 0
+        self._equity = np.empty(0, dtype=float)
+        self._chiusura = np.empty(0, dtype=float)
+        self._blocchi_date = []
+        self._date_index = None
+        self.ultima_data = None
+
+    def _riserva(self, n_nuove: int):
+        """
+        Garantisce spazio nei buffer per n_nuove barre (crescita geometrica, costo ammortizzato costante).
+        """
+        necessarie = self.n_barre + n_nuove
+        if necessarie <= len(self._equity):
+            return
+        capacita = max(necessarie, 2 * len(self._equity))
+        for nome in ('_equity', '_chiusura'):
+            nuovo = np.empty(capacita, dtype=float)
+            nuovo[:self.n_barre] = getattr(self, nome)[:self.n_barre]
+            setattr(self, nome, nuovo)
+
+    def aggiungi_barre(self, dati: pd.DataFrame) -> int:
+        """
+        Processa le barre di dati successive all'ultima data già vista.
+
+        Si può passare direttamente il DataFrame aggiornato (es. dopo un nuovo download_stock_data):
+        le date già processate vengono saltate.
+
+        Args:
+            dati (pd.DataFrame): DataFrame ordinato per data con colonne 'Open', 'High', 'Low', 'Close' e 'Signal'.
+
+        Returns:
+            int: Numero di barre nuove processate.
+        """
+        if 'Signal' not in dati.columns:
+            raise ValueError("Il DataFrame dati deve contenere una colonna 'Signal'.")
+        date_index = dati.index if isinstance(dati.index, pd.DatetimeIndex) else pd.to_datetime(dati.index)
+        if self.ultima_data is not None:
+            inizio = date_index.searchsorted(self.ultima_data, side='right')
+            dati = dati.iloc[inizio:]
+            date_index = date_index[inizio:]
+        if len(dati) == 0:
+            return 0
+        return self.aggiungi_array(*_estrai_array_backtest(dati), date_index)
+
+    def aggiungi_array(
+        self,
+        apertura: np.ndarray,
+        massimo: np.ndarray,
+        minimo: np.ndarray,
+        chiusura: np.ndarray,
+        segnali: np.ndarray,
+        date_index: pd.DatetimeIndex = None,
+    ) -> int:
+        """
+        Processa nuove barre già estratte in array NumPy (vedi _estrai_array_backtest).
+
+        Args:
+            apertura, massimo, minimo, chiusura, segnali (np.ndarray): Array della stessa lunghezza.
+            date_index (pd.DatetimeIndex, optional): Date delle nuove barre (servono solo per i risultati).
+
+        Returns:
+            int: Numero di barre processate.
+        """
+        n_nuove = len(chiusura)
+        self._riserva(n_nuove)
+        inizio = self.n_barre
+        equity_values = self._equity
+        self._chiusura[inizio:inizio + n_nuove] = chiusura
+
+        comm = self.commissione_percentuale / 100
+        abilita_short = self.abilita_short
+        investimento_fisso_per_trade = self.investimento_fisso_per_trade
+        usa_importo_fisso = investimento_fisso_per_trade is not None and investimento_fisso_per_trade > 0
+        stop_loss_percent = self.stop_loss_percent
+        take_profit_percent = self.take_profit_percent
+        trailing_stop_percent = self.trailing_stop_percent
+
+        # Lo stato viene copiato in variabili locali per il ciclo e salvato alla fine
+        capital_available = self.capital_available
+        in_position = self.in_position
+        shares_held = self.shares_held
+        entry_price = self.entry_price
+        entry_bar = self.entry_bar
+        take_profit_price = self.take_profit_price
+        trailing_stop_highest_price = self.trailing_stop_highest_price
+        trailing_stop_lowest_price = self.trailing_stop_lowest_price
+        round_trip = self.round_trip_chiusi
+
+        # Le liste Python sono molto più veloci da scorrere degli scalari NumPy indicizzati uno a uno
+        lista_apertura = apertura.tolist()
+        lista_massimo = massimo.tolist()
+        lista_minimo = minimo.tolist()
+        lista_chiusura = chiusura.tolist()
+        lista_segnali = segnali.tolist()
+
+        for k in range(n_nuove):
+            i = inizio + k
+            current_close = lista_chiusura[k]
+            current_open = lista_apertura[k]
+            current_high = lista_massimo[k]
+            current_low = lista_minimo[k]
+            current_signal = lista_segnali[k]
+
+            # Equity = capitale disponibile + valore delle azioni detenute (o P/L non realizzato per lo short)
+            if shares_held > 0:  # Posizione LONG
+                current_equity = capital_available + (shares_held * current_close)
+            elif shares_held < 0:  # Posizione SHORT
+                current_equity = capital_available + abs(shares_held) * (entry_price - current_close)
+            else:  # Nessuna posizione
+                current_equity = capital_available
+            equity_values[i] = current_equity
+
+            if not in_position:  # Se non siamo in posizione
+                if current_signal == 1:  # Segnale BUY
+                    if usa_importo_fisso:
+                        shares_to_buy = int(investimento_fisso_per_trade / current_close)
+                    else:
+                        shares_to_buy = int(capital_available * 0.95 / current_close)  # Usa il 95% del capitale disponibile
+
+                    if shares_to_buy > 0:
+                        cost = shares_to_buy * current_close * (1 + comm)
+                        if cost <= capital_available:
+                            capital_available -= cost
+                            shares_held = shares_to_buy
+                            entry_price = current_close
+                            entry_bar = i
+                            in_position = True
+                            take_profit_price = entry_price * (1 + take_profit_percent / 100) if take_profit_percent is not None else None
+                            trailing_stop_highest_price = current_high if trailing_stop_percent is not None else None
+
+                elif current_signal == -1 and abilita_short:  # Segnale SELL (SHORT)
+                    if usa_importo_fisso:
+                        shares_to_short = int(investimento_fisso_per_trade / current_close)
+                    else:
+                        shares_to_short = int(capital_available * 0.95 / current_close)  # Usa il 95% del capitale disponibile
 
-                        # Imposta Stop Loss / Take Profit / Trailing Stop per SHORT
-                        stop_loss_price = entry_price * (1 + stop_loss_percent / 100) if stop_loss_percent is not None else None
-                        take_profit_price = entry_price * (1 - take_profit_percent / 100) if take_profit_percent is not None else None
-                        trailing_stop_lowest_price = current_low if trailing_stop_percent is not None else None
-                        
-                        trade_log.append({
-                            'Data': index.date(),
-                            'Tipo': 'SELL SHORT',
-                            'Prezzo': current_close,
-                            'Quantità': shares_to_short,
-                            'Costo': cost,
-                            'Comm. (€)': commission,
-                            'Equity (€)': current_equity
-                        })
-
-        elif in_position:  # Se siamo in posizione
-            # Verifica Stop Loss, Take Profit e Trailing Stop
+                    if shares_to_short > 0:
+                        # Per posizioni short, blocchiamo il 100% del valore come garanzia (senza sottrarlo)
+                        cost = shares_to_short * current_close * (1 + comm)
+                        if cost <= capital_available:
+                            shares_held = -shares_to_short  # Negativo per indicare posizione SHORT
+                            entry_price = current_close
+                            entry_bar = i
+                            in_position = True
+                            take_profit_price = entry_price * (1 - take_profit_percent / 100) if take_profit_percent is not None else None
+                            trailing_stop_lowest_price = current_low if trailing_stop_percent is not None else None
+                continue
+
+            # --- Siamo in posizione: verifica Stop Loss, Take Profit e Trailing Stop ---
             exit_reason = None
-            
+            exit_price = None
+
             if shares_held > 0:  # Posizione LONG
-                # Mantieni separati i livelli di stop loss fisso e trailing stop
-                fixed_stop_loss = None
                 trailing_stop = None
-                
-                # Imposta lo stop loss fisso se attivo
-                if stop_loss_percent is not None:
-                    fixed_stop_loss = entry_price * (1 - stop_loss_percent / 100)
-                
-                # Aggiorna il trailing stop se attivo
+                fixed_stop_loss = entry_price * (1 - stop_loss_percent / 100) if stop_loss_percent is not None else None
                 if trailing_stop_percent is not None and trailing_stop_highest_price is not None:
-                    # Aggiorna il prezzo più alto raggiunto
                     if current_high > trailing_stop_highest_price:
                         trailing_stop_highest_price = current_high
-                    # Calcola sempre il livello di trailing stop basato sul massimo corrente
                     trailing_stop = trailing_stop_highest_price * (1 - trailing_stop_percent / 100)
-                
+
                 # Verifica le condizioni di uscita con logica intraday
                 if trailing_stop is not None and current_low <= trailing_stop:
-                    # Logica intraday: se close > open, massimo raggiunto dopo minimo
                     if current_close <= current_open:  # Massimo PRIMA del minimo
-                        exit_reason = f"SELL (Trailing Stop a {trailing_stop:.2f})"
+                        exit_reason = MOTIVO_TRAILING_STOP
                         exit_price = trailing_stop
                 elif fixed_stop_loss is not None and current_low <= fixed_stop_loss:
-                    exit_reason = f"SELL (Stop Loss a {fixed_stop_loss:.2f})"
+                    exit_reason = MOTIVO_STOP_LOSS
                     exit_price = fixed_stop_loss
                 elif take_profit_price is not None and current_high >= take_profit_price:
-                    exit_reason = f"SELL (Take Profit a {take_profit_price:.2f})"
+                    exit_reason = MOTIVO_TAKE_PROFIT
                     exit_price = take_profit_price
-            
-            elif shares_held < 0:  # Posizione SHORT
-                # Mantieni separati i livelli di stop loss fisso e trailing stop
-                fixed_stop_loss = None
+
+            else:  # Posizione SHORT
                 trailing_stop = None
-                
-                # Imposta lo stop loss fisso se attivo
-                if stop_loss_percent is not None:
-                    fixed_stop_loss = entry_price * (1 + stop_loss_percent / 100)
-                
-                # Aggiorna il trailing stop se attivo
+                fixed_stop_loss = entry_price * (1 + stop_loss_percent / 100) if stop_loss_percent is not None else None
                 if trailing_stop_percent is not None and trailing_stop_lowest_price is not None:
-                    # Aggiorna il prezzo più basso raggiunto
                     if current_low < trailing_stop_lowest_price:
                         trailing_stop_lowest_price = current_low
-                    # Calcola sempre il livello di trailing stop basato sul minimo corrente
                     trailing_stop = trailing_stop_lowest_price * (1 + trailing_stop_percent / 100)
-                
+
                 # Verifica le condizioni di uscita con logica intraday
                 if trailing_stop is not None and current_high >= trailing_stop:
-                    # Logica intraday: se close < open, minimo raggiunto dopo massimo
                     if current_close >= current_open:  # Minimo PRIMA del massimo
-                        exit_reason = f"COVER (Trailing Stop a {trailing_stop:.2f})"
+                        exit_reason = MOTIVO_TRAILING_STOP
                         exit_price = trailing_stop
                 elif fixed_stop_loss is not None and current_high >= fixed_stop_loss:
-                    exit_reason = f"COVER (Stop Loss a {fixed_stop_loss:.2f})"
+                    exit_reason = MOTIVO_STOP_LOSS
                     exit_price = fixed_stop_loss
                 elif take_profit_price is not None and current_low <= take_profit_price:
-                    exit_reason = f"COVER (Take Profit a {take_profit_price:.2f})"
+                    exit_reason = MOTIVO_TAKE_PROFIT
                     exit_price = take_profit_price
-            
-            # Esegui l'uscita se è stato attivato uno stop
-            if exit_reason:
-                if shares_held > 0:  # Chiudi posizione LONG
-                    actual_exit_price = exit_price if 'exit_price' in locals() else current_close
-                    revenue = shares_held * actual_exit_price * (1 - commissione_percentuale / 100)
-                    commission = (shares_held * actual_exit_price * commissione_percentuale) / 100
-                    cost_original = shares_held * entry_price * (1 + commissione_percentuale / 100)
-                    profit_loss = revenue - cost_original
-                    capital_available += revenue
-                    
-                    trade_log.append({
-                        'Data': index.date(),
-                        'Tipo': exit_reason,
-                        'Prezzo': actual_exit_price,
-                        'Quantità': shares_held,
-                        'Ricavo': revenue,
-                        'Comm. (€)': commission,
-                        'P/L (€)': profit_loss,
-                        'Equity (€)': current_equity
-                    })
-                else:  # Chiudi posizione SHORT
-                    actual_exit_price = exit_price if 'exit_price' in locals() else current_close
-                    cost_to_close = abs(shares_held) * actual_exit_price * (1 + commissione_percentuale / 100)
-                    commission = (abs(shares_held) * actual_exit_price * commissione_percentuale) / 100
-                    profit_loss = (abs(shares_held) * entry_price) - (abs(shares_held) * actual_exit_price)
-                    
-                    trade_log.append({
-                        'Data': index.date(),
-                        'Tipo': exit_reason,
-                        'Prezzo': actual_exit_price,
-                        'Quantità': abs(shares_held),
-                        'Costo Chiusura Short': cost_to_close,
-                        'Comm. (€)': commission,
-                        'P/L (€)': profit_loss,
-                        'Equity (€)': current_equity
-                    })
-                
-                # Reset delle variabili di posizione
-                shares_held = 0
-                entry_price = 0
-                in_position = False
-                stop_loss_price = None
-                take_profit_price = None
-                trailing_stop_highest_price = None
-                trailing_stop_lowest_price = None
-            
-            # Verifica segnali di inversione solo se non è già stata chiusa la posizione per stop/target
-            elif (shares_held > 0 and current_signal == -1) or (shares_held < 0 and current_signal == 1):
-                # Chiudi la posizione esistente
-                if shares_held > 0:  # Chiudi posizione LONG
-                    revenue = shares_held * current_close * (1 - commissione_percentuale / 100)
-                    commission = (shares_held * current_close * commissione_percentuale) / 100
-                    cost_original = shares_held * entry_price * (1 + commissione_percentuale / 100)
-                    profit_loss = revenue - cost_original
-                    capital_available += revenue
-                    
-                    trade_log.append({
-                        'Data': index.date(),
-                        'Tipo': 'SELL',
-                        'Prezzo': current_close,
-                        'Quantità': shares_held,
-                        'Ricavo': revenue,
-                        'Comm. (€)': commission,
-                        'P/L (€)': profit_loss,
-                        'Equity (€)': current_equity
-                    })
-                else:  # Chiudi posizione SHORT
-                    cost_to_close = abs(shares_held) * current_close * (1 + commissione_percentuale / 100)
-                    commission = (abs(shares_held) * current_close * commissione_percentuale) / 100
-                    profit_loss = (abs(shares_held) * entry_price) - (abs(shares_held) * current_close)
-                    
-                    trade_log.append({
-                        'Data': index.date(),
-                        'Tipo': 'COVER',
-                        'Prezzo': current_close,
-                        'Quantità': abs(shares_held),
-                        'Costo Chiusura Short': cost_to_close,
-                        'Comm. (€)': commission,
-                        'P/L (€)': profit_loss,
-                        'Equity (€)': current_equity
-                    })
-                
-                # Reset delle variabili di posizione
-                shares_held = 0
-                entry_price = 0
-                in_position = False  # IMPORTANTE: Imposta in_position a False dopo la chiusura
-                stop_loss_price = None
-                take_profit_price = None
-                trailing_stop_highest_price = None
-                trailing_stop_lowest_price = None
-
-                # Se c'è un segnale di inversione, apri subito la nuova posizione
-                if current_signal == -1 and abilita_short:  # Apri posizione SHORT
-                    shares_to_short = int(capital_available * 0.95 / current_close)
-                    if shares_to_short > 0:
-                        cost = shares_to_short * current_close * (1 + commissione_percentuale / 100)
-                        commission = (shares_to_short * current_close * commissione_percentuale) / 100
-                        
-                        if cost <= capital_available:
-                            shares_held = -shares_to_short
-                            entry_price = current_close
-                            in_position = True
 
-                            if stop_loss_percent is not None:
-                                stop_loss_price = entry_price * (1 + stop_loss_percent / 100)
-                            if take_profit_percent is not None:
-                                take_profit_price = entry_price * (1 - take_profit_percent / 100)
-                            if trailing_stop_percent is not None:
-                                trailing_stop_lowest_price = current_low
-                            
-                            trade_log.append({
-                                'Data': index.date(),
-                                'Tipo': 'SELL SHORT',
-                                'Prezzo': current_close,
-                                'Quantità': shares_to_short,
-                                'Costo': cost,
-                                'Comm. (€)': commission,
-                                'Equity (€)': current_equity
-                            })
-                elif current_signal == 1:  # Apri posizione LONG
-                    shares_to_buy = int(capital_available * 0.95 / current_close)
-                    if shares_to_buy > 0:
-                        cost = shares_to_buy * current_close * (1 + commissione_percentuale / 100)
-                        commission = (shares_to_buy * current_close * commissione_percentuale) / 100
-                        
-                        if cost <= capital_available:
-                            capital_available -= cost
-                            shares_held = shares_to_buy
-                            entry_price = current_close
-                            in_position = True
+            inversione = (shares_held > 0 and current_signal == -1) or (shares_held < 0 and current_signal == 1)
+            if exit_reason is None and not inversione:
+                continue
+
+            # Uscita per stop/target al livello di trigger, oppure per segnale opposto alla chiusura
+            if exit_reason is None:
+                exit_price = current_close
+            if shares_held > 0:  # Chiudi posizione LONG
+                revenue = shares_held * exit_price * (1 - comm)
+                profit_loss = revenue - shares_held * entry_price * (1 + comm)
+                capital_available += revenue
+                round_trip.append((entry_bar, i, 1, shares_held, entry_price, exit_price,
+                                   exit_reason if exit_reason is not None else MOTIVO_SEGNALE, profit_loss))
+            else:  # Chiudi posizione SHORT
+                quantita_short = abs(shares_held)
+                profit_loss = (quantita_short * entry_price) - (quantita_short * exit_price)
+                round_trip.append((entry_bar, i, -1, quantita_short, entry_price, exit_price,
+                                   exit_reason if exit_reason is not None else MOTIVO_SEGNALE, profit_loss))
+
+            # Reset delle variabili di posizione
+            shares_held = 0
+            entry_price = 0
+            entry_bar = -1
+            in_position = False
+            take_profit_price = None
+            trailing_stop_highest_price = None
+            trailing_stop_lowest_price = None
+
+            if exit_reason is not None:
+                continue
+
+            # Segnale di inversione: apri subito la nuova posizione con il 95% del capitale disponibile
+            if current_signal == -1 and abilita_short:  # Apri posizione SHORT
+                shares_to_short = int(capital_available * 0.95 / current_close)
+                if shares_to_short > 0:
+                    cost = shares_to_short * current_close * (1 + comm)
+                    if cost <= capital_available:
+                        shares_held = -shares_to_short
+                        entry_price = current_close
+                        entry_bar = i
+                        in_position = True
+                        if take_profit_percent is not None:
+                            take_profit_price = entry_price * (1 - take_profit_percent / 100)
+                        if trailing_stop_percent is not None:
+                            trailing_stop_lowest_price = current_low
+            elif current_signal == 1:  # Apri posizione LONG
+                shares_to_buy = int(capital_available * 0.95 / current_close)
+                if shares_to_buy > 0:
+                    cost = shares_to_buy * current_close * (1 + comm)
+                    if cost <= capital_available:
+                        capital_available -= cost
+                        shares_held = shares_to_buy
+                        entry_price = current_close
+                        entry_bar = i
+                        in_position = True
+                        if take_profit_percent is not None:
+                            take_profit_price = entry_price * (1 + take_profit_percent / 100)
+                        if trailing_stop_percent is not None:
+                            trailing_stop_highest_price = current_high
+
+        # Salva lo stato per le chiamate successive
+        self.capital_available = capital_available
+        self.in_position = in_position
+        self.shares_held = shares_held
+        self.entry_price = entry_price
+        self.entry_bar = entry_bar
+        self.take_profit_price = take_profit_price
+        self.trailing_stop_highest_price = trailing_stop_highest_price
+        self.trailing_stop_lowest_price = trailing_stop_lowest_price
+        self.n_barre = inizio + n_nuove
+
+        if date_index is not None and n_nuove > 0:
+            self._blocchi_date.append(date_index)
+            self._date_index = None
+            self.ultima_data = date_index[-1]
+        return n_nuove
+
+    @property
+    def equity_values(self) -> np.ndarray:
+        """
+        Equity per ogni barra processata (valutata prima di processare i segnali della barra).
+        """
+        return self._equity[:self.n_barre]
+
+    @property
+    def date_index(self) -> pd.DatetimeIndex:
+        """
+        Date di tutte le barre processate (ricostruite solo quando richieste).
+        """
+        if self._date_index is None:
+            if not self._blocchi_date:
+                return pd.DatetimeIndex([])
+            if len(self._blocchi_date) > 1:
+                # Unisce i blocchi una sola volta e tiene il risultato come unico blocco
+                self._blocchi_date = [self._blocchi_date[0].append(self._blocchi_date[1:])]
+            self._date_index = self._blocchi_date[0]
+        return self._date_index
+
+    def round_trip(self) -> np.ndarray:
+        """
+        Round-trip del backtest fino all'ultima barra (array strutturato DTYPE_TRADE).
+
+        Come in run_backtest, una posizione LONG ancora aperta viene chiusa alla chiusura
+        dell'ultima barra, mentre una posizione SHORT resta aperta (MOTIVO_APERTA). Lo stato non
+        viene modificato.
+        """
+        round_trip = list(self.round_trip_chiusi)
+        if self.in_position and self.shares_held > 0 and self.n_barre > 0:
+            comm = self.commissione_percentuale / 100
+            final_price = float(self._chiusura[self.n_barre - 1])
+            revenue_final = self.shares_held * final_price * (1 - comm)
+            round_trip.append((self.entry_bar, self.n_barre - 1, 1, self.shares_held, self.entry_price, final_price,
+                               MOTIVO_CHIUSURA_FINALE, revenue_final - self.shares_held * self.entry_price * (1 + comm)))
+        elif self.in_position:
+            round_trip.append((self.entry_bar, -1, -1, abs(self.shares_held), self.entry_price, np.nan, MOTIVO_APERTA, np.nan))
+        return _crea_array_trade(round_trip)
+
+    def risultati(self, metriche_richieste: list = None) -> tuple[np.ndarray, pd.Series, pd.Series, dict]:
+        """
+        Risultati del backtest fino all'ultima barra processata, nello stesso formato di run_backtest.
+
+        Args:
+            metriche_richieste (list, optional): Metriche da calcolare (None = tutte).
+
+        Returns:
+            tuple[np.ndarray, pd.Series, pd.Series, dict]: round-trip, equity curve, equity Buy & Hold e metriche.
+        """
+        if self.n_barre == 0:
+            raise ValueError("Nessuna barra processata: chiamare prima aggiungi_barre.")
+        date_index = self.date_index
+        equity_values = self.equity_values.copy()
+        trade = self.round_trip()
+        equity_curve = pd.Series(equity_values, index=date_index)
+        buy_hold_equity_series = pd.Series(_equity_buy_hold(self._chiusura[:self.n_barre], self.capitale_iniziale), index=date_index)
+        metriche_risultati = calcola_metriche(trade, equity_values, date_index, self.capitale_iniziale, metriche_richieste)
+        return trade, equity_curve, buy_hold_equity_series, metriche_risultati
+
+
+def _simula_backtest(
+    apertura: np.ndarray,
+    massimo: np.ndarray,
+    minimo: np.ndarray,
+    chiusura: np.ndarray,
+    segnali: np.ndarray,
+    date_index: pd.DatetimeIndex,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    investimento_fisso_per_trade: float = None,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Nucleo del backtest: simula la strategia barra per barra lavorando solo su array NumPy.
+
+    Replica esattamente la logica storica di run_backtest (segnali, Stop Loss, Take Profit,
+    Trailing Stop con logica intraday, chiusura finale), ma senza DataFrame.iterrows() e
+    con un buffer preallocato per l'equity. È un backtest incrementale (StatoBacktest) alimentato
+    con tutte le barre in un'unica chiamata.
+
+    Args:
+        apertura, massimo, minimo, chiusura, segnali (np.ndarray): Array della stessa lunghezza.
+        date_index (pd.DatetimeIndex): Indice temporale dei dati.
+        Gli altri argomenti hanno lo stesso significato di run_backtest.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: round-trip (array strutturato DTYPE_TRADE) e array
+        dell'equity per ogni barra (valutata prima di processare i segnali della barra).
+    """
+    stato = StatoBacktest(
+        capitale_iniziale=capitale_iniziale,
+        commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short,
+        investimento_fisso_per_trade=investimento_fisso_per_trade,
+        stop_loss_percent=stop_loss_percent,
+        take_profit_percent=take_profit_percent,
+        trailing_stop_percent=trailing_stop_percent,
+    )
+    stato.aggiungi_array(apertura, massimo, minimo, chiusura, segnali, date_index)
+    return stato.round_trip(), stato.equity_values
+
+
+def _simula_backtest_vettoriale(
+    chiusura: np.ndarray,
+    segnali: np.ndarray,
+    date_index: pd.DatetimeIndex,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    investimento_fisso_per_trade: float = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Versione vettoriale del nucleo del backtest, valida solo senza Stop Loss, Take Profit e Trailing Stop.
+
+    Senza stop lo stato (capitale, azioni, prezzo di ingresso) può cambiare solo nelle barre con
+    un segnale diverso da zero: la macchina a stati viene quindi eseguita solo su quegli eventi
+    (lavoro proporzionale al numero di segnali, non di barre) e l'equity di tutte le barre viene
+    ricostruita in blocco con searchsorted e operazioni NumPy. Il risultato è identico a _simula_backtest.
+
+    Args:
+        chiusura, segnali (np.ndarray): Prezzi di chiusura e segnali (1, -1, 0).
+        date_index (pd.DatetimeIndex): Indice temporale dei dati (non usato dal calcolo).
+        Gli altri argomenti hanno lo stesso significato di run_backtest.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: round-trip (array strutturato DTYPE_TRADE) e array dell'equity per ogni barra.
+    """
+    n_barre = len(chiusura)
+    comm = commissione_percentuale / 100
+    usa_importo_fisso = investimento_fisso_per_trade is not None and investimento_fisso_per_trade > 0
+
+    barre_evento = np.flatnonzero((segnali == 1) | (segnali == -1))
+    n_eventi = len(barre_evento)
+
+    # Stato dopo ciascun evento: capitale disponibile, azioni detenute (negative = SHORT), prezzo di ingresso
+    cassa_evento = np.empty(n_eventi, dtype=float)
+    azioni_evento = np.empty(n_eventi, dtype=float)
+    ingresso_evento = np.empty(n_eventi, dtype=float)
+
+    capital_available = capitale_iniziale
+    shares_held = 0
+    entry_price = 0
+    entry_bar = -1
+    round_trip = []
+
+    for k, (i, current_close, current_signal) in enumerate(zip(
+        barre_evento.tolist(), chiusura[barre_evento].tolist(), segnali[barre_evento].tolist()
+    )):
+        apri_long = False
+        apri_short = False
+        if shares_held == 0:
+            if current_signal == 1:
+                apri_long = True
+            elif abilita_short:
+                apri_short = True
+            if usa_importo_fisso:
+                quantita = int(investimento_fisso_per_trade / current_close)
+            else:
+                quantita = int(capital_available * 0.95 / current_close)  # Usa il 95% del capitale disponibile
+        elif (shares_held > 0 and current_signal == -1) or (shares_held < 0 and current_signal == 1):
+            # Segnale opposto: chiudi la posizione alla chiusura della barra
+            if shares_held > 0:
+                revenue = shares_held * current_close * (1 - comm)
+                capital_available += revenue
+                round_trip.append((entry_bar, i, 1, shares_held, entry_price, current_close, MOTIVO_SEGNALE,
+                                   revenue - shares_held * entry_price * (1 + comm)))
+            else:
+                quantita_short = abs(shares_held)
+                round_trip.append((entry_bar, i, -1, quantita_short, entry_price, current_close, MOTIVO_SEGNALE,
+                                   (quantita_short * entry_price) - (quantita_short * current_close)))
+            shares_held = 0
+            entry_price = 0
+            entry_bar = -1
+            # L'inversione usa sempre il 95% del capitale disponibile
+            if current_signal == -1 and abilita_short:
+                apri_short = True
+            elif current_signal == 1:
+                apri_long = True
+            quantita = int(capital_available * 0.95 / current_close)
+
+        if (apri_long or apri_short) and quantita > 0:
+            cost = quantita * current_close * (1 + comm)
+            if cost <= capital_available:
+                if apri_long:
+                    capital_available -= cost
+                    shares_held = quantita
+                else:
+                    shares_held = -quantita
+                entry_price = current_close
+                entry_bar = i
+
+        cassa_evento[k] = capital_available
+        azioni_evento[k] = shares_held
+        ingresso_evento[k] = entry_price
+
+    # Per ogni barra, lo stato rilevante è quello dopo l'ultimo evento strettamente precedente
+    ultimo_evento = np.searchsorted(barre_evento, np.arange(n_barre), side='left') - 1
+    ha_evento = ultimo_evento >= 0
+    ultimo_evento = np.where(ha_evento, ultimo_evento, 0)
+    cassa = np.where(ha_evento, cassa_evento[ultimo_evento] if n_eventi else capitale_iniziale, capitale_iniziale)
+    azioni = np.where(ha_evento, azioni_evento[ultimo_evento] if n_eventi else 0.0, 0.0)
+    ingresso = np.where(ha_evento, ingresso_evento[ultimo_evento] if n_eventi else 0.0, 0.0)
+
+    valore_posizione = np.where(
+        azioni > 0, azioni * chiusura,
+        np.where(azioni < 0, np.abs(azioni) * (ingresso - chiusura), 0.0)
+    )
+    equity_values = cassa + valore_posizione
+
+    # Chiudi le posizioni LONG aperte alla fine del backtest (come in _simula_backtest)
+    if shares_held > 0 and n_barre > 0:
+        final_price = float(chiusura[-1])
+        revenue_final = shares_held * final_price * (1 - comm)
+        round_trip.append((entry_bar, n_barre - 1, 1, shares_held, entry_price, final_price,
+                           MOTIVO_CHIUSURA_FINALE, revenue_final - shares_held * entry_price * (1 + comm)))
+    elif shares_held < 0:
+        round_trip.append((entry_bar, -1, -1, abs(shares_held), entry_price, np.nan, MOTIVO_APERTA, np.nan))
+
+    return _crea_array_trade(round_trip), equity_values
+
+
+def _primo_stop(
+    direzione: int,
+    barra_ingresso: int,
+    ultima_barra: int,
+    entry_price: float,
+    apertura: np.ndarray,
+    massimo: np.ndarray,
+    minimo: np.ndarray,
+    chiusura: np.ndarray,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+) -> tuple:
+    """
+    Cerca la prima barra in (barra_ingresso, ultima_barra] in cui scatta Stop Loss, Take Profit o Trailing Stop.
+
+    Applica in blocco, su finestre di ampiezza crescente (32, 64, 128, ... barre), le stesse regole
+    intraday del ciclo barra per barra: il Trailing Stop segue il massimo (LONG) o il minimo (SHORT)
+    cumulato dalla barra di ingresso; se il livello del Trailing Stop è toccato ma la candela è nel
+    verso sbagliato non si esce e Stop Loss e Take Profit non vengono valutati su quella barra.
+    Il lavoro è proporzionale alla durata del trade, non al numero totale di barre.
 
-                            if stop_loss_percent is not None:
-                                stop_loss_price = entry_price * (1 - stop_loss_percent / 100)
-                            if take_profit_percent is not None:
-                                take_profit_price = entry_price * (1 + take_profit_percent / 100)
-                            if trailing_stop_percent is not None:
-                                trailing_stop_highest_price = current_high
-                            
-                            trade_log.append({
-                                'Data': index.date(),
-                                'Tipo': 'BUY',
-                                'Prezzo': current_close,
-                                'Quantità': shares_to_buy,
-                                'Costo': cost,
-                                'Comm. (€)': commission,
-                                'Equity (€)': current_equity
-                            })
-
-    # Chiudi le posizioni aperte alla fine del backtest
-    if in_position:
-        # Verifica che la colonna 'Close' esista e che il DataFrame non sia vuoto
-        if 'Close' in dati.columns and not dati.empty:
-            final_price = dati['Close'].iloc[-1]
-            if shares_held > 0: # Posizione LONG aperta
-                revenue_final = shares_held * final_price * (1 - commissione_percentuale / 100)
-                commission_final = (shares_held * final_price * commissione_percentuale) / 100
-                cost_original_final = shares_held * entry_price * (1 + commissione_percentuale / 100)
-                profit_loss_final = revenue_final - cost_original_final
-                
-                capital_available += revenue_final
-
-                print(f"DEBUG FINAL SELL LONG: Tipo di final_price: {type(final_price)}, Valore: {final_price}") # DEBUG PRINT
-                trade_log.append({
-                    'Data': dati.index[-1].date(),
-                    'Tipo': 'SELL (Chiusura Finale LONG)',
-                    'Prezzo': final_price,
-                    'Quantità': shares_held,
-                    'Ricavo': revenue_final,
-                    'Comm. (€)': commission_final,
-                    'P/L (€)': profit_loss_final,
-                    'Equity (€)': current_equity
-                })
-        elif shares_held < 0 and 'Close' in dati.columns and not dati.empty: # Posizione SHORT aperta
-            final_price = dati['Close'].iloc[-1]
-            cost_to_cover_final = abs(shares_held) * final_price * (1 + commissione_percentuale / 100)
-            commission_final_short = (abs(shares_held) * final_price * commissione_percentuale) / 100
-            profit_loss_final_short = (abs(shares_held) * entry_price) - (abs(shares_held) * final_price)
-            
-            capital_available -= cost_to_cover_final
-
-            print(f"DEBUG FINAL COVER SHORT: Tipo di final_price: {type(final_price)}, Valore: {final_price}") # DEBUG PRINT
-            trade_log.append({
-                'Data': dati.index[-1].date(),
-                'Tipo': 'COVER (Chiusura Finale SHORT)',
-                'Prezzo': final_price,
-                'Quantità': abs(shares_held),
-                'Costo Chiusura Short': cost_to_cover_final,
-                'Comm. (€)': commission_final_short,
-                'P/L (€)': profit_loss_final_short,
-                'Equity (€)': current_equity
-            })
-
-    # Calcola le metriche di performance
-    # Crea una Serie pandas per l'equity curve
-    equity_curve = pd.Series(equity_curve_values, index=[dati.index[0]] + list(dati.index))
-    if len(equity_curve) > len(dati.index): # Rimuovi il primo elemento duplicato se l'equity curve è stata inizializzata con il capitale iniziale
-        equity_curve = equity_curve.iloc[1:]
-    
-    # Assicurati che l'equity curve abbia la stessa lunghezza dell'indice dei dati
-    # A volte equity_curve_values può avere un elemento in più dovuto all'inizializzazione o al conteggio.
-    # Questo allineamento è cruciale per i calcoli giornalieri e per evitare errori.
-    if len(equity_curve) != len(dati.index):
-        # Questo è un caso limite, assicurarsi che l'equity_curve abbia la lunghezza corretta
-        # Ad esempio, se l'equity_curve_values ha N+1 elementi (capitale iniziale + N giorni)
-        # e dati.index ha N elementi.
-        if len(equity_curve_values) == len(dati.index) + 1:
-            equity_curve = pd.Series(equity_curve_values[1:], index=dati.index)
-        elif len(equity_curve_values) == len(dati.index):
-             equity_curve = pd.Series(equity_curve_values, index=dati.index)
+    Returns:
+        tuple: (barra, motivo, prezzo di uscita) oppure (-1, None, None) se nessuno stop scatta.
+    """
+    long = direzione > 0
+    stop_loss_price = None
+    if stop_loss_percent is not None:
+        stop_loss_price = entry_price * (1 - stop_loss_percent / 100) if long else entry_price * (1 + stop_loss_percent / 100)
+    take_profit_price = None
+    if take_profit_percent is not None:
+        take_profit_price = entry_price * (1 + take_profit_percent / 100) if long else entry_price * (1 - take_profit_percent / 100)
+
+    # Estremo cumulato per il Trailing Stop, inizializzato con la barra di ingresso
+    estremo = massimo[barra_ingresso] if long else minimo[barra_ingresso]
+    inizio = barra_ingresso + 1
+    ampiezza = 32
+    while inizio <= ultima_barra:
+        fine = min(inizio + ampiezza, ultima_barra + 1)
+        alto = massimo[inizio:fine]
+        basso = minimo[inizio:fine]
+        uscita = np.zeros(fine - inizio, dtype=bool)
+        libera = np.ones(fine - inizio, dtype=bool) # Barre in cui si valutano SL e TP
+
+        if trailing_stop_percent is not None:
+            if long:
+                estremi = np.maximum(np.maximum.accumulate(alto), estremo)
+                livelli_ts = estremi * (1 - trailing_stop_percent / 100)
+                toccato = basso <= livelli_ts
+                uscita |= toccato & (chiusura[inizio:fine] <= apertura[inizio:fine])  # Massimo PRIMA del minimo
+            else:
+                estremi = np.minimum(np.minimum.accumulate(basso), estremo)
+                livelli_ts = estremi * (1 + trailing_stop_percent / 100)
+                toccato = alto >= livelli_ts
+                uscita |= toccato & (chiusura[inizio:fine] >= apertura[inizio:fine])  # Minimo PRIMA del massimo
+            libera = ~toccato
+            estremo = estremi[-1]
+        if stop_loss_price is not None:
+            colpito_sl = (basso <= stop_loss_price) if long else (alto >= stop_loss_price)
+            uscita |= libera & colpito_sl
+            libera = libera & ~colpito_sl
+        if take_profit_price is not None:
+            uscita |= libera & ((alto >= take_profit_price) if long else (basso <= take_profit_price))
+
+        if uscita.any():
+            k = int(np.argmax(uscita))
+            if trailing_stop_percent is not None and toccato[k]:
+                return inizio + k, MOTIVO_TRAILING_STOP, float(livelli_ts[k])
+            if stop_loss_price is not None and colpito_sl[k]:
+                return inizio + k, MOTIVO_STOP_LOSS, stop_loss_price
+            return inizio + k, MOTIVO_TAKE_PROFIT, take_profit_price
+
+        inizio = fine
+        ampiezza *= 2
+    return -1, None, None
+
+
+def _indici_segnali(segnali: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Posizioni delle barre con un segnale qualsiasi, con segnale BUY (1) e con segnale SELL (-1).
+    """
+    return (
+        np.flatnonzero((segnali == 1) | (segnali == -1)),
+        np.flatnonzero(segnali == 1),
+        np.flatnonzero(segnali == -1),
+    )
+
+
+def _simula_backtest_eventi(
+    apertura: np.ndarray,
+    massimo: np.ndarray,
+    minimo: np.ndarray,
+    chiusura: np.ndarray,
+    segnali: np.ndarray,
+    date_index: pd.DatetimeIndex,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    investimento_fisso_per_trade: float = None,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+    indici_segnali: tuple = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Nucleo del backtest "a eventi": salta da un ingresso all'uscita successiva invece di scorrere ogni barra.
+
+    Da flat si passa direttamente alla barra con il segnale successivo; in posizione si cerca in blocco
+    (con _primo_stop) la prima barra in cui scatta uno stop prima del successivo segnale opposto.
+    Il lavoro è proporzionale al numero di trade e alla loro durata in operazioni NumPy, non al numero
+    di barre in Python. L'equity di tutte le barre viene ricostruita in blocco dagli stati dopo ogni
+    evento, come in _simula_backtest_vettoriale. Il risultato è identico a _simula_backtest.
+
+    Args:
+        apertura, massimo, minimo, chiusura, segnali (np.ndarray): Array della stessa lunghezza.
+        date_index (pd.DatetimeIndex): Indice temporale dei dati (non usato dal calcolo).
+        indici_segnali (tuple, optional): Risultato di _indici_segnali(segnali), per riusarlo tra più
+            simulazioni sugli stessi segnali (es. run_stop_sweep).
+        Gli altri argomenti hanno lo stesso significato di run_backtest.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: round-trip (array strutturato DTYPE_TRADE) e array dell'equity per ogni barra.
+    """
+    n_barre = len(chiusura)
+    comm = commissione_percentuale / 100
+    usa_importo_fisso = investimento_fisso_per_trade is not None and investimento_fisso_per_trade > 0
+
+    barre_segnale, barre_buy, barre_sell = indici_segnali if indici_segnali is not None else _indici_segnali(segnali)
+
+    # Stato dopo ogni barra in cui cambia: (barra, capitale disponibile, azioni detenute, prezzo di ingresso)
+    barre_evento = []
+    cassa_evento = []
+    azioni_evento = []
+    ingresso_evento = []
+    round_trip = []
+
+    capital_available = capitale_iniziale
+    shares_held = 0
+    entry_price = 0
+    entry_bar = -1
+
+    def apri_posizione(i, current_signal, quantita):
+        # Tenta di aprire una posizione alla chiusura della barra i; restituisce True se aperta
+        nonlocal capital_available, shares_held, entry_price, entry_bar
+        if quantita <= 0:
+            return False
+        current_close = float(chiusura[i])
+        cost = quantita * current_close * (1 + comm)
+        if cost > capital_available:
+            return False
+        if current_signal == 1:
+            capital_available -= cost
+            shares_held = quantita
         else:
-             # Se le lunghezze non corrispondono ancora, potrebbe esserci un problema nella logica di append
-             print(f"ATTENZIONE: Lunghezza equity_curve ({len(equity_curve_values)}) non corrisponde a dati.index ({len(dati.index)})")
-             # Tentativo di allineamento, potrebbe portare a problemi se la discrepanza è complessa
-             equity_curve = pd.Series(equity_curve_values[:len(dati.index)], index=dati.index)
+            shares_held = -quantita  # Per lo short il valore resta solo come garanzia
+        entry_price = current_close
+        entry_bar = i
+        return True
 
+    prossima_barra = 0
+    while prossima_barra < n_barre:
+        if shares_held == 0:
+            # Da flat: solo le barre con un segnale possono cambiare lo stato
+            posizione = np.searchsorted(barre_segnale, prossima_barra)
+            if posizione >= len(barre_segnale):
+                break
+            i = int(barre_segnale[posizione])
+            current_signal = segnali[i]
+            prossima_barra = i + 1
+            if current_signal == -1 and not abilita_short:
+                continue
+            current_close = float(chiusura[i])
+            if usa_importo_fisso:
+                quantita = int(investimento_fisso_per_trade / current_close)
+            else:
+                quantita = int(capital_available * 0.95 / current_close)  # Usa il 95% del capitale disponibile
+            if apri_posizione(i, current_signal, quantita):
+                barre_evento.append(i)
+                cassa_evento.append(capital_available)
+                azioni_evento.append(shares_held)
+                ingresso_evento.append(entry_price)
+            continue
 
-    # Buy & Hold Equity Curve
-    # Normalizza i prezzi di chiusura all'inizio del backtest
-    buy_hold_prices = dati['Close']
-    if not buy_hold_prices.empty and buy_hold_prices.iloc[0] != 0:
-        buy_hold_equity_series = (buy_hold_prices / buy_hold_prices.iloc[0]) * capitale_iniziale
-    else:
-        buy_hold_equity_series = pd.Series([capitale_iniziale] * len(dati), index=dati.index)
-
-    # Calcolo delle metriche
-    # Prima contiamo i trade vincenti e perdenti
-    winning_trades = [t for t in trade_log if 'P/L (€)' in t and t['P/L (€)'] > 0]
-    losing_trades = [t for t in trade_log if 'P/L (€)' in t and t['P/L (€)'] < 0]
-    num_winning_trades = len(winning_trades)
-    num_losing_trades = len(losing_trades)
-    # Il totale dei trade è la somma dei vincenti e perdenti
-    total_trades = num_winning_trades + num_losing_trades
-
-    # Calcola le statistiche per i trade Long e Short
-    print("DEBUG: Tipi di trade nel log:")
-    for trade in trade_log:
-        print(f"Tipo: {trade.get('Tipo', 'N/A')}, P/L: {trade.get('P/L (€)', 'N/A')}")
-
-    # Calcola le statistiche per i trade Long e Short
-    long_trades = []
-    short_trades = []
-    
-    for trade in trade_log:
-        trade_type = trade.get('Tipo', '')
-        if 'P/L (€)' in trade:
-            if 'BUY' in trade_type or 'SELL' in trade_type or 'LONG' in trade_type:
-                long_trades.append(trade)
-            elif 'SHORT' in trade_type or 'COVER' in trade_type:
-                short_trades.append(trade)
-    
-    num_long_trades = len(long_trades)
-    num_short_trades = len(short_trades)
-    
-    print(f"DEBUG: Numero di trade long: {num_long_trades}")
-    print(f"DEBUG: Numero di trade short: {num_short_trades}")
-    
-    # Calcola il P/L medio per i trade Long
-    long_pnl_total = sum(t['P/L (€)'] for t in long_trades)
-    avg_long_pnl_percent = (long_pnl_total / (num_long_trades * capitale_iniziale) * 100) if num_long_trades > 0 else 0
-    
-    # Calcola il P/L medio per i trade Short
-    short_pnl_total = sum(t['P/L (€)'] for t in short_trades)
-    avg_short_pnl_percent = (short_pnl_total / (num_short_trades * capitale_iniziale) * 100) if num_short_trades > 0 else 0
-
-    # Verifica che il totale dei trade sia corretto
-    total_trades = num_long_trades + num_short_trades
-    if total_trades != num_winning_trades + num_losing_trades:
-        print(f"ATTENZIONE: Discrepanza nel conteggio dei trade. Total: {total_trades}, Winning+Losing: {num_winning_trades + num_losing_trades}")
-        # Usa il conteggio più accurato
-        total_trades = num_winning_trades + num_losing_trades
-
-    # Calcola il P/L totale come differenza tra capitale finale e iniziale
-    total_pnl = current_equity - capitale_iniziale
-
-    # Calcola il P&L totale in percentuale rispetto al capitale iniziale
-    total_pnl_percent = (total_pnl / capitale_iniziale * 100) if capitale_iniziale != 0 else 0.0
-
-    # Calcola il profitto medio dei trade vincenti
-    avg_winning_trade = sum(t['P/L (€)'] for t in winning_trades) / num_winning_trades if num_winning_trades > 0 else 0
-    avg_winning_trade_percent = (avg_winning_trade / capitale_iniziale * 100) if capitale_iniziale != 0 else 0
-
-    # Calcola la perdita media dei trade perdenti
-    avg_losing_trade = sum(t['P/L (€)'] for t in losing_trades) / num_losing_trades if num_losing_trades > 0 else 0
-    avg_losing_trade_percent = (avg_losing_trade / capitale_iniziale * 100) if capitale_iniziale != 0 else 0
-
-    # Trova il trade con il profitto massimo
-    max_profit_trade = max(winning_trades, key=lambda x: x['P/L (€)']) if winning_trades else None
-    max_profit = max_profit_trade['P/L (€)'] if max_profit_trade else 0
-    max_profit_percent = (max_profit / capitale_iniziale * 100) if capitale_iniziale != 0 else 0
-    max_profit_date = max_profit_trade['Data'] if max_profit_trade else None
-
-    # Trova il trade con la perdita massima
-    max_loss_trade = min(losing_trades, key=lambda x: x['P/L (€)']) if losing_trades else None
-    max_loss = max_loss_trade['P/L (€)'] if max_loss_trade else 0
-    max_loss_percent = (max_loss / capitale_iniziale * 100) if capitale_iniziale != 0 else 0
-    max_loss_date = max_loss_trade['Data'] if max_loss_trade else None
-
-    # Calcola la durata media dei trade
-    trade_durations = []
-    for i in range(0, len(trade_log)-1, 2):
-        if i+1 < len(trade_log):
-            entry_date = pd.to_datetime(trade_log[i]['Data'])
-            exit_date = pd.to_datetime(trade_log[i+1]['Data'])
-            duration = (exit_date - entry_date).days
-            trade_durations.append(duration)
-    avg_trade_duration = sum(trade_durations) / len(trade_durations) if trade_durations else 0
-
-    # Calcola il profitto/perdita medio annuale
-    total_days = (pd.to_datetime(dati.index[-1]) - pd.to_datetime(dati.index[0])).days
-    trading_days = len(dati)  # Giorni di trading effettivi
-    annualized_return = (total_pnl / capitale_iniziale) * (365 / total_days) * 100 if capitale_iniziale != 0 and total_days > 0 else 0
-
-    # Calcolo del Max Drawdown
-    if not equity_curve.empty:
-        # Calcola i massimi cumulativi dell'equity curve
-        cumulative_max = equity_curve.cummax()
-        # Calcola il drawdown in percentuale
-        drawdown = (cumulative_max - equity_curve) / cumulative_max
-        max_drawdown_percent = drawdown.max() * 100
-        # Calcola il drawdown in valore assoluto (€)
-        max_drawdown_abs = (cumulative_max - equity_curve).max()
-    else:
-        max_drawdown_percent = 0.0
-        max_drawdown_abs = 0.0
-
-    # Calcolo Sharpe Ratio
-    # Assicurati che daily_returns non sia vuoto per evitare divisione per zero o errore di deviazione standard
-    if not daily_returns.empty and daily_returns.std() != 0:
-        sharpe_ratio = daily_returns.mean() / daily_returns.std() * np.sqrt(252) # 252 giorni di trading in un anno
-        metriche_risultati = {'Ratio Sharpe': round(sharpe_ratio, 2)}
-    else:
-        metriche_risultati = {'Ratio Sharpe': 0.0}
-
-    # Sortino Ratio
-    # Solo i rendimenti negativi
-    downside_returns = daily_returns[daily_returns < 0]
-    if not downside_returns.empty and downside_returns.std() != 0:
-        sortino_ratio = daily_returns.mean() / downside_returns.std() * np.sqrt(252)
-        metriche_risultati['Ratio Sortino'] = round(sortino_ratio, 2)
-    else:
-        metriche_risultati['Ratio Sortino'] = float('inf') # O 0.0, a seconda di come vuoi rappresentare l'assenza di rischio negativo
+        # In posizione: prossimo segnale opposto e primo stop prima (o sulla barra) di quel segnale
+        long = shares_held > 0
+        opposti = barre_sell if long else barre_buy
+        posizione = np.searchsorted(opposti, entry_bar + 1)
+        barra_inversione = int(opposti[posizione]) if posizione < len(opposti) else -1
+        ultima_barra = barra_inversione if barra_inversione >= 0 else n_barre - 1
+
+        barra_uscita, exit_reason, exit_price = _primo_stop(
+            1 if long else -1, entry_bar, ultima_barra, entry_price,
+            apertura, massimo, minimo, chiusura,
+            stop_loss_percent, take_profit_percent, trailing_stop_percent,
+        )
+        if barra_uscita < 0:
+            if barra_inversione < 0:
+                break  # Posizione aperta fino all'ultima barra
+            barra_uscita = barra_inversione
+            exit_reason = MOTIVO_SEGNALE
+            exit_price = float(chiusura[barra_uscita])
 
-    # Calmar Ratio
-    annualized_return_from_equity_curve = (1 + daily_returns.mean())**252 - 1 if not daily_returns.empty else 0
+        i = barra_uscita
+        if long:  # Chiudi posizione LONG
+            revenue = shares_held * exit_price * (1 - comm)
+            capital_available += revenue
+            round_trip.append((entry_bar, i, 1, shares_held, entry_price, exit_price, exit_reason,
+                               revenue - shares_held * entry_price * (1 + comm)))
+        else:  # Chiudi posizione SHORT
+            quantita_short = abs(shares_held)
+            round_trip.append((entry_bar, i, -1, quantita_short, entry_price, exit_price, exit_reason,
+                               (quantita_short * entry_price) - (quantita_short * exit_price)))
+        shares_held = 0
+        entry_price = 0
+        entry_bar = -1
 
-    if max_drawdown_percent != 0:
-        calmar_ratio = annualized_return_from_equity_curve / (max_drawdown_percent / 100)
-        metriche_risultati['Ratio Calmar'] = round(calmar_ratio, 2)
+        # Segnale di inversione: apri subito la nuova posizione con il 95% del capitale disponibile
+        if exit_reason == MOTIVO_SEGNALE:
+            current_signal = segnali[i]
+            if current_signal == 1 or abilita_short:
+                apri_posizione(i, current_signal, int(capital_available * 0.95 / float(chiusura[i])))
+
+        barre_evento.append(i)
+        cassa_evento.append(capital_available)
+        azioni_evento.append(shares_held)
+        ingresso_evento.append(entry_price)
+        prossima_barra = i + 1
+
+    # Per ogni barra, lo stato rilevante è quello dopo l'ultimo evento strettamente precedente
+    barre_evento = np.asarray(barre_evento, dtype=np.int64)
+    ultimo_evento = np.searchsorted(barre_evento, np.arange(n_barre), side='left') - 1
+    ha_evento = ultimo_evento >= 0
+    ultimo_evento = np.where(ha_evento, ultimo_evento, 0)
+    if len(barre_evento):
+        cassa = np.where(ha_evento, np.asarray(cassa_evento, dtype=float)[ultimo_evento], capitale_iniziale)
+        azioni = np.where(ha_evento, np.asarray(azioni_evento, dtype=float)[ultimo_evento], 0.0)
+        ingresso = np.where(ha_evento, np.asarray(ingresso_evento, dtype=float)[ultimo_evento], 0.0)
     else:
-        metriche_risultati['Ratio Calmar'] = float('inf')
-
-    # Crea un nuovo dizionario con le metriche nello stesso ordine di 2_Testa_Strategie.py
-    metriche_ordinate = {
-        'Capitale Finale (€)': round(current_equity, 2),
-        'Profitto/Perdita Totale (€)': round(total_pnl, 2),
-        'Profitto/Perdita Totale (%)': round(total_pnl_percent, 2),
-        'Giorni Totali': total_days,
-        'Rendimento Medio Annuale (%)': round(annualized_return, 2),
-        'Numero Totale di Trade': total_trades,
-        'Num. Trade Vincenti': num_winning_trades,
-        'Num. Trade Perdenti': num_losing_trades,
-        'Percentuale Trade Vincenti': round((num_winning_trades / total_trades * 100) if total_trades > 0 else 0, 2),
-        'Num. Trade Long': num_long_trades,
-        'P/L Medio Trade Long (%)': round(avg_long_pnl_percent, 2),
-        'Num. Trade Short': num_short_trades,
-        'P/L Medio Trade Short (%)': round(avg_short_pnl_percent, 2),
-        'Profitto Medio Trade Vincenti (€)': round(avg_winning_trade, 2),
-        'Profitto Medio Trade Vincenti (%)': round(avg_winning_trade_percent, 2),
-        'Perdita Media Trade Perdenti (€)': round(avg_losing_trade, 2),
-        'Perdita Media Trade Perdenti (%)': round(avg_losing_trade_percent, 2),
-        'Profitto Massimo Trade (€)': round(max_profit, 2),
-        'Profitto Massimo Trade (%)': round(max_profit_percent, 2),
-        'Data Profitto Massimo': max_profit_date.strftime('%Y-%m-%d') if max_profit_date else 'N/A',
-        'Perdita Massima Trade (€)': round(max_loss, 2),
-        'Perdita Massima Trade (%)': round(max_loss_percent, 2),
-        'Data Perdita Massima': max_loss_date.strftime('%Y-%m-%d') if max_loss_date else 'N/A',
-        'Durata Media Trade (giorni)': round(avg_trade_duration, 1),
-        'Max Drawdown (€)': round(max_drawdown_abs, 2),
-        'Max Drawdown (%)': round(max_drawdown_percent, 2),
-        'Ratio Sharpe': round(sharpe_ratio, 2),
-        'Ratio Sortino': round(sortino_ratio, 2),
-        'Ratio Calmar': round(calmar_ratio, 2)
+        cassa = np.full(n_barre, float(capitale_iniziale))
+        azioni = np.zeros(n_barre)
+        ingresso = np.zeros(n_barre)
+
+    valore_posizione = np.where(
+        azioni > 0, azioni * chiusura,
+        np.where(azioni < 0, np.abs(azioni) * (ingresso - chiusura), 0.0)
+    )
+    equity_values = cassa + valore_posizione
+
+    # Chiudi le posizioni LONG aperte alla fine del backtest (come in _simula_backtest)
+    if shares_held > 0 and n_barre > 0:
+        final_price = float(chiusura[-1])
+        revenue_final = shares_held * final_price * (1 - comm)
+        round_trip.append((entry_bar, n_barre - 1, 1, shares_held, entry_price, final_price,
+                           MOTIVO_CHIUSURA_FINALE, revenue_final - shares_held * entry_price * (1 + comm)))
+    elif shares_held < 0:
+        round_trip.append((entry_bar, -1, -1, abs(shares_held), entry_price, np.nan, MOTIVO_APERTA, np.nan))
+
+    return _crea_array_trade(round_trip), equity_values
+
+
+def _equity_buy_hold(chiusura: np.ndarray, capitale_iniziale: float) -> np.ndarray:
+    """
+    Equity Buy & Hold: prezzi di chiusura normalizzati all'inizio del backtest.
+    """
+    if len(chiusura) > 0 and chiusura[0] != 0:
+        return chiusura / chiusura[0] * capitale_iniziale
+    return np.full(len(chiusura), float(capitale_iniziale))
+
+
+def _descrizione_uscita(direzione: int, motivo: int, prezzo: float) -> str:
+    """
+    Testo della colonna 'Tipo' per l'uscita di un round-trip (es. 'SELL (Stop Loss a 98.50)').
+    """
+    base = 'SELL' if direzione > 0 else 'COVER'
+    if motivo == MOTIVO_STOP_LOSS:
+        return f"{base} (Stop Loss a {prezzo:.2f})"
+    if motivo == MOTIVO_TAKE_PROFIT:
+        return f"{base} (Take Profit a {prezzo:.2f})"
+    if motivo == MOTIVO_TRAILING_STOP:
+        return f"{base} (Trailing Stop a {prezzo:.2f})"
+    if motivo == MOTIVO_CHIUSURA_FINALE:
+        return 'SELL (Chiusura Finale LONG)' if direzione > 0 else 'COVER (Chiusura Finale SHORT)'
+    return base
+
+
+def costruisci_trade_log(trade: np.ndarray, equity_curve: pd.Series, commissione_percentuale: float) -> list:
+    """
+    Costruisce il trade log "da visualizzare" (un dizionario per ogni ingresso e ogni uscita)
+    a partire dai round-trip colonnari restituiti da run_backtest.
+
+    Va chiamata solo quando il log deve essere mostrato: il backtest e le metriche lavorano
+    direttamente sull'array strutturato.
+
+    Args:
+        trade (np.ndarray): Round-trip (array strutturato DTYPE_TRADE).
+        equity_curve (pd.Series): Equity curve restituita dallo stesso backtest (fornisce date ed equity).
+        commissione_percentuale (float): Commissione usata nel backtest.
+
+    Returns:
+        list: Lista di dizionari con le chiavi 'Data', 'Tipo', 'Prezzo', 'Quantità', 'Costo' / 'Ricavo' /
+              'Costo Chiusura Short', 'Comm. (€)', 'P/L (€)' (solo uscite) e 'Equity (€)'.
+    """
+    comm = commissione_percentuale / 100
+    date_index = equity_curve.index
+    equity_values = equity_curve.to_numpy()
+    trade_log = []
+
+    for barra_in, barra_out, direzione, quantita, prezzo_in, prezzo_out, motivo, pl in trade.tolist():
+        trade_log.append({
+            'Data': date_index[barra_in].date(),
+            'Tipo': 'BUY' if direzione > 0 else 'SELL SHORT',
+            'Prezzo': prezzo_in,
+            'Quantità': quantita,
+            'Costo': quantita * prezzo_in * (1 + comm),
+            'Comm. (€)': (quantita * prezzo_in * commissione_percentuale) / 100,
+            'Equity (€)': float(equity_values[barra_in])
+        })
+        if motivo == MOTIVO_APERTA:
+            continue
+
+        uscita = {
+            'Data': date_index[barra_out].date(),
+            'Tipo': _descrizione_uscita(direzione, motivo, prezzo_out),
+            'Prezzo': prezzo_out,
+            'Quantità': quantita,
+        }
+        if direzione > 0:
+            uscita['Ricavo'] = quantita * prezzo_out * (1 - comm)
+        else:
+            uscita['Costo Chiusura Short'] = quantita * prezzo_out * (1 + comm)
+        uscita['Comm. (€)'] = (quantita * prezzo_out * commissione_percentuale) / 100
+        uscita['P/L (€)'] = pl
+        uscita['Equity (€)'] = float(equity_values[barra_out])
+        trade_log.append(uscita)
+
+    return trade_log
+
+
+def statistiche_trade(trade: np.ndarray, commissione_percentuale: float) -> dict:
+    """
+    Statistiche aggregate dei round-trip usate dalle pagine (commissioni, profitti e perdite lordi).
+
+    Args:
+        trade (np.ndarray): Round-trip (array strutturato DTYPE_TRADE).
+        commissione_percentuale (float): Commissione usata nel backtest.
+
+    Returns:
+        dict: 'Commissioni Totali (€)', 'Num. Vincenti', 'Num. Perdenti',
+              'Profitto Lordo (€)' e 'Perdita Lorda (€)' (in valore assoluto).
+    """
+    chiusi = trade[trade['motivo_uscita'] != MOTIVO_APERTA]
+    pl = chiusi['pl']
+    controvalore = (trade['quantita'] * trade['prezzo_ingresso']).sum() + (chiusi['quantita'] * chiusi['prezzo_uscita']).sum()
+    return {
+        'Commissioni Totali (€)': float(controvalore * commissione_percentuale / 100),
+        'Num. Vincenti': int((pl > 0).sum()),
+        'Num. Perdenti': int((pl < 0).sum()),
+        'Profitto Lordo (€)': float(pl[pl > 0].sum()),
+        'Perdita Lorda (€)': float(abs(pl[pl < 0].sum())),
     }
-    
-    # Aggiorna il dizionario delle metriche con l'ordine corretto
-    metriche_risultati.clear()
-    metriche_risultati.update(metriche_ordinate)
 
-    return trade_log, equity_curve, buy_hold_equity_series, metriche_risultati
\ No newline at end of file
+
+# Con gli stop attivi, il nucleo a eventi conviene solo se i segnali sono radi: 'auto' lo sceglie
+# quando in media ci sono almeno tante barre per segnale (altrimenti il ciclo barra per barra è più veloce)
+BARRE_PER_SEGNALE_EVENTI = 50
+
+MODALITA_MOTORE = ('auto', 'barre', 'vettoriale', 'eventi')
+
+
+def _scegli_nucleo(modalita_motore: str, senza_stop: bool, segnali: np.ndarray) -> str:
+    """
+    Risolve la modalità 'auto' nel nucleo di simulazione da usare ('barre', 'vettoriale' o 'eventi').
+    """
+    if modalita_motore not in MODALITA_MOTORE:
+        raise ValueError(f"modalita_motore non valida: '{modalita_motore}'. Valori ammessi: {', '.join(repr(m) for m in MODALITA_MOTORE)}.")
+    if modalita_motore == 'vettoriale' and not senza_stop:
+        raise ValueError("La modalità 'vettoriale' è disponibile solo senza Stop Loss, Take Profit e Trailing Stop.")
+    if modalita_motore != 'auto':
+        return modalita_motore
+    if senza_stop:
+        return 'vettoriale'
+    n_segnali = np.count_nonzero((segnali == 1) | (segnali == -1))
+    return 'eventi' if len(segnali) >= BARRE_PER_SEGNALE_EVENTI * max(1, n_segnali) else 'barre'
+
+
+def _esegui_nucleo(
+    nucleo: str,
+    apertura: np.ndarray,
+    massimo: np.ndarray,
+    minimo: np.ndarray,
+    chiusura: np.ndarray,
+    segnali: np.ndarray,
+    date_index: pd.DatetimeIndex,
+    **parametri_backtest,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Esegue il nucleo di simulazione scelto con _scegli_nucleo e restituisce (round-trip, equity).
+    """
+    strumentazione.conta(f'backtest_{nucleo}')
+    strumentazione.conta('barre_simulate', len(chiusura))
+    with strumentazione.fase(strumentazione.FASE_SIMULAZIONE):
+        if nucleo == 'vettoriale':
+            # Solo segnali: nessun ciclo per barra, lo stato cambia solo nelle barre con segnale
+            for nome in ('stop_loss_percent', 'take_profit_percent', 'trailing_stop_percent'):
+                parametri_backtest.pop(nome, None)
+            return _simula_backtest_vettoriale(chiusura, segnali, date_index, **parametri_backtest)
+        if nucleo == 'eventi':
+            return _simula_backtest_eventi(apertura, massimo, minimo, chiusura, segnali, date_index, **parametri_backtest)
+        return _simula_backtest(apertura, massimo, minimo, chiusura, segnali, date_index, **parametri_backtest)
+
+
+def run_backtest(
+    dati: pd.DataFrame, # DataFrame con dati OHLCV, Indicatori, e colonna 'Signal'
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    investimento_fisso_per_trade: float = None, # Nuovo parametro: importo fisso per ogni trade
+    stop_loss_percent: float = None, # None se non abilitato
+    take_profit_percent: float = None, # None se non abilitato
+    trailing_stop_percent: float = None, # None se non abilitato
+    modalita_motore: str = 'auto', # 'auto', 'barre' (ciclo barra per barra), 'vettoriale' (solo senza stop) o 'eventi'
+    metriche_richieste: list = None, # None = tutte le metriche
+    # Puoi aggiungere altri parametri qui se necessario in futuro (es. slippage)
+) -> tuple[np.ndarray, pd.Series, pd.Series, dict]:
+    """
+    Esegue il backtest di una strategia di trading sui dati forniti.
+
+    Args:
+        dati (pd.DataFrame): DataFrame con dati storici (OHLCV) e colonna 'Signal' generata dalla strategia.
+        capitale_iniziale (float): Capitale iniziale per il backtest.
+        commissione_percentuale (float): Percentuale di commissione per operazione (ingresso e uscita).
+        abilita_short (bool): Se true, le posizioni Short sono permesse.
+        investimento_fisso_per_trade (float, optional): Importo fisso da investire per ogni trade.
+                                                        Se None o 0, usa una percentuale di capitale.
+        stop_loss_percent (float, optional): Percentuale di stop loss dal prezzo di ingresso.
+                                             Es. 1.0 per 1%. None se non abilitato.
+        take_profit_percent (float, optional): Percentuale di take profit dal prezzo di ingresso.
+                                               Es. 2.0 per 2%. None se non abilitato.
+        trailing_stop_percent (float, optional): Percentuale di trailing stop. Es. 0.5 per 0.5%. None se non abilitato.
+        modalita_motore (str, optional): Nucleo di simulazione da usare.
+            'auto' (default) usa il percorso vettoriale quando SL, TP e TS sono tutti None; con gli stop
+            usa il nucleo a eventi se i segnali sono radi (almeno BARRE_PER_SEGNALE_EVENTI barre per
+            segnale), altrimenti il ciclo barra per barra. 'barre' forza il ciclo barra per barra,
+            'vettoriale' forza il percorso vettoriale (ValueError se uno stop è attivo), 'eventi' forza
+            il nucleo che salta da un ingresso all'uscita successiva cercando in blocco il primo stop.
+            Tutti i nuclei danno lo stesso risultato.
+        metriche_richieste (list, optional): Nomi delle metriche da calcolare (vedi
+            metriche_backtest.METRICHE_DISPONIBILI). Se None (default) le calcola tutte.
+
+    Returns:
+        tuple[np.ndarray, pd.Series, pd.Series, dict]: Una tupla contenente:
+            - trade_log (np.ndarray): Round-trip eseguiti, un record per trade (array strutturato DTYPE_TRADE).
+              Per la tabella da visualizzare usare costruisci_trade_log.
+            - equity_curve (pd.Series): Serie temporale del capitale totale (equity) nel tempo.
+            - buy_hold_equity_series (pd.Series): Serie temporale del capitale se avessi fatto Buy & Hold.
+            - metriche_risultati (dict): Dizionario delle metriche di performance del backtest.
+    """
+    # Verifica che la colonna 'Signal' esista
+    if 'Signal' not in dati.columns:
+        raise ValueError("Il DataFrame dati deve contenere una colonna 'Signal'.")
+
+    # Assicurati che l'indice sia un DatetimeIndex per lavorare correttamente con le date
+    if not isinstance(dati.index, pd.DatetimeIndex):
+        dati.index = pd.to_datetime(dati.index)
+
+    # Estrai una sola volta le colonne OHLC e i segnali in array NumPy contigui:
+    # il ciclo principale lavora solo su questi array e non tocca più il DataFrame.
+    apertura, massimo, minimo, chiusura, segnali = _estrai_array_backtest(dati)
+
+    senza_stop = stop_loss_percent is None and take_profit_percent is None and trailing_stop_percent is None
+    nucleo = _scegli_nucleo(modalita_motore, senza_stop, segnali)
+    trade, equity_values = _esegui_nucleo(
+        nucleo, apertura, massimo, minimo, chiusura, segnali, dati.index,
+        capitale_iniziale=capitale_iniziale,
+        commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short,
+        investimento_fisso_per_trade=investimento_fisso_per_trade,
+        stop_loss_percent=stop_loss_percent,
+        take_profit_percent=take_profit_percent,
+        trailing_stop_percent=trailing_stop_percent,
+    )
+
+    # Crea una Serie pandas per l'equity curve (un valore per ogni barra, senza copie)
+    equity_curve = pd.Series(equity_values, index=dati.index)
+
+    # Buy & Hold Equity Curve
+    buy_hold_equity_series = pd.Series(_equity_buy_hold(chiusura, capitale_iniziale), index=dati.index)
+
+    # Calcola le metriche di performance direttamente sugli array (solo quelle richieste)
+    metriche_risultati = calcola_metriche(trade, equity_values, dati.index, capitale_iniziale, metriche_richieste)
+
+    return trade, equity_curve, buy_hold_equity_series, metriche_risultati
+
+def run_backtest_batch(
+    dati: pd.DataFrame, # DataFrame con dati OHLC condivisi da tutte le varianti
+    segnali, # Matrice (barre × varianti) di segnali: np.ndarray oppure pd.DataFrame con una colonna per variante
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    investimento_fisso_per_trade: float = None,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+    restituisci_trade_log: bool = False,
+    metriche_richieste: list = None,
+) -> tuple[list, pd.DataFrame, pd.Series, pd.DataFrame]:
+    """
+    Esegue in una sola chiamata il backtest di molte varianti di segnali sugli stessi prezzi.
+
+    I prezzi vengono estratti una sola volta, l'equity Buy & Hold è calcolata una sola volta
+    e nessuna variante crea copie del DataFrame: ogni colonna della matrice dei segnali viene
+    simulata direttamente sugli array condivisi (nucleo scelto come nella modalità 'auto' di run_backtest).
+
+    Args:
+        dati (pd.DataFrame): DataFrame con colonne 'Open', 'High', 'Low', 'Close' (la colonna 'Signal' non serve).
+        segnali (np.ndarray | pd.DataFrame): Matrice (barre × varianti) con valori 1, -1, 0.
+            Un DataFrame viene allineato all'indice di dati (righe mancanti = nessun segnale) e
+            i nomi delle sue colonne diventano i nomi delle varianti.
+        capitale_iniziale, commissione_percentuale, abilita_short, investimento_fisso_per_trade,
+        stop_loss_percent, take_profit_percent, trailing_stop_percent: Come in run_backtest,
+            condivisi da tutte le varianti.
+        restituisci_trade_log (bool, optional): Se True restituisce anche i round-trip (DTYPE_TRADE) di ogni variante.
+        metriche_richieste (list, optional): Metriche da calcolare per ogni variante (None = tutte).
+
+    Returns:
+        tuple[list, pd.DataFrame, pd.Series, pd.DataFrame]: Una tupla contenente:
+            - trade_logs (list): Un array di round-trip per variante (lista vuota se restituisci_trade_log è False).
+            - equity_curves (pd.DataFrame): Equity di ogni variante (una colonna per variante).
+            - buy_hold_equity_series (pd.Series): Equity Buy & Hold, comune a tutte le varianti.
+            - metriche (pd.DataFrame): Una riga di metriche (come in run_backtest) per variante.
+    """
+    if not isinstance(dati.index, pd.DatetimeIndex):
+        dati = dati.set_axis(pd.to_datetime(dati.index), axis=0)
+
+    if isinstance(segnali, pd.DataFrame):
+        nomi_varianti = list(segnali.columns)
+        matrice_segnali = segnali.reindex(dati.index).fillna(0).to_numpy(dtype=float)
+    else:
+        matrice_segnali = np.asarray(segnali, dtype=float)
+        if matrice_segnali.ndim == 1:
+            matrice_segnali = matrice_segnali[:, np.newaxis]
+        nomi_varianti = list(range(matrice_segnali.shape[1]))
+
+    if matrice_segnali.shape[0] != len(dati):
+        raise ValueError(f"La matrice dei segnali ha {matrice_segnali.shape[0]} righe, ma i dati hanno {len(dati)} barre.")
+
+    apertura, massimo, minimo, chiusura = (
+        np.ascontiguousarray(dati[col].to_numpy(dtype=float)) for col in ('Open', 'High', 'Low', 'Close')
+    )
+    # Layout per colonne: ogni variante legge un blocco di memoria contiguo
+    matrice_segnali = np.asfortranarray(matrice_segnali)
+    senza_stop = stop_loss_percent is None and take_profit_percent is None and trailing_stop_percent is None
+
+    n_barre, n_varianti = matrice_segnali.shape
+    matrice_equity = np.empty((n_barre, n_varianti), dtype=float, order='F')
+    trade_logs = []
+    righe_metriche = []
+
+    for j in range(n_varianti):
+        # Nucleo scelto per variante: la densità dei segnali può cambiare da una colonna all'altra
+        segnali_variante = matrice_segnali[:, j]
+        trade, equity_values = _esegui_nucleo(
+            _scegli_nucleo('auto', senza_stop, segnali_variante),
+            apertura, massimo, minimo, chiusura, segnali_variante, dati.index,
+            capitale_iniziale=capitale_iniziale,
+            commissione_percentuale=commissione_percentuale,
+            abilita_short=abilita_short,
+            investimento_fisso_per_trade=investimento_fisso_per_trade,
+            stop_loss_percent=stop_loss_percent,
+            take_profit_percent=take_profit_percent,
+            trailing_stop_percent=trailing_stop_percent,
+        )
+        matrice_equity[:, j] = equity_values
+
+        righe_metriche.append(calcola_metriche(trade, equity_values, dati.index, capitale_iniziale, metriche_richieste))
+        if restituisci_trade_log:
+            trade_logs.append(trade)
+
+    equity_curves = pd.DataFrame(matrice_equity, index=dati.index, columns=nomi_varianti)
+    buy_hold_equity_series = pd.Series(_equity_buy_hold(chiusura, capitale_iniziale), index=dati.index)
+    metriche = pd.DataFrame(righe_metriche, index=nomi_varianti)
+
+    return trade_logs, equity_curves, buy_hold_equity_series, metriche
+
+
+def run_stop_sweep(
+    dati: pd.DataFrame, # DataFrame con dati OHLC e colonna 'Signal' (segnali generati una sola volta)
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    valori_stop_loss: list = (None,),
+    valori_take_profit: list = (None,),
+    valori_trailing_stop: list = (None,),
+    investimento_fisso_per_trade: float = None,
+    metriche_richieste: list = None,
+) -> pd.DataFrame:
+    """
+    Valuta in una sola passata una griglia di impostazioni di Stop Loss, Take Profit e Trailing Stop
+    sugli stessi segnali.
+
+    I segnali non vengono rigenerati: prezzi, posizioni delle barre con segnale e scelta del nucleo
+    di simulazione sono calcolati una sola volta e condivisi da tutte le combinazioni; ogni
+    combinazione esegue solo la simulazione (a eventi se i segnali sono radi) e le metriche richieste.
+
+    Args:
+        dati (pd.DataFrame): DataFrame con colonne 'Open', 'High', 'Low', 'Close' e 'Signal'.
+        capitale_iniziale, commissione_percentuale, abilita_short, investimento_fisso_per_trade: Come in run_backtest.
+        valori_stop_loss (list, optional): Valori di Stop Loss (%) da provare; None = stop disabilitato.
+        valori_take_profit (list, optional): Valori di Take Profit (%) da provare; None = disabilitato.
+        valori_trailing_stop (list, optional): Valori di Trailing Stop (%) da provare; None = disabilitato.
+        metriche_richieste (list, optional): Metriche da calcolare per ogni combinazione (None = tutte).
+
+    Returns:
+        pd.DataFrame: Una riga di metriche per combinazione, con MultiIndex
+        ('stop_loss_percent', 'take_profit_percent', 'trailing_stop_percent'). Gli stop disabilitati
+        (None) compaiono come NaN nell'indice.
+    """
+    if 'Signal' not in dati.columns:
+        raise ValueError("Il DataFrame dati deve contenere una colonna 'Signal'.")
+    date_index = dati.index if isinstance(dati.index, pd.DatetimeIndex) else pd.to_datetime(dati.index)
+
+    apertura, massimo, minimo, chiusura, segnali = _estrai_array_backtest(dati)
+    indici_segnali = _indici_segnali(segnali)
+    nucleo_con_stop = _scegli_nucleo('auto', False, segnali)
+
+    combinazioni = list(itertools.product(valori_stop_loss, valori_take_profit, valori_trailing_stop))
+    righe_metriche = []
+    for stop_loss_percent, take_profit_percent, trailing_stop_percent in combinazioni:
+        parametri_backtest = dict(
+            capitale_iniziale=capitale_iniziale,
+            commissione_percentuale=commissione_percentuale,
+            abilita_short=abilita_short,
+            investimento_fisso_per_trade=investimento_fisso_per_trade,
+        )
+        if stop_loss_percent is None and take_profit_percent is None and trailing_stop_percent is None:
+            nucleo = 'vettoriale'
+        else:
+            nucleo = nucleo_con_stop
+        if nucleo == 'eventi':
+            parametri_backtest['indici_segnali'] = indici_segnali
+        trade, equity_values = _esegui_nucleo(
+            nucleo, apertura, massimo, minimo, chiusura, segnali, date_index,
+            stop_loss_percent=stop_loss_percent,
+            take_profit_percent=take_profit_percent,
+            trailing_stop_percent=trailing_stop_percent,
+            **parametri_backtest,
+        )
+        righe_metriche.append(calcola_metriche(trade, equity_values, date_index, capitale_iniziale, metriche_richieste))
+
+    indice = pd.MultiIndex.from_tuples(
+        [tuple(np.nan if valore is None else valore for valore in combinazione) for combinazione in combinazioni],
+        names=['stop_loss_percent', 'take_profit_percent', 'trailing_stop_percent']
+    )
+    return pd.DataFrame(righe_metriche, index=indice)
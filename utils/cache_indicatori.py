@@ -0,0 +1,87 @@
+# cache_indicatori.py
+# Memoizzazione degli indicatori condivisa tra le combinazioni di una stessa ottimizzazione.
+
+import pandas as pd
+
+from utils import strumentazione
+
+
+class CacheIndicatori:
+    """
+    Cache degli indicatori calcolati su un unico set di dati (es. una run di run_optimization).
+
+    La chiave è (nome dell'indicatore, colonne di input, parametri): ad esempio la SMA a 20 periodi
+    della chiusura viene calcolata una sola volta e riutilizzata per tutti i valori degli altri parametri.
+    Le serie restituite sono condivise tra le combinazioni e non vanno modificate sul posto.
+
+    Se una strategia passa un DataFrame con un indice diverso da quello dei dati della cache
+    (es. dati già filtrati), l'indicatore viene calcolato senza usare la cache.
+    """
+
+    def __init__(self, dati: pd.DataFrame = None):
+        """
+        Args:
+            dati (pd.DataFrame, optional): Dati a cui la cache è associata. Se None la cache
+                accetta qualunque DataFrame (l'utilizzatore garantisce che i dati non cambino).
+        """
+        self._indice = dati.index if dati is not None else None
+        self._valori = {}
+        self.calcolati = 0
+        self.riutilizzati = 0
+
+    def __len__(self) -> int:
+        return len(self._valori)
+
+    def svuota(self):
+        """
+        Elimina tutti gli indicatori memorizzati.
+        """
+        self._valori.clear()
+
+    def _compatibile(self, df: pd.DataFrame) -> bool:
+        """
+        True se df ha lo stesso indice dei dati associati alla cache.
+        """
+        if self._indice is None or df.index is self._indice:
+            return True
+        return len(df.index) == len(self._indice) and df.index.equals(self._indice)
+
+    def indicatore(self, nome: str, funzione, df: pd.DataFrame, colonne: tuple, **parametri):
+        """
+        Restituisce funzione(*df[colonne], **parametri), calcolandola solo la prima volta.
+
+        Args:
+            nome (str): Nome dell'indicatore. Se una colonna di input è a sua volta un indicatore
+                (es. la SMA di %D), il nome deve includerne i parametri per non confondere le chiavi.
+            funzione (callable): Funzione di calcolo (es. ta.sma) che riceve le colonne in ordine.
+            df (pd.DataFrame): DataFrame da cui leggere le colonne di input.
+            colonne (tuple): Nomi delle colonne di input.
+            **parametri: Parametri dell'indicatore (parte della chiave).
+
+        Returns:
+            pd.Series | pd.DataFrame: Risultato dell'indicatore.
+        """
+        if not self._compatibile(df):
+            return funzione(*(df[col] for col in colonne), **parametri)
+
+        chiave = (nome, tuple(colonne), tuple(sorted(parametri.items())))
+        try:
+            risultato = self._valori[chiave]
+        except KeyError:
+            risultato = funzione(*(df[col] for col in colonne), **parametri)
+            self._valori[chiave] = risultato
+            self.calcolati += 1
+            strumentazione.conta('indicatori_calcolati')
+        else:
+            self.riutilizzati += 1
+            strumentazione.conta('indicatori_riutilizzati')
+        return risultato
+
+
+def calcola_indicatore(cache: CacheIndicatori, nome: str, funzione, df: pd.DataFrame, colonne: tuple, **parametri):
+    """
+    Calcola un indicatore passando dalla cache se disponibile (cache=None: calcolo diretto).
+    """
+    if cache is None:
+        return funzione(*(df[col] for col in colonne), **parametri)
+    return cache.indicatore(nome, funzione, df, colonne, **parametri)
@@ -0,0 +1,180 @@
+# cache_risultati.py
+# Archivio persistente (SQLite) dei risultati delle combinazioni valutate da run_optimization.
+#
+# Ogni riga è identificata da un "contesto" (impronta dei dati OHLCV + strategia + impronta del codice
+# della strategia e del backtest + impostazioni del backtest) e dai valori dei parametri:
+# un'ottimizzazione interrotta riprende dalle combinazioni mancanti e allargando un range vengono
+# valutati solo i punti nuovi. Modificando il codice cambia il contesto e i vecchi risultati non
+# vengono più riusati.
+
+import hashlib
+import importlib
+import json
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# File usato per default dalla pagina di ottimizzazione (nella cartella da cui si avvia l'app)
+PERCORSO_PREDEFINITO = "risultati_ottimizzazione.sqlite"
+
+# Moduli che, oltre alla strategia, determinano le metriche di ogni combinazione
+MODULI_MOTORE = ('utils.backtesting_engine', 'utils.metriche_backtest')
+
+# Cifre decimali usate per confrontare i parametri float (np.arange produce valori come 2.0000000000000004)
+_DECIMALI_PARAMETRI = 10
+
+# Chiavi cercate per ogni query (le versioni meno recenti di SQLite accettano al massimo 999 variabili)
+_CHIAVI_PER_QUERY = 900
+
+
+def impronta_dati(dati: pd.DataFrame) -> str:
+    """
+    Impronta (SHA-1) dei dati OHLCV: indice, nomi delle colonne e valori.
+    """
+    impronta = hashlib.sha1()
+    impronta.update(repr(list(dati.columns)).encode())
+    impronta.update(pd.util.hash_pandas_object(dati, index=True).to_numpy().tobytes())
+    return impronta.hexdigest()
+
+
+def impronta_codice(*moduli: str) -> str:
+    """
+    Impronta (SHA-1) del codice sorgente dei moduli indicati (nomi importabili, es. 'utils.logica_strategie.cci_sma').
+    """
+    impronta = hashlib.sha1()
+    for nome_modulo in moduli:
+        impronta.update(nome_modulo.encode())
+        file_modulo = getattr(importlib.import_module(nome_modulo), '__file__', None)
+        if file_modulo:
+            impronta.update(Path(file_modulo).read_bytes())
+    return impronta.hexdigest()
+
+
+def _valore_normalizzato(valore):
+    """
+    Converte i valori NumPy in tipi Python e arrotonda i float per avere chiavi stabili.
+    """
+    if isinstance(valore, np.generic):
+        valore = valore.item()
+    if isinstance(valore, float):
+        return round(valore, _DECIMALI_PARAMETRI)
+    return valore
+
+
+def chiave_parametri(parametri: dict) -> str:
+    """
+    Chiave testuale (JSON ordinato) di una combinazione di parametri.
+    """
+    return json.dumps({nome: _valore_normalizzato(v) for nome, v in parametri.items()}, sort_keys=True)
+
+
+class CacheRisultati:
+    """
+    Archivio SQLite dei risultati di ottimizzazione, una riga per (contesto, combinazione di parametri).
+    """
+
+    def __init__(self, percorso: str = PERCORSO_PREDEFINITO):
+        """
+        Args:
+            percorso (str, optional): File SQLite (creato se non esiste).
+        """
+        self.percorso = percorso
+        self._connessione = sqlite3.connect(percorso, timeout=30)
+        self._connessione.execute(
+            "CREATE TABLE IF NOT EXISTS risultati ("
+            " contesto TEXT NOT NULL,"
+            " parametri TEXT NOT NULL,"
+            " risultato TEXT NOT NULL,"
+            " PRIMARY KEY (contesto, parametri))"
+        )
+        self._connessione.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.chiudi()
+        return False
+
+    @staticmethod
+    def contesto(impronta: str, strategia_nome: str, impostazioni: dict, codice: str = None) -> str:
+        """
+        Identificativo del contesto di un'ottimizzazione: dati, strategia, impronta del codice
+        (vedi impronta_codice) e impostazioni del backtest (capitale, commissione, short, SL/TP/TS, metrica, ...).
+        """
+        descrizione = json.dumps(
+            {'dati': impronta, 'strategia': strategia_nome, 'codice': codice,
+             'impostazioni': {nome: _valore_normalizzato(v) for nome, v in impostazioni.items()}},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha1(descrizione.encode()).hexdigest()
+
+    def carica(self, contesto: str) -> dict:
+        """
+        Risultati memorizzati per il contesto.
+
+        Returns:
+            dict: {chiave_parametri: riga dei risultati (dict)}.
+        """
+        righe = self._connessione.execute(
+            "SELECT parametri, risultato FROM risultati WHERE contesto = ?", (contesto,)
+        ).fetchall()
+        return {parametri: json.loads(risultato) for parametri, risultato in righe}
+
+    def cerca(self, contesto: str, chiavi: list) -> dict:
+        """
+        Risultati memorizzati per le sole combinazioni indicate (per le griglie troppo grandi
+        per caricare con carica() tutto il contesto).
+
+        Args:
+            contesto (str): Contesto dell'ottimizzazione.
+            chiavi (list): Chiavi delle combinazioni (vedi chiave_parametri).
+
+        Returns:
+            dict: {chiave_parametri: riga dei risultati (dict)} per le chiavi presenti nell'archivio.
+        """
+        risultati = {}
+        for inizio in range(0, len(chiavi), _CHIAVI_PER_QUERY):
+            blocco = chiavi[inizio:inizio + _CHIAVI_PER_QUERY]
+            righe = self._connessione.execute(
+                "SELECT parametri, risultato FROM risultati WHERE contesto = ? AND parametri IN "
+                f"({', '.join('?' * len(blocco))})", (contesto, *blocco)
+            ).fetchall()
+            risultati.update((parametri, json.loads(risultato)) for parametri, risultato in righe)
+        return risultati
+
+    def salva(self, contesto: str, risultati: list, nomi_parametri: list) -> int:
+        """
+        Memorizza (o sostituisce) le righe dei risultati; la chiave è letta dai nomi_parametri di ogni riga.
+
+        Returns:
+            int: Numero di righe salvate.
+        """
+        righe = [
+            (contesto, chiave_parametri({nome: riga[nome] for nome in nomi_parametri}), json.dumps(riga, default=str))
+            for riga in risultati
+        ]
+        if righe:
+            self._connessione.executemany(
+                "INSERT OR REPLACE INTO risultati (contesto, parametri, risultato) VALUES (?, ?, ?)", righe
+            )
+            self._connessione.commit()
+        return len(righe)
+
+    def elimina(self, contesto: str = None):
+        """
+        Elimina i risultati di un contesto (o tutti se contesto è None).
+        """
+        if contesto is None:
+            self._connessione.execute("DELETE FROM risultati")
+        else:
+            self._connessione.execute("DELETE FROM risultati WHERE contesto = ?", (contesto,))
+        self._connessione.commit()
+
+    def chiudi(self):
+        """
+        Chiude la connessione al file SQLite.
+        """
+        self._connessione.close()
@@ -0,0 +1,260 @@
+# campionamento.py
+# Scelta delle combinazioni di parametri da valutare nell'ottimizzazione.
+#
+# Oltre alla griglia completa (nell'ordine di itertools.product) permette di estrarre N punti ben
+# distribuiti nello spazio dei parametri: casuale uniforme, Latin hypercube e sequenza di Sobol.
+# I punti nel cubo unitario vengono mappati sui valori discreti di ogni parametro (min/max/step),
+# scartando i duplicati; le combinazioni sono prodotte una alla volta senza costruire la griglia.
+# Le combinazioni che violano i vincoli dichiarati della strategia (es. SMA veloce < SMA lenta)
+# vengono saltate prima della valutazione.
+
+import itertools
+import math
+import operator
+
+import numpy as np
+
+METODI_CAMPIONAMENTO = ('griglia', 'casuale', 'lhs', 'sobol')
+
+# Operatori ammessi nei vincoli tra parametri ("constraints" in STRATEGIE_DISPONIBILI)
+OPERATORI_VINCOLI = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '!=': operator.ne,
+}
+
+# Giri di estrazione consecutivi senza nuove combinazioni valide prima di arrendersi
+_MAX_GIRI_SENZA_PROGRESSI = 20
+
+# Numeri di direzione di Joe e Kuo (new-joe-kuo-6.21201) per le dimensioni 2..16:
+# (grado s del polinomio primitivo, coefficienti a, valori iniziali m_1..m_s)
+_DIREZIONI_SOBOL = (
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+)
+_BIT_SOBOL = 32
+MAX_DIMENSIONI_SOBOL = len(_DIREZIONI_SOBOL) + 1
+
+
+def _vettori_direzione_sobol(n_dimensioni: int) -> np.ndarray:
+    """
+    Vettori di direzione (interi a 32 bit) della sequenza di Sobol.
+
+    Returns:
+        np.ndarray: Matrice (n_dimensioni, 32) di uint64.
+    """
+    direzioni = np.zeros((n_dimensioni, _BIT_SOBOL), dtype=np.uint64)
+    # Prima dimensione: sequenza di van der Corput in base 2
+    direzioni[0] = [1 << (_BIT_SOBOL - k) for k in range(1, _BIT_SOBOL + 1)]
+    for dimensione in range(1, n_dimensioni):
+        s, a, m = _DIREZIONI_SOBOL[dimensione - 1]
+        v = [0] * (_BIT_SOBOL + 1)
+        for k in range(1, _BIT_SOBOL + 1):
+            if k <= s:
+                v[k] = m[k - 1] << (_BIT_SOBOL - k)
+            else:
+                v[k] = v[k - s] ^ (v[k - s] >> s)
+                for l in range(1, s):
+                    if (a >> (s - 1 - l)) & 1:
+                        v[k] ^= v[k - l]
+        direzioni[dimensione] = v[1:]
+    return direzioni
+
+
+def punti_sobol(inizio: int, n_punti: int, n_dimensioni: int, spostamento: np.ndarray = None) -> np.ndarray:
+    """
+    Punti inizio..inizio+n_punti-1 della sequenza di Sobol in [0, 1)^n_dimensioni.
+
+    Args:
+        inizio (int): Indice del primo punto (0 = origine).
+        n_punti (int): Numero di punti.
+        n_dimensioni (int): Dimensioni (al massimo MAX_DIMENSIONI_SOBOL).
+        spostamento (np.ndarray, optional): Spostamento digitale (XOR) per dimensione, interi a 32 bit.
+            Mantiene le proprietà di equidistribuzione e rende la sequenza dipendente dal seme.
+
+    Returns:
+        np.ndarray: Matrice (n_punti, n_dimensioni).
+    """
+    direzioni = _vettori_direzione_sobol(n_dimensioni)
+    indici = np.arange(inizio, inizio + n_punti, dtype=np.uint64)
+    codice_gray = indici ^ (indici >> np.uint64(1))
+    interi = np.zeros((n_punti, n_dimensioni), dtype=np.uint64)
+    for bit in range(_BIT_SOBOL):
+        attivi = ((codice_gray >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+        interi[attivi] ^= direzioni[:, bit]
+    if spostamento is not None:
+        interi ^= spostamento
+    return interi.astype(np.float64) / float(1 << _BIT_SOBOL)
+
+
+def punti_latin_hypercube(n_punti: int, n_dimensioni: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Latin hypercube in [0, 1)^n_dimensioni: ogni dimensione ha esattamente un punto per ciascuno
+    degli n_punti intervalli di uguale ampiezza.
+    """
+    strati = np.column_stack([rng.permutation(n_punti) for _ in range(n_dimensioni)])
+    return (strati + rng.random((n_punti, n_dimensioni))) / n_punti
+
+
+def numero_combinazioni(param_values: list) -> int:
+    """
+    Numero di combinazioni della griglia completa.
+    """
+    return math.prod(len(valori) for valori in param_values)
+
+
+def vincoli_applicabili(param_names: list, vincoli: list) -> list:
+    """
+    Vincoli (sinistro, operatore, destro) che riguardano i parametri ottimizzati: gli operandi sono nomi
+    di parametri o numeri. I vincoli su parametri non ottimizzati o con operatore sconosciuto sono ignorati.
+    """
+    applicabili = []
+    for sinistro, simbolo, destro in vincoli or []:
+        if simbolo not in OPERATORI_VINCOLI:
+            print(f"Avviso campionamento: operatore '{simbolo}' non valido nel vincolo ({sinistro} {simbolo} {destro}). Vincolo ignorato.")
+            continue
+        operandi = [o for o in (sinistro, destro) if isinstance(o, str)]
+        if operandi and all(o in param_names for o in operandi):
+            applicabili.append((sinistro, simbolo, destro))
+    return applicabili
+
+
+def crea_filtro_vincoli(param_names: list, vincoli: list):
+    """
+    Funzione combinazione (tuple nell'ordine di param_names) -> bool che verifica i vincoli.
+
+    Returns:
+        callable: Il filtro, oppure None se nessun vincolo riguarda i parametri ottimizzati.
+    """
+    posizioni = {nome: i for i, nome in enumerate(param_names)}
+    controlli = [
+        (OPERATORI_VINCOLI[simbolo],
+         posizioni.get(sinistro) if isinstance(sinistro, str) else None, sinistro,
+         posizioni.get(destro) if isinstance(destro, str) else None, destro)
+        for sinistro, simbolo, destro in vincoli_applicabili(param_names, vincoli)
+    ]
+    if not controlli:
+        return None
+
+    def rispetta_vincoli(combinazione: tuple) -> bool:
+        for confronto, i_sinistro, sinistro, i_destro, destro in controlli:
+            a = combinazione[i_sinistro] if i_sinistro is not None else sinistro
+            b = combinazione[i_destro] if i_destro is not None else destro
+            if not confronto(a, b):
+                return False
+        return True
+    return rispetta_vincoli
+
+
+def numero_combinazioni_valide(param_names: list, param_values: list, vincoli: list) -> int:
+    """
+    Numero di combinazioni della griglia che rispettano i vincoli, calcolato sulla sola griglia
+    dei parametri coinvolti nei vincoli.
+    """
+    vincoli = vincoli_applicabili(param_names, vincoli)
+    coinvolti = sorted({o for vincolo in vincoli for o in (vincolo[0], vincolo[2]) if isinstance(o, str)},
+                       key=param_names.index)
+    if not coinvolti:
+        return numero_combinazioni(param_values)
+    valori_coinvolti = [param_values[param_names.index(nome)] for nome in coinvolti]
+    filtro = crea_filtro_vincoli(coinvolti, vincoli)
+    validi = sum(1 for combinazione in itertools.product(*valori_coinvolti) if filtro(combinazione))
+    altri = numero_combinazioni([v for nome, v in zip(param_names, param_values) if nome not in coinvolti])
+    return validi * altri
+
+
+def campiona_combinazioni(param_values: list, n_combinazioni: int = None, metodo: str = 'griglia', seme: int = None,
+                          vincolo=None):
+    """
+    Combinazioni di parametri da valutare, prodotte una alla volta.
+
+    Args:
+        param_values (list): Per ogni parametro, la lista dei suoi valori possibili.
+        n_combinazioni (int, optional): Numero di combinazioni da produrre (None = tutta la griglia).
+        metodo (str, optional): Uno di METODI_CAMPIONAMENTO:
+            'griglia' = prime n combinazioni nell'ordine di itertools.product (comportamento storico);
+            'casuale' = punti uniformi; 'lhs' = Latin hypercube; 'sobol' = sequenza di Sobol.
+        seme (int, optional): Seme del generatore casuale, per estrazioni riproducibili.
+        vincolo (callable, optional): Filtro delle combinazioni valide (vedi crea_filtro_vincoli); le
+            combinazioni che non lo rispettano vengono saltate e non contano in n_combinazioni.
+
+    Yields:
+        tuple: Combinazioni distinte di valori, nell'ordine dei parametri.
+    """
+    totale = numero_combinazioni(param_values)
+    n_combinazioni = totale if n_combinazioni is None else max(0, min(n_combinazioni, totale))
+    if metodo == 'griglia' or n_combinazioni >= totale:
+        yield from itertools.islice(filter(vincolo, itertools.product(*param_values)), n_combinazioni)
+        return
+
+    rng = np.random.default_rng(seme)
+    livelli = np.array([len(valori) for valori in param_values])
+    n_dimensioni = len(param_values)
+
+    if n_combinazioni * 2 > totale:
+        # Campione denso: estrazione senza ripetizioni degli indici della griglia (già ben distribuita)
+        estratti = []
+        for indice in rng.permutation(totale):
+            combinazione = tuple(valori[int(i)] for valori, i in zip(param_values, np.unravel_index(indice, livelli)))
+            if vincolo is None or vincolo(combinazione):
+                estratti.append((indice, combinazione))
+                if len(estratti) == n_combinazioni:
+                    break
+        for _, combinazione in sorted(estratti):
+            yield combinazione
+        return
+
+    if metodo == 'sobol' and n_dimensioni > MAX_DIMENSIONI_SOBOL:
+        print(f"Avviso campionamento: Sobol supporta al massimo {MAX_DIMENSIONI_SOBOL} parametri. Uso il Latin hypercube.")
+        metodo = 'lhs'
+    spostamento = rng.integers(0, 1 << _BIT_SOBOL, size=n_dimensioni, dtype=np.uint64) if seme is not None else None
+
+    visti = set()           # Posizioni già estratte (valide o no)
+    prodotte = 0
+    prossimo_punto = 0
+    giri_senza_progressi = 0
+    while prodotte < n_combinazioni:
+        # Ogni giro estrae tanti punti quante combinazioni mancano; duplicati e combinazioni
+        # che violano i vincoli vengono scartati
+        mancanti = n_combinazioni - prodotte
+        prodotte_prima = prodotte
+        if metodo == 'sobol':
+            punti = punti_sobol(prossimo_punto, mancanti, n_dimensioni, spostamento)
+            prossimo_punto += mancanti
+        elif metodo == 'lhs':
+            punti = punti_latin_hypercube(mancanti, n_dimensioni, rng)
+        else:
+            punti = rng.random((mancanti, n_dimensioni))
+
+        for posizioni in np.minimum((punti * livelli).astype(np.int64), livelli - 1):
+            chiave = tuple(posizioni.tolist())
+            if chiave in visti:
+                continue
+            visti.add(chiave)
+            combinazione = tuple(valori[i] for valori, i in zip(param_values, chiave))
+            if vincolo is not None and not vincolo(combinazione):
+                continue
+            yield combinazione
+            prodotte += 1
+            if prodotte == n_combinazioni:
+                return
+
+        giri_senza_progressi = giri_senza_progressi + 1 if prodotte == prodotte_prima else 0
+        if giri_senza_progressi >= _MAX_GIRI_SENZA_PROGRESSI:
+            print(f"Avviso campionamento: trovate solo {prodotte} combinazioni valide su {n_combinazioni} richieste.")
+            return
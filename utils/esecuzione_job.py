@@ -0,0 +1,493 @@
+# esecuzione_job.py
+# Esecuzione da riga di comando (senza Streamlit) di backtest e ottimizzazioni descritti in file JSON o TOML.
+#
+# Un file può contenere un job, una lista di job oppure {"jobs": [...]}. Esempio di job (JSON):
+#
+#   {
+#       "nome": "cci_sma_aapl",
+#       "tipo": "ottimizzazione",                  # oppure "backtest", "walk_forward", "portafoglio"
+#       "tickers": ["AAPL", "MSFT"],               # oppure "ticker": "AAPL"
+#       "data_inizio": "2020-01-01",
+#       "data_fine": "2024-12-31",
+#       "file_dati": {"AAPL": "dati/aapl.csv"},    # opzionale: CSV/Parquet locali invece di Yahoo Finance
+#       "strategia": "CCI-SMA",
+#       "griglia": {"cci_length": {"min": 10, "max": 30, "step": 5}},   # default: range di strategies_config
+#       "parametri": {"sma_length": 20},           # parametri fissi (default: valori predefiniti)
+#       "backtest": {"capitale_iniziale": 10000, "commissione_percentuale": 0.1, "abilita_short": true},
+#       "ottimizzazione": {"metodo_campionamento": "sobol", "max_combinazioni": 500, "use_parallel": true},
+#       "walk_forward": {"n_finestre": 5, "rapporto_in_sample": 3, "ancorata": false},
+#       "portafoglio": {"max_posizioni": 10},      # tutti i ticker insieme con capitale condiviso
+#       "output": "risultati/cci_sma_aapl.parquet" # .parquet (tabella + riepilogo JSON) oppure .json
+#   }
+#
+# Uso: python esegui_job.py job.json [altri_job.toml ...] [--processi N] [--cartella-output DIR]
+
+import argparse
+import datetime
+import json
+import math
+import time
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.backtesting_engine import run_backtest, costruisci_trade_log
+from utils.ottimizzazione_engine import run_optimization, _carica_classe_strategia, _prepara_dati_strategia, _genera_dati_backtest
+from utils.ottimizzazione_walk_forward import run_walk_forward
+from utils.portfolio_engine import run_portfolio_backtest, genera_segnali_universo, tabella_trade_portafoglio
+from utils.tabella_risultati import TabellaRisultati
+from utils.strategies_config import STRATEGIE_DISPONIBILI
+
+TIPI_JOB = ('backtest', 'ottimizzazione', 'walk_forward', 'portafoglio')
+
+# Impostazioni del backtest accettate nella sezione "backtest" di un job (con i valori di default)
+IMPOSTAZIONI_BACKTEST = {
+    'capitale_iniziale': 10000.0,
+    'commissione_percentuale': 0.1,
+    'abilita_short': True,
+    'investimento_fisso_per_trade': None,
+    'stop_loss_percent': None,
+    'take_profit_percent': None,
+    'trailing_stop_percent': None,
+}
+
+# Opzioni della sezione "ottimizzazione" valide anche per il walk-forward (combinazioni e processi)
+OPZIONI_WALK_FORWARD = ('max_combinazioni', 'metodo_campionamento', 'seme_campionamento', 'use_parallel', 'n_jobs')
+
+CARTELLA_OUTPUT_PREDEFINITA = 'risultati_job'
+
+
+def carica_job(percorso: str) -> list:
+    """
+    Legge i job da un file JSON o TOML.
+
+    Returns:
+        list: Job (dizionari); quelli senza 'nome' prendono il nome del file (più il numero del job).
+    """
+    percorso = Path(percorso)
+    with open(percorso, 'rb') as file:
+        contenuto = tomllib.load(file) if percorso.suffix.lower() == '.toml' else json.load(file)
+    if isinstance(contenuto, dict):
+        jobs = contenuto['jobs'] if 'jobs' in contenuto else [contenuto]
+    else:
+        jobs = list(contenuto)
+    for numero, job in enumerate(jobs, start=1):
+        job.setdefault('nome', percorso.stem if len(jobs) == 1 else f"{percorso.stem}_{numero}")
+    return jobs
+
+
+def _data(valore) -> datetime.date:
+    """
+    Data di un job: stringa ISO (JSON) oppure data TOML.
+    """
+    if valore is None or isinstance(valore, datetime.date):
+        return valore
+    return datetime.date.fromisoformat(str(valore))
+
+
+def _leggi_dati(job: dict, ticker: str) -> pd.DataFrame:
+    """
+    Dati OHLCV di un ticker: dal file indicato in 'file_dati' (CSV o Parquet) oppure da Yahoo Finance.
+
+    Returns:
+        pd.DataFrame: Dati nel periodo del job, oppure None se non disponibili.
+    """
+    data_inizio, data_fine = _data(job.get('data_inizio')), _data(job.get('data_fine'))
+    file_dati = job.get('file_dati')
+    if isinstance(file_dati, dict):
+        file_dati = file_dati.get(ticker)
+
+    if file_dati:
+        try:
+            if str(file_dati).lower().endswith('.parquet'):
+                dati = pd.read_parquet(file_dati)
+            else:
+                dati = pd.read_csv(file_dati, index_col=0, parse_dates=True)
+        except (OSError, ValueError, ImportError) as e:
+            print(f"Errore job '{job['nome']}': impossibile leggere '{file_dati}' per {ticker}: {e}")
+            return None
+        if data_inizio is not None:
+            dati = dati[dati.index >= pd.Timestamp(data_inizio)]
+        if data_fine is not None:
+            dati = dati[dati.index < pd.Timestamp(data_fine)]
+    else:
+        if data_inizio is None or data_fine is None:
+            print(f"Errore job '{job['nome']}': data_inizio e data_fine sono necessarie per scaricare {ticker}.")
+            return None
+        import yfinance as yf  # Solo se i dati vanno scaricati
+        try:
+            dati = yf.download(ticker, start=data_inizio, end=data_fine, progress=False)
+        except Exception as e:
+            print(f"Errore durante il download dei dati per {ticker} da Yahoo Finance: {e}")
+            return None
+
+    if dati is None or dati.empty:
+        print(f"Avviso job '{job['nome']}': nessun dato per {ticker} nel periodo indicato.")
+        return None
+    if isinstance(dati.columns, pd.MultiIndex):
+        dati = dati.copy()
+        dati.columns = dati.columns.get_level_values(0)
+    return dati
+
+
+def _griglia(job: dict) -> dict:
+    """
+    Griglia dell'ottimizzazione nel formato di run_optimization: quella del job oppure i range
+    configurati per la strategia in STRATEGIE_DISPONIBILI. Con una griglia esplicita i parametri
+    non indicati restano fissi al valore di 'parametri' o al valore predefinito.
+    """
+    parametri = STRATEGIE_DISPONIBILI[job['strategia']]['parameters']
+    griglia_job = job.get('griglia') or {}
+    parametri_fissi = job.get('parametri') or {}
+    griglia = {}
+    for nome, dettagli in parametri.items():
+        voce = griglia_job.get(nome)
+        if voce is None and (griglia_job or nome in parametri_fissi):
+            valore = parametri_fissi.get(nome, dettagli['default'])
+            voce = {'min': valore, 'max': valore}
+        voce = voce or {}
+        griglia[nome] = {
+            'min': voce.get('min', dettagli['min_value']),
+            'max': voce.get('max', dettagli['max_value']),
+            'step': voce.get('step', dettagli['step']),
+            'type': voce.get('type', dettagli['type']),
+        }
+    return griglia
+
+
+def _compatibile_json(valore):
+    """
+    Converte ricorsivamente un valore in tipi serializzabili in JSON (NaN e infiniti diventano null).
+    """
+    if isinstance(valore, dict):
+        return {str(chiave): _compatibile_json(v) for chiave, v in valore.items()}
+    if isinstance(valore, (list, tuple)):
+        return [_compatibile_json(v) for v in valore]
+    if isinstance(valore, np.generic):
+        valore = valore.item()
+    if isinstance(valore, float):
+        return valore if math.isfinite(valore) else None
+    if isinstance(valore, (pd.Timestamp, datetime.date, datetime.datetime)):
+        return valore.isoformat()
+    if isinstance(valore, (str, int, bool)) or valore is None:
+        return valore
+    return str(valore)
+
+
+def _scrivi_risultati(percorso: Path, tabella: pd.DataFrame, riepilogo: dict) -> Path:
+    """
+    Scrive i risultati di un job.
+
+    Con un percorso .parquet la tabella va nel file Parquet e il riepilogo in <nome>_riepilogo.json;
+    altrimenti tabella e riepilogo vanno in un unico file JSON. Se pyarrow (o fastparquet) non è
+    installato si ripiega sul JSON.
+
+    Returns:
+        Path: File principale scritto.
+    """
+    percorso.parent.mkdir(parents=True, exist_ok=True)
+    if percorso.suffix.lower() == '.parquet':
+        try:
+            tabella.to_parquet(percorso, index=False)
+            with open(percorso.with_name(f"{percorso.stem}_riepilogo.json"), 'w', encoding='utf-8') as file:
+                json.dump(_compatibile_json(riepilogo), file, ensure_ascii=False, indent=2)
+            return percorso
+        except ImportError:
+            print("Avviso: scrittura Parquet non disponibile (installare pyarrow). Salvo i risultati in JSON.")
+            percorso = percorso.with_suffix('.json')
+
+    contenuto = _compatibile_json(riepilogo)
+    contenuto['tabella'] = json.loads(tabella.to_json(orient='records', date_format='iso', force_ascii=False))
+    with open(percorso, 'w', encoding='utf-8') as file:
+        json.dump(contenuto, file, ensure_ascii=False, indent=2)
+    return percorso
+
+
+def _esegui_backtest_ticker(job: dict, dati: pd.DataFrame, impostazioni: dict) -> tuple:
+    """
+    Backtest di un ticker con i parametri fissi del job.
+
+    Returns:
+        tuple: (tabella dell'equity, riepilogo del ticker), oppure (None, messaggio di errore).
+    """
+    strategia = STRATEGIE_DISPONIBILI[job['strategia']]
+    parametri = {nome: dettagli['default'] for nome, dettagli in strategia['parameters'].items()}
+    parametri.update(job.get('parametri') or {})
+
+    strategy_class = _carica_classe_strategia(job['strategia'])
+    dati_per_strategia = _prepara_dati_strategia(dati)
+    if strategy_class is None or dati_per_strategia is None:
+        return None, "strategia o dati non validi"
+    dati_per_backtest = _genera_dati_backtest(strategy_class, dati_per_strategia, parametri)
+    if dati_per_backtest is None:
+        return None, "generazione dei segnali non riuscita"
+
+    trades, equity_curve, buy_hold_equity, metriche = run_backtest(dati_per_backtest, **impostazioni)
+    tabella = pd.DataFrame({
+        'Data': equity_curve.index,
+        'Equity': equity_curve.to_numpy(),
+        'Buy & Hold': buy_hold_equity.to_numpy(),
+    })
+    riepilogo = {
+        'parametri': parametri,
+        'metriche': metriche,
+        'trade': costruisci_trade_log(trades, equity_curve, impostazioni['commissione_percentuale']),
+    }
+    return tabella, riepilogo
+
+
+def _esegui_ottimizzazione_ticker(job: dict, dati: pd.DataFrame, impostazioni: dict, opzioni: dict) -> tuple:
+    """
+    Ottimizzazione di un ticker sulla griglia del job.
+
+    Returns:
+        tuple: (tabella di tutte le combinazioni, riepilogo del ticker), oppure (None, messaggio di errore).
+    """
+    best_params, best_results, all_results, _, _, best_trades = run_optimization(
+        dati, job['strategia'], _griglia(job), **impostazioni, **opzioni
+    )
+    if isinstance(all_results, TabellaRisultati):
+        tabella = all_results.to_dataframe()
+    elif isinstance(all_results, pd.DataFrame):
+        tabella = all_results
+    else:
+        tabella = pd.DataFrame(all_results)
+    if tabella.empty or not best_params:
+        return None, "nessuna combinazione valida"
+    riepilogo = {
+        'migliori_parametri': best_params,
+        'metriche_migliori': best_results,
+        'combinazioni_valutate': len(tabella),
+        'trade_migliori': len(best_trades),
+    }
+    return tabella, riepilogo
+
+
+def _esegui_walk_forward_ticker(job: dict, dati: pd.DataFrame, impostazioni: dict, opzioni: dict) -> tuple:
+    """
+    Walk-forward di un ticker sulla griglia del job (opzioni delle finestre nella sezione "walk_forward").
+
+    Returns:
+        tuple: (tabella delle finestre, riepilogo del ticker), oppure (None, messaggio di errore).
+    """
+    opzioni_finestre = job.get('walk_forward') or {}
+    finestre, metriche, equity_curve, buy_hold_equity, trades = run_walk_forward(
+        dati, job['strategia'], _griglia(job), **impostazioni,
+        **{chiave: valore for chiave, valore in opzioni.items() if chiave in OPZIONI_WALK_FORWARD},
+        **{chiave: opzioni_finestre[chiave] for chiave in ('n_finestre', 'rapporto_in_sample', 'ancorata') if chiave in opzioni_finestre}
+    )
+    if finestre.empty:
+        return None, "storico troppo corto o nessuna combinazione valida"
+    riepilogo = {
+        'metriche_oos': metriche,
+        'equity_oos': [
+            {'Data': data, 'Equity': equity, 'Buy & Hold': buy_hold}
+            for data, equity, buy_hold in zip(equity_curve.index, equity_curve.to_numpy(), buy_hold_equity.to_numpy())
+        ],
+        'trade': costruisci_trade_log(trades, equity_curve, impostazioni['commissione_percentuale']),
+    }
+    return finestre, riepilogo
+
+
+def _esegui_portafoglio(job: dict, dati_universo: dict, impostazioni: dict) -> tuple:
+    """
+    Backtest di portafoglio di tutti i ticker del job con i parametri fissi e capitale condiviso
+    (Stop Loss, Take Profit e Trailing Stop non si applicano al portafoglio).
+
+    Returns:
+        tuple: (tabella dell'equity, riepilogo del portafoglio), oppure (None, messaggio di errore).
+    """
+    strategia = STRATEGIE_DISPONIBILI[job['strategia']]
+    parametri = {nome: dettagli['default'] for nome, dettagli in strategia['parameters'].items()}
+    parametri.update(job.get('parametri') or {})
+    ignorate = [chiave for chiave in ('stop_loss_percent', 'take_profit_percent', 'trailing_stop_percent') if impostazioni.get(chiave)]
+    if ignorate:
+        print(f"Avviso job '{job['nome']}': {ignorate} non si applicano al backtest di portafoglio.")
+
+    dati_con_segnali = genera_segnali_universo(dati_universo, job['strategia'], parametri)
+    if not dati_con_segnali:
+        return None, "nessun ticker con segnali validi"
+    trade, equity_curve, buy_hold_equity, metriche = run_portfolio_backtest(
+        dati_con_segnali,
+        capitale_iniziale=impostazioni['capitale_iniziale'],
+        commissione_percentuale=impostazioni['commissione_percentuale'],
+        abilita_short=impostazioni['abilita_short'],
+        investimento_fisso_per_trade=impostazioni['investimento_fisso_per_trade'],
+        **{chiave: valore for chiave, valore in (job.get('portafoglio') or {}).items() if chiave == 'max_posizioni'}
+    )
+    if equity_curve.empty:
+        return None, "backtest di portafoglio non riuscito"
+    tabella = pd.DataFrame({
+        'Data': equity_curve.index,
+        'Equity': equity_curve.to_numpy(),
+        'Buy & Hold': buy_hold_equity.to_numpy(),
+    })
+    tabella_trade = tabella_trade_portafoglio(trade, equity_curve.index)
+    riepilogo = {
+        'parametri': parametri,
+        'ticker_inclusi': list(dati_con_segnali),
+        'metriche': metriche,
+        'trade': json.loads(tabella_trade.to_json(orient='records', date_format='iso', force_ascii=False)),
+    }
+    return tabella, riepilogo
+
+
+def esegui_job(job: dict, cartella_output: str = CARTELLA_OUTPUT_PREDEFINITA, parallelo_consentito: bool = True) -> dict:
+    """
+    Esegue un job di backtest, ottimizzazione o walk-forward su ognuno dei suoi ticker (oppure un backtest
+    di portafoglio su tutti i ticker insieme) e ne scrive i risultati.
+
+    Args:
+        job (dict): Job (vedi l'esempio in testa al modulo).
+        cartella_output (str, optional): Cartella dei risultati se il job non indica 'output'.
+        parallelo_consentito (bool, optional): Se False l'ottimizzazione non usa processi propri
+            (job già eseguiti in parallelo tra loro).
+
+    Returns:
+        dict: Esito del job ('nome', 'stato' = 'completato'/'errore', 'output', 'durata_s', 'messaggio').
+    """
+    inizio = time.time()
+    nome = job.get('nome', 'job')
+    esito = {'nome': nome, 'stato': 'errore', 'output': None, 'durata_s': 0.0, 'messaggio': ''}
+
+    tipo = job.get('tipo', 'ottimizzazione')
+    tickers = job.get('tickers') or ([job['ticker']] if job.get('ticker') else [])
+    if tipo not in TIPI_JOB:
+        esito['messaggio'] = f"tipo '{tipo}' non valido (disponibili: {TIPI_JOB})"
+    elif job.get('strategia') not in STRATEGIE_DISPONIBILI:
+        esito['messaggio'] = f"strategia '{job.get('strategia')}' non trovata nella configurazione"
+    elif not tickers:
+        esito['messaggio'] = "nessun ticker indicato"
+    if esito['messaggio']:
+        print(f"Errore job '{nome}': {esito['messaggio']}.")
+        return esito
+
+    impostazioni = dict(IMPOSTAZIONI_BACKTEST)
+    impostazioni.update({chiave: valore for chiave, valore in (job.get('backtest') or {}).items() if chiave in IMPOSTAZIONI_BACKTEST})
+    opzioni = dict(job.get('ottimizzazione') or {})
+    if not parallelo_consentito and opzioni.get('use_parallel'):
+        print(f"Job '{nome}': job eseguiti in parallelo tra loro, ottimizzazione in un solo processo.")
+        opzioni['use_parallel'] = False
+
+    print(f"Inizio job '{nome}': {tipo} di {job['strategia']} su {', '.join(tickers)}")
+    tabelle = []
+    riepilogo = {'job': job, 'ticker': {}}
+    dati_universo = {}
+    for ticker in tickers:
+        dati = _leggi_dati(job, ticker)
+        if dati is None:
+            riepilogo['ticker'][ticker] = {'errore': 'dati non disponibili'}
+            continue
+        if tipo == 'portafoglio':
+            dati_universo[ticker] = dati  # Simulati tutti insieme dopo il caricamento
+            continue
+        try:
+            if tipo == 'backtest':
+                tabella, riepilogo_ticker = _esegui_backtest_ticker(job, dati, impostazioni)
+            elif tipo == 'walk_forward':
+                tabella, riepilogo_ticker = _esegui_walk_forward_ticker(job, dati, impostazioni, opzioni)
+            else:
+                tabella, riepilogo_ticker = _esegui_ottimizzazione_ticker(job, dati, impostazioni, opzioni)
+        except Exception as e:
+            tabella, riepilogo_ticker = None, f"{type(e).__name__}: {e}"
+        if tabella is None:
+            print(f"Avviso job '{nome}': {ticker} non elaborato ({riepilogo_ticker}).")
+            riepilogo['ticker'][ticker] = {'errore': riepilogo_ticker}
+            continue
+        tabella.insert(0, 'Ticker', ticker)
+        tabelle.append(tabella)
+        riepilogo['ticker'][ticker] = riepilogo_ticker
+
+    if dati_universo:
+        try:
+            tabella, riepilogo_portafoglio = _esegui_portafoglio(job, dati_universo, impostazioni)
+        except Exception as e:
+            tabella, riepilogo_portafoglio = None, f"{type(e).__name__}: {e}"
+        if tabella is None:
+            print(f"Avviso job '{nome}': portafoglio non elaborato ({riepilogo_portafoglio}).")
+            riepilogo['portafoglio'] = {'errore': riepilogo_portafoglio}
+        else:
+            tabelle.append(tabella)
+            riepilogo['portafoglio'] = riepilogo_portafoglio
+
+    if not tabelle:
+        esito['messaggio'] = "nessun ticker elaborato"
+    else:
+        percorso = Path(job.get('output') or Path(cartella_output) / f"{nome}.json")
+        try:
+            esito['output'] = str(_scrivi_risultati(percorso, pd.concat(tabelle, ignore_index=True), riepilogo))
+            esito['stato'] = 'completato'
+        except Exception as e:
+            esito['messaggio'] = f"scrittura dei risultati non riuscita: {e}"
+    esito['durata_s'] = round(time.time() - inizio, 2)
+    print(f"Job '{nome}' {esito['stato']} in {esito['durata_s']:.2f} secondi"
+          + (f": {esito['output']}" if esito['output'] else f" ({esito['messaggio']})"))
+    return esito
+
+
+def esegui_lotto(jobs: list, n_processi: int = 1, cartella_output: str = CARTELLA_OUTPUT_PREDEFINITA) -> list:
+    """
+    Esegue una lista di job, in parallelo su n_processi processi locali se n_processi > 1.
+
+    Con più processi ogni job gira in un solo processo (use_parallel viene ignorato), per non
+    moltiplicare i processi dell'ottimizzazione per quelli del lotto.
+
+    Returns:
+        list: Esiti dei job (vedi esegui_job), nell'ordine dei job.
+    """
+    def _esito_errore(job: dict, errore: Exception) -> dict:
+        nome = job.get('nome', 'job')
+        print(f"Errore job '{nome}': {errore}")
+        return {'nome': nome, 'stato': 'errore', 'output': None, 'durata_s': 0.0, 'messaggio': str(errore)}
+
+    esiti = []
+    if n_processi <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            try:
+                esiti.append(esegui_job(job, cartella_output))
+            except Exception as e:
+                esiti.append(_esito_errore(job, e))
+        return esiti
+
+    with ProcessPoolExecutor(max_workers=min(n_processi, len(jobs))) as executor:
+        futures = [executor.submit(esegui_job, job, cartella_output, False) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                esiti.append(future.result())
+            except Exception as e:
+                esiti.append(_esito_errore(job, e))
+    return esiti
+
+
+def main(argv: list = None) -> int:
+    """
+    Punto d'ingresso da riga di comando.
+
+    Returns:
+        int: Codice di uscita (0 se tutti i job sono completati, 1 altrimenti).
+    """
+    parser = argparse.ArgumentParser(description="Esegue backtest e ottimizzazioni descritti in file JSON o TOML, senza Streamlit.")
+    parser.add_argument('file_job', nargs='+', help="File JSON o TOML con uno o più job.")
+    parser.add_argument('--processi', type=int, default=1, help="Job eseguiti in parallelo (default: 1).")
+    parser.add_argument('--cartella-output', default=CARTELLA_OUTPUT_PREDEFINITA,
+                        help=f"Cartella dei risultati per i job senza 'output' (default: {CARTELLA_OUTPUT_PREDEFINITA}).")
+    argomenti = parser.parse_args(argv)
+
+    jobs = []
+    for percorso in argomenti.file_job:
+        try:
+            jobs.extend(carica_job(percorso))
+        except (OSError, ValueError, tomllib.TOMLDecodeError) as e:
+            print(f"Errore: impossibile leggere i job da '{percorso}': {e}")
+            return 1
+
+    esiti = esegui_lotto(jobs, argomenti.processi, argomenti.cartella_output)
+    completati = sum(esito['stato'] == 'completato' for esito in esiti)
+    print(f"Job completati: {completati}/{len(esiti)}")
+    for esito in esiti:
+        if esito['stato'] != 'completato':
+            print(f"  {esito['nome']}: {esito['messaggio']}")
+    return 0 if completati == len(esiti) else 1
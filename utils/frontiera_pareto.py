@@ -0,0 +1,104 @@
+# frontiera_pareto.py
+# Ottimizzazione multi-obiettivo: fronte di Pareto (combinazioni non dominate) dei risultati.
+#
+# Invece di un solo vincitore secondo metrica_ottimizzazione, si tengono più obiettivi (es. rendimento,
+# max drawdown, Sharpe) e si cercano le combinazioni per cui nessun'altra è almeno altrettanto buona
+# su tutti gli obiettivi e migliore su almeno uno. Il confronto è vettoriale in NumPy: ogni passo
+# confronta un punto del fronte con tutti i candidati rimasti in un'unica operazione, quindi i passi
+# sono tanti quanti i punti del fronte e non quante le coppie di combinazioni.
+
+import numpy as np
+import pandas as pd
+
+from utils.tabella_risultati import TabellaRisultati
+
+# Obiettivi proposti di default: nome della metrica -> 'max' (da massimizzare) o 'min' (da minimizzare)
+OBIETTIVI_PREDEFINITI = {
+    'Rendimento della strategia (%)': 'max',
+    'Max Drawdown (%)': 'min',
+    'Ratio Sharpe': 'max',
+}
+
+# Metriche per cui un valore più basso è migliore (direzione usata se non indicata esplicitamente)
+METRICHE_DA_MINIMIZZARE = {
+    'Max Drawdown (€)',
+    'Max Drawdown (%)',
+    'Durata Media Trade (giorni)',
+}
+
+
+def maschera_non_dominati(valori: np.ndarray, massimizza) -> np.ndarray:
+    """
+    Individua i punti non dominati (fronte di Pareto).
+
+    Un punto è dominato se un altro punto è almeno altrettanto buono su tutti gli obiettivi e migliore
+    su almeno uno. I punti con valori mancanti (NaN) o infiniti non fanno parte del fronte; i punti
+    identici fanno parte del fronte tutti o nessuno.
+
+    Args:
+        valori (np.ndarray): Matrice (punti x obiettivi) dei valori degli obiettivi.
+        massimizza (sequence): Per ogni obiettivo True se va massimizzato, False se va minimizzato.
+
+    Returns:
+        np.ndarray: Maschera booleana dei punti sul fronte.
+    """
+    valori = np.asarray(valori, dtype=float)
+    if valori.ndim == 1:
+        valori = valori[:, np.newaxis]
+    maschera = np.zeros(len(valori), dtype=bool)
+    # Tutti gli obiettivi da massimizzare
+    punti = np.where(np.asarray(massimizza, dtype=bool), valori, -valori)
+    validi = np.flatnonzero(np.isfinite(punti).all(axis=1))
+    if validi.size == 0:
+        return maschera
+
+    # Ordine lessicografico decrescente: chi domina un punto lo precede, quindi il primo candidato
+    # rimasto non è mai dominato
+    candidati = validi[np.lexsort(-punti[validi].T[::-1])]
+    while candidati.size:
+        punto = punti[candidati[0]]
+        resto = punti[candidati]
+        uguali = (resto == punto).all(axis=1)
+        dominati = (resto <= punto).all(axis=1) & ~uguali
+        maschera[candidati[uguali]] = True
+        candidati = candidati[~(uguali | dominati)]
+    return maschera
+
+
+def fronte_pareto(risultati, obiettivi=None) -> pd.DataFrame:
+    """
+    Fronte di Pareto dei risultati di un'ottimizzazione.
+
+    Args:
+        risultati (list | TabellaRisultati | pd.DataFrame): all_results di run_optimization
+            (o di un'altra modalità di ottimizzazione).
+        obiettivi (dict | list, optional): Metriche da considerare, come dizionario nome -> 'max'/'min'
+            oppure lista di nomi (direzione 'min' per METRICHE_DA_MINIMIZZARE, 'max' per le altre).
+            Default: OBIETTIVI_PREDEFINITI.
+
+    Returns:
+        pd.DataFrame: Righe dei risultati sul fronte, ordinate per il primo obiettivo (dal migliore).
+            DataFrame vuoto se nessun obiettivo è presente nei risultati.
+    """
+    if isinstance(risultati, TabellaRisultati):
+        tabella = risultati.to_dataframe()
+    elif isinstance(risultati, pd.DataFrame):
+        tabella = risultati
+    else:
+        tabella = pd.DataFrame(list(risultati))
+    if obiettivi is None:
+        obiettivi = OBIETTIVI_PREDEFINITI
+    if not isinstance(obiettivi, dict):
+        obiettivi = {nome: 'min' if nome in METRICHE_DA_MINIMIZZARE else 'max' for nome in obiettivi}
+
+    mancanti = [nome for nome in obiettivi if nome not in tabella.columns]
+    if mancanti:
+        print(f"Avviso ottimizzazione: obiettivi non presenti nei risultati e ignorati: {mancanti}")
+    obiettivi = {nome: direzione for nome, direzione in obiettivi.items() if nome in tabella.columns}
+    if not obiettivi or tabella.empty:
+        return pd.DataFrame()
+
+    valori = tabella[list(obiettivi)].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    maschera = maschera_non_dominati(valori, [direzione == 'max' for direzione in obiettivi.values()])
+    primo, direzione = next(iter(obiettivi.items()))
+    return tabella[maschera].sort_values(primo, ascending=direzione != 'max', kind='stable').reset_index(drop=True)
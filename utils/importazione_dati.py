@@ -59,6 +59,44 @@ def download_stock_data(ticker_symbol: str, start_date: datetime.date, end_date:
         st.error(f"Errore durante il download dei dati per {ticker_symbol} da Yahoo Finance: {e}")
         return None
 
+@st.cache_data(ttl=3600)
+def download_universe_data(ticker_symbols: list, start_date: datetime.date, end_date: datetime.date):
+    """
+    Scarica in un'unica richiesta i dati storici di più titoli (es. tutto tickers.csv) per il backtest di portafoglio.
+
+    Args:
+        ticker_symbols (list): Simboli dei titoli azionari.
+        start_date (datetime.date): La data di inizio per i dati.
+        end_date (datetime.date): La data di fine per i dati.
+
+    Returns:
+        dict: {simbolo: DataFrame OHLCV}; i simboli senza dati vengono esclusi.
+    """
+    if not ticker_symbols or start_date >= end_date:
+        st.warning("Lista di titoli vuota o intervallo di date non valido.")
+        return {}
+
+    try:
+        data = yf.download(list(ticker_symbols), start=start_date, end=end_date, group_by='ticker')
+    except Exception as e:
+        st.error(f"Errore durante il download dei dati da Yahoo Finance: {e}")
+        return {}
+
+    dati_per_ticker = {}
+    for symbol in ticker_symbols:
+        if isinstance(data.columns, pd.MultiIndex):
+            if symbol not in data.columns.get_level_values(0):
+                continue
+            df = data[symbol].dropna(how='all')
+        else:
+            df = data.dropna(how='all')
+        if not df.empty:
+            dati_per_ticker[symbol] = df
+    mancanti = [s for s in ticker_symbols if s not in dati_per_ticker]
+    if mancanti:
+        st.warning(f"Nessun dato trovato per: {', '.join(mancanti)}")
+    return dati_per_ticker
+
 # Funzione per ottenere la lista dei simboli e nomi per la selezione in Streamlit
 def get_ticker_list_for_selection(file_path="tickers.csv"):
     """
@@ -5,6 +5,8 @@ import pandas as pd
 import numpy as np
 import pandas_ta as ta
 
+from utils.cache_indicatori import CacheIndicatori, calcola_indicatore
+
 class CciSmaStrategy:
     """
     Implementa la strategia di trading CCI-SMA.
@@ -39,7 +41,7 @@ class CciSmaStrategy:
                 "label": "Lunghezza SMA"
             }
         }
-    def __init__(self, df: pd.DataFrame, cci_length: int, sma_length: int):
+    def __init__(self, df: pd.DataFrame, cci_length: int, sma_length: int, cache_indicatori: CacheIndicatori = None):
         """
         Inizializza la strategia con i dati e i parametri.
 
@@ -47,8 +49,11 @@ class CciSmaStrategy:
             df (pd.DataFrame): DataFrame di input con dati OHLCV (colonne 'Open', 'High', 'Low', 'Close', 'Volume').
             cci_length (int): Periodo per il calcolo del CCI.
             sma_length (int): Periodo per il calcolo della SMA.
+            cache_indicatori (CacheIndicatori, optional): Cache degli indicatori condivisa tra più istanze
+                (es. durante un'ottimizzazione). None = calcolo diretto.
         """
-        self.df = df.copy()
+        self.df = df  # generate_signals lavora su una copia
+        self.cache_indicatori = cache_indicatori
         
         # Verifica che i parametri siano validi
         if cci_length <= 0:
@@ -85,9 +90,6 @@ class CciSmaStrategy:
                 new_columns.append(str(col).upper())
         df_working.columns = new_columns
 
-        # Stampa le colonne disponibili per debug
-        print(f"Colonne disponibili nel DataFrame: {df_working.columns.tolist()}")
-        
         # Verifica se le colonne sono in formato misto (alcune maiuscole, alcune minuscole)
         mixed_case_cols = {col.upper(): col for col in df_working.columns if col.upper() != col}
         if mixed_case_cols:
@@ -116,8 +118,8 @@ class CciSmaStrategy:
                 return pd.DataFrame()
                 
             # Calcola gli indicatori
-            df_working['CCI'] = ta.cci(df_working['HIGH'], df_working['LOW'], df_working['CLOSE'], length=self.cci_length)
-            df_working['SMA'] = ta.sma(df_working['CLOSE'], length=self.sma_length)
+            df_working['CCI'] = calcola_indicatore(self.cache_indicatori, 'cci', ta.cci, df_working, ('HIGH', 'LOW', 'CLOSE'), length=self.cci_length)
+            df_working['SMA'] = calcola_indicatore(self.cache_indicatori, 'sma', ta.sma, df_working, ('CLOSE',), length=self.sma_length)
         except Exception as e:
             print(f"Errore nel calcolo degli indicatori per CCI-SMA: {e}")
             return pd.DataFrame()
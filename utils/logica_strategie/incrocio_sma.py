@@ -3,6 +3,8 @@
 import pandas as pd
 import pandas_ta as ta
 
+from utils.cache_indicatori import CacheIndicatori, calcola_indicatore
+
 class IncrocioSmaStrategy: # <-- NOME DELLA CLASSE: sarà usato in strategies_config.py
     """
     Implementa la strategia di trading basata sull'incrocio di due Medie Mobili Semplici (SMA).
@@ -34,7 +36,7 @@ class IncrocioSmaStrategy: # <-- NOME DELLA CLASSE: sarà usato in strategies_co
                 "label": "SMA Lenta"
             }
         }
-    def __init__(self, df: pd.DataFrame, short_sma_length: int, long_sma_length: int):
+    def __init__(self, df: pd.DataFrame, short_sma_length: int, long_sma_length: int, cache_indicatori: CacheIndicatori = None):
         """
         Inizializza la strategia con i dati e i parametri.
 
@@ -42,8 +44,11 @@ class IncrocioSmaStrategy: # <-- NOME DELLA CLASSE: sarà usato in strategies_co
             df (pd.DataFrame): DataFrame di input con dati OHLCV (colonne 'Open', 'High', 'Low', 'Close', 'Volume').
             short_sma_length (int): Periodo per la SMA veloce.
             long_sma_length (int): Periodo per la SMA lenta.
+            cache_indicatori (CacheIndicatori, optional): Cache degli indicatori condivisa tra più istanze
+                (es. durante un'ottimizzazione). None = calcolo diretto.
         """
-        self.df = df.copy() # Lavora su una copia del DataFrame originale
+        self.df = df  # generate_signals lavora su una copia
+        self.cache_indicatori = cache_indicatori
         self.short_sma_length = short_sma_length
         self.long_sma_length = long_sma_length
         self.processed_df = None
@@ -75,8 +80,8 @@ class IncrocioSmaStrategy: # <-- NOME DELLA CLASSE: sarà usato in strategies_co
 
         # --- Calcolo degli Indicatori ---
         try:
-            df_working['SMA_Short'] = ta.sma(df_working['CLOSE'], length=self.short_sma_length)
-            df_working['SMA_Long'] = ta.sma(df_working['CLOSE'], length=self.long_sma_length)
+            df_working['SMA_Short'] = calcola_indicatore(self.cache_indicatori, 'sma', ta.sma, df_working, ('CLOSE',), length=self.short_sma_length)
+            df_working['SMA_Long'] = calcola_indicatore(self.cache_indicatori, 'sma', ta.sma, df_working, ('CLOSE',), length=self.long_sma_length)
         except Exception as e:
             print(f"Errore nel calcolo delle SMA per Incrocio Medie Mobili: {e}")
             return pd.DataFrame()
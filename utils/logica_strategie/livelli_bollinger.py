@@ -4,11 +4,14 @@ import pandas as pd
 import numpy as np
 import pandas_ta as ta # Utilizziamo la libreria pandas_ta per calcolare le Bande di Bollinger
 
+from utils.cache_indicatori import CacheIndicatori, calcola_indicatore
+
 # Definizione della strategia basata sui crossover del prezzo di chiusura con le Bande di Bollinger.
 
 class LivelliBollingerStrategy:
-    def __init__(self, df: pd.DataFrame = None, length: int = 20, std: float = 2.0):
+    def __init__(self, df: pd.DataFrame = None, length: int = 20, std: float = 2.0, cache_indicatori: CacheIndicatori = None):
         self.df = df
+        self.cache_indicatori = cache_indicatori  # Cache condivisa tra più istanze (es. in ottimizzazione)
         self.length = length
         self.std = std
         self.indicator_cols = []
@@ -54,8 +57,8 @@ class LivelliBollingerStrategy:
         try:
             # Calcola le Bande di Bollinger utilizzando pandas_ta
             # Usa il metodo bbands() che restituisce un DataFrame con le bande
-            bbands = ta.bbands(
-                close=df_working['CLOSE'],
+            bbands = calcola_indicatore(
+                self.cache_indicatori, 'bbands', ta.bbands, df_working, ('CLOSE',),
                 length=self.length,
                 std=self.std
             )
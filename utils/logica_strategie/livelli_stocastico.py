@@ -3,6 +3,8 @@
 import pandas as pd
 import pandas_ta as ta
 
+from utils.cache_indicatori import CacheIndicatori, calcola_indicatore
+
 class LivelliStocasticoStrategy: # <-- NOME DELLA CLASSE: sarà usato in strategies_config.py
     """
     Implementa la strategia basata sull'Oscillatore Stocastico.
@@ -60,7 +62,8 @@ class LivelliStocasticoStrategy: # <-- NOME DELLA CLASSE: sarà usato in strateg
                 "label": "Soglia Sell"
             }
         }
-    def __init__(self, df: pd.DataFrame, periodo_k: int, periodo_d: int, periodo_dd: int, soglia_buy: int, soglia_sell: int):
+    def __init__(self, df: pd.DataFrame, periodo_k: int, periodo_d: int, periodo_dd: int, soglia_buy: int, soglia_sell: int,
+                 cache_indicatori: CacheIndicatori = None):
         """
         Inizializza la strategia con i dati e i parametri specifici per lo Stocastico.
 
@@ -71,8 +74,11 @@ class LivelliStocasticoStrategy: # <-- NOME DELLA CLASSE: sarà usato in strateg
             periodo_dd (int): Periodo per il calcolo di %DD (SMA di %D).
             soglia_buy (int): Livello sotto il quale si cerca un segnale di acquisto.
             soglia_sell (int): Livello sopra il quale si cerca un segnale di vendita.
+            cache_indicatori (CacheIndicatori, optional): Cache degli indicatori condivisa tra più istanze
+                (es. durante un'ottimizzazione). None = calcolo diretto.
         """
-        self.df = df.copy()
+        self.df = df  # generate_signals lavora su una copia
+        self.cache_indicatori = cache_indicatori
         self.periodo_k = periodo_k
         self.periodo_d = periodo_d
         self.periodo_dd = periodo_dd # Questa è la media mobile di %D
@@ -111,10 +117,8 @@ class LivelliStocasticoStrategy: # <-- NOME DELLA CLASSE: sarà usato in strateg
         try:
             # Calcola l'Oscillatore Stocastico con %K e %D
             # pandas_ta restituisce un DataFrame con colonne tipo STOCHk_14_3_3 e STOCHd_14_3_3
-            stoch_data = ta.stoch(
-                high=df_working['HIGH'],
-                low=df_working['LOW'],
-                close=df_working['CLOSE'],
+            stoch_data = calcola_indicatore(
+                self.cache_indicatori, 'stoch', ta.stoch, df_working, ('HIGH', 'LOW', 'CLOSE'),
                 k=self.periodo_k,
                 d=self.periodo_d,
                 append=False
@@ -127,7 +131,11 @@ class LivelliStocasticoStrategy: # <-- NOME DELLA CLASSE: sarà usato in strateg
             df_working['%D'] = stoch_data[d_col]
 
             # Calcola %DD (media mobile di %D)
-            df_working['%DD'] = ta.sma(df_working['%D'], length=self.periodo_dd)
+            # (%D dipende da periodo_k e periodo_d: fanno parte del nome nella cache)
+            df_working['%DD'] = calcola_indicatore(
+                self.cache_indicatori, f'sma_stoch_{self.periodo_k}_{self.periodo_d}', ta.sma, df_working, ('%D',),
+                length=self.periodo_dd
+            )
 
         except Exception as e:
             print(f"Errore nel calcolo degli indicatori Stocastico: {e}")
@@ -5,6 +5,8 @@ import pandas as pd
 import numpy as np
 import pandas_ta as ta
 
+from utils.cache_indicatori import CacheIndicatori, calcola_indicatore
+
 class SupertrendStrategy:
     """
     Implementa la strategia di trading basata sull'indicatore Supertrend.
@@ -43,7 +45,7 @@ class SupertrendStrategy:
             }
         }
     
-    def __init__(self, df: pd.DataFrame, period: int, multiplier: float):
+    def __init__(self, df: pd.DataFrame, period: int, multiplier: float, cache_indicatori: CacheIndicatori = None):
         """
         Inizializza la strategia con i dati e i parametri.
 
@@ -51,8 +53,11 @@ class SupertrendStrategy:
             df (pd.DataFrame): DataFrame di input con dati OHLCV.
             period (int): Periodo per il calcolo dell'ATR.
             multiplier (float): Moltiplicatore per l'ATR.
+            cache_indicatori (CacheIndicatori, optional): Cache degli indicatori condivisa tra più istanze
+                (es. durante un'ottimizzazione). None = calcolo diretto.
         """
-        self.df = df.copy()  # Lavora su una copia del DataFrame originale
+        self.df = df  # generate_signals lavora su una copia
+        self.cache_indicatori = cache_indicatori
         self.period = period
         self.multiplier = multiplier
         self.processed_df = None
@@ -78,11 +83,9 @@ class SupertrendStrategy:
         # --- Calcolo dell'indicatore Supertrend ---
         try:
             # Calcola il Supertrend usando pandas-ta
-            supertrend = ta.supertrend(
-                high=df_working['HIGH'], 
-                low=df_working['LOW'], 
-                close=df_working['CLOSE'], 
-                length=self.period, 
+            supertrend = calcola_indicatore(
+                self.cache_indicatori, 'supertrend', ta.supertrend, df_working, ('HIGH', 'LOW', 'CLOSE'),
+                length=self.period,
                 multiplier=self.multiplier
             )
             
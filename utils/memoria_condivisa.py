@@ -0,0 +1,101 @@
+# memoria_condivisa.py
+# Dati OHLCV in multiprocessing.shared_memory per i worker dell'ottimizzazione parallela.
+#
+# Il processo principale copia una sola volta prezzi e indice in un blocco di memoria condivisa;
+# i worker vi si collegano senza copie e ricevono solo un piccolo descrittore (nome del blocco,
+# forma, colonne), invece di ricevere il DataFrame serializzato a ogni task.
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+def _collega_blocco(nome: str) -> shared_memory.SharedMemory:
+    """
+    Si collega a un blocco esistente senza registrarlo nel resource tracker del worker
+    (altrimenti il blocco verrebbe rimosso all'uscita del primo worker).
+    """
+    try:
+        return shared_memory.SharedMemory(name=nome, track=False)  # Python >= 3.13
+    except TypeError:
+        blocco = shared_memory.SharedMemory(name=nome)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(blocco._name, 'shared_memory')
+        except Exception:
+            pass
+        return blocco
+
+
+class DatiCondivisi:
+    """
+    DataFrame numerico (valori float64 + DatetimeIndex) copiato in memoria condivisa.
+
+    Uso nel processo principale:
+        with DatiCondivisi(df) as condivisi:
+            descrittore = condivisi.descrittore   # da passare ai worker
+    Nei worker:
+        blocco, df = DatiCondivisi.collega(descrittore)   # tenere un riferimento a `blocco`
+    """
+
+    def __init__(self, dati: pd.DataFrame):
+        """
+        Args:
+            dati (pd.DataFrame): Dati con colonne numeriche e indice temporale.
+        """
+        indice = dati.index if isinstance(dati.index, pd.DatetimeIndex) else pd.to_datetime(dati.index)
+        fuso_orario = str(indice.tz) if indice.tz is not None else None
+        if fuso_orario is not None:
+            indice = indice.tz_convert('UTC').tz_localize(None)
+        valori_indice = indice.to_numpy()
+        valori = np.ascontiguousarray(dati.to_numpy(dtype=np.float64))
+
+        dimensione = max(1, valori.nbytes + valori_indice.nbytes)
+        self._blocco = shared_memory.SharedMemory(create=True, size=dimensione)
+        np.ndarray(valori.shape, dtype=np.float64, buffer=self._blocco.buf)[...] = valori
+        np.ndarray(valori_indice.shape, dtype=valori_indice.dtype, buffer=self._blocco.buf, offset=valori.nbytes)[...] = valori_indice
+
+        self.descrittore = {
+            'nome': self._blocco.name,
+            'forma': valori.shape,
+            'dtype_indice': valori_indice.dtype.str,
+            'fuso_orario': fuso_orario,
+            'colonne': list(dati.columns),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.rilascia()
+        return False
+
+    def rilascia(self):
+        """
+        Chiude e rimuove il blocco di memoria condivisa (da chiamare nel processo principale).
+        """
+        if self._blocco is not None:
+            self._blocco.close()
+            self._blocco.unlink()
+            self._blocco = None
+
+    @staticmethod
+    def collega(descrittore: dict) -> tuple[shared_memory.SharedMemory, pd.DataFrame]:
+        """
+        Ricostruisce il DataFrame sui dati condivisi, senza copiarli.
+
+        Returns:
+            tuple: (blocco, DataFrame). Il blocco va tenuto in vita finché il DataFrame è in uso.
+        """
+        blocco = _collega_blocco(descrittore['nome'])
+        n_righe, n_colonne = descrittore['forma']
+        valori = np.ndarray((n_righe, n_colonne), dtype=np.float64, buffer=blocco.buf)
+        valori_indice = np.ndarray(
+            (n_righe,), dtype=np.dtype(descrittore['dtype_indice']), buffer=blocco.buf, offset=valori.nbytes
+        )
+        indice = pd.DatetimeIndex(valori_indice)
+        if descrittore['fuso_orario'] is not None:
+            indice = indice.tz_localize('UTC').tz_convert(descrittore['fuso_orario'])
+        dati = pd.DataFrame(valori, index=indice, columns=descrittore['colonne'], copy=False)
+        return blocco, dati
@@ -0,0 +1,289 @@
+# metriche_backtest.py
+# Metriche di performance del backtest calcolate direttamente su array NumPy.
+
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from utils import strumentazione
+
+# Tutte le metriche disponibili, nello stesso ordine di 2_Testa_Strategie.py
+METRICHE_DISPONIBILI = (
+    'Capitale Finale (€)',
+    'Profitto/Perdita Totale (€)',
+    'Profitto/Perdita Totale (%)',
+    'Giorni Totali',
+    'Rendimento Medio Annuale (%)',
+    'Numero Totale di Trade',
+    'Num. Trade Vincenti',
+    'Num. Trade Perdenti',
+    'Percentuale Trade Vincenti',
+    'Num. Trade Long',
+    'P/L Medio Trade Long (%)',
+    'Num. Trade Short',
+    'P/L Medio Trade Short (%)',
+    'Profitto Medio Trade Vincenti (€)',
+    'Profitto Medio Trade Vincenti (%)',
+    'Perdita Media Trade Perdenti (€)',
+    'Perdita Media Trade Perdenti (%)',
+    'Profitto Massimo Trade (€)',
+    'Profitto Massimo Trade (%)',
+    'Data Profitto Massimo',
+    'Perdita Massima Trade (€)',
+    'Perdita Massima Trade (%)',
+    'Data Perdita Massima',
+    'Durata Media Trade (giorni)',
+    'Max Drawdown (€)',
+    'Max Drawdown (%)',
+    'Ratio Sharpe',
+    'Ratio Sortino',
+    'Ratio Calmar',
+)
+
+
+def rendimenti_giornalieri(equity_values: np.ndarray, capitale_iniziale: float) -> np.ndarray:
+    """
+    Rendimenti giornalieri dell'equity: il primo è riferito al capitale iniziale e si escludono
+    i giorni con capitale precedente nullo.
+    """
+    equity_precedente = np.concatenate(([capitale_iniziale], equity_values[:-1]))
+    mask_rendimenti = equity_precedente != 0
+    return (equity_values[mask_rendimenti] - equity_precedente[mask_rendimenti]) / equity_precedente[mask_rendimenti]
+
+
+class _ContestoMetriche:
+    """
+    Grandezze intermedie condivise tra le metriche, calcolate solo alla prima richiesta.
+
+    Ogni metrica legge da qui ciò che le serve: se viene richiesta solo una metrica sull'equity,
+    le statistiche dei trade (e viceversa) non vengono mai calcolate.
+    """
+
+    def __init__(self, trade: np.ndarray, equity_values: np.ndarray, date_index: pd.DatetimeIndex, capitale_iniziale: float):
+        self.trade = trade
+        self.equity = equity_values
+        self.date_index = date_index
+        self.capitale = capitale_iniziale
+
+    # --- Equity ---
+    @cached_property
+    def equity_finale(self):
+        # Equity finale (valutata prima dei segnali dell'ultimo giorno, come nel calcolo originale)
+        return self.equity[-1]
+
+    @cached_property
+    def pnl_totale(self):
+        return self.equity_finale - self.capitale
+
+    @cached_property
+    def giorni_totali(self) -> int:
+        return (self.date_index[-1] - self.date_index[0]).days
+
+    @cached_property
+    def rendimenti(self) -> np.ndarray:
+        return rendimenti_giornalieri(self.equity, self.capitale)
+
+    @cached_property
+    def drawdown(self) -> tuple:
+        # (Max Drawdown in valore assoluto, Max Drawdown in percentuale)
+        if len(self.equity) == 0:
+            return 0.0, 0.0
+        massimo_cumulato = np.maximum.accumulate(self.equity)
+        distanza = massimo_cumulato - self.equity
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drawdown = distanza / massimo_cumulato
+        drawdown = drawdown[~np.isnan(drawdown)]
+        drawdown_percent = drawdown.max() * 100 if len(drawdown) else np.nan
+        return distanza.max(), drawdown_percent
+
+    @cached_property
+    def media_rendimenti(self):
+        return self.rendimenti.mean() if len(self.rendimenti) else 0
+
+    @staticmethod
+    def _deviazione_standard(valori: np.ndarray):
+        # Deviazione standard campionaria (ddof=1, come pandas): NaN con meno di due valori
+        if len(valori) < 2:
+            return np.nan
+        return valori.std(ddof=1)
+
+    # --- Trade ---
+    @cached_property
+    def chiusi(self) -> np.ndarray:
+        # Solo i round-trip chiusi hanno un P/L realizzato (le posizioni aperte hanno barra_uscita = -1)
+        return self.trade[self.trade['barra_uscita'] >= 0]
+
+    @cached_property
+    def pl(self) -> np.ndarray:
+        return self.chiusi['pl']
+
+    @cached_property
+    def mask_vincenti(self) -> np.ndarray:
+        return self.pl > 0
+
+    @cached_property
+    def mask_perdenti(self) -> np.ndarray:
+        return self.pl < 0
+
+    @cached_property
+    def mask_long(self) -> np.ndarray:
+        return self.chiusi['direzione'] > 0
+
+    @cached_property
+    def num_vincenti(self) -> int:
+        return int(self.mask_vincenti.sum())
+
+    @cached_property
+    def num_perdenti(self) -> int:
+        return int(self.mask_perdenti.sum())
+
+    @cached_property
+    def num_long(self) -> int:
+        return int(self.mask_long.sum())
+
+    @cached_property
+    def num_short(self) -> int:
+        return len(self.chiusi) - self.num_long
+
+    def percentuale_capitale(self, valore):
+        return (valore / self.capitale * 100) if self.capitale != 0 else 0
+
+    def media_vincenti(self):
+        return self.pl[self.mask_vincenti].sum() / self.num_vincenti if self.num_vincenti > 0 else 0
+
+    def media_perdenti(self):
+        return self.pl[self.mask_perdenti].sum() / self.num_perdenti if self.num_perdenti > 0 else 0
+
+    def estremo(self, mask: np.ndarray, massimo: bool) -> tuple:
+        # (P/L, data di uscita) del trade con profitto massimo o perdita massima (a parità, il primo)
+        if not mask.any():
+            return 0, None
+        valori = self.pl[mask]
+        posizione = np.flatnonzero(mask)[np.argmax(valori) if massimo else np.argmin(valori)]
+        return float(self.pl[posizione]), self.date_index[self.chiusi['barra_uscita'][posizione]].date()
+
+    @cached_property
+    def profitto_massimo(self) -> tuple:
+        return self.estremo(self.mask_vincenti, massimo=True)
+
+    @cached_property
+    def perdita_massima(self) -> tuple:
+        return self.estremo(self.mask_perdenti, massimo=False)
+
+    def durata_media(self):
+        # Giorni di calendario tra la data di ingresso e quella di uscita
+        if len(self.chiusi) == 0:
+            return 0
+        uscite = self.date_index[self.chiusi['barra_uscita']].normalize()
+        ingressi = self.date_index[self.chiusi['barra_ingresso']].normalize()
+        return (uscite - ingressi).days.to_numpy().mean()
+
+    # --- Rapporti rischio/rendimento ---
+    def sharpe(self):
+        std = self._deviazione_standard(self.rendimenti)
+        if len(self.rendimenti) and std != 0:
+            return self.media_rendimenti / std * np.sqrt(252)  # 252 giorni di trading in un anno
+        return 0.0
+
+    def sortino(self):
+        # Solo i rendimenti negativi
+        ribassi = self.rendimenti[self.rendimenti < 0]
+        std = self._deviazione_standard(ribassi)
+        if len(ribassi) and std != 0:
+            return self.media_rendimenti / std * np.sqrt(252)
+        return float('inf')
+
+    def calmar(self):
+        rendimento_annuo = (1 + self.media_rendimenti) ** 252 - 1 if len(self.rendimenti) else 0
+        max_drawdown_percent = self.drawdown[1]
+        if max_drawdown_percent != 0:
+            return rendimento_annuo / (max_drawdown_percent / 100)
+        return float('inf')
+
+
+def _rendimento_annuale(c: _ContestoMetriche):
+    if c.capitale != 0 and c.giorni_totali > 0:
+        return (c.pnl_totale / c.capitale) * (365 / c.giorni_totali) * 100
+    return 0
+
+
+def _percentuale_vincenti(c: _ContestoMetriche):
+    totale = c.num_vincenti + c.num_perdenti
+    return (c.num_vincenti / totale * 100) if totale > 0 else 0
+
+
+def _data(valore) -> str:
+    return valore.strftime('%Y-%m-%d') if valore else 'N/A'
+
+
+# Calcolo di ciascuna metrica a partire dal contesto
+_CALCOLO_METRICHE = {
+    'Capitale Finale (€)': lambda c: round(c.equity_finale, 2),
+    'Profitto/Perdita Totale (€)': lambda c: round(c.pnl_totale, 2),
+    'Profitto/Perdita Totale (%)': lambda c: round((c.pnl_totale / c.capitale * 100) if c.capitale != 0 else 0.0, 2),
+    'Giorni Totali': lambda c: c.giorni_totali,
+    'Rendimento Medio Annuale (%)': lambda c: round(_rendimento_annuale(c), 2),
+    # Il totale esclude i trade chiusi in pareggio (P/L esattamente nullo)
+    'Numero Totale di Trade': lambda c: c.num_vincenti + c.num_perdenti,
+    'Num. Trade Vincenti': lambda c: c.num_vincenti,
+    'Num. Trade Perdenti': lambda c: c.num_perdenti,
+    'Percentuale Trade Vincenti': lambda c: round(_percentuale_vincenti(c), 2),
+    'Num. Trade Long': lambda c: c.num_long,
+    'P/L Medio Trade Long (%)': lambda c: round(
+        c.pl[c.mask_long].sum() / (c.num_long * c.capitale) * 100 if c.num_long > 0 else 0, 2),
+    'Num. Trade Short': lambda c: c.num_short,
+    'P/L Medio Trade Short (%)': lambda c: round(
+        c.pl[~c.mask_long].sum() / (c.num_short * c.capitale) * 100 if c.num_short > 0 else 0, 2),
+    'Profitto Medio Trade Vincenti (€)': lambda c: round(c.media_vincenti(), 2),
+    'Profitto Medio Trade Vincenti (%)': lambda c: round(c.percentuale_capitale(c.media_vincenti()), 2),
+    'Perdita Media Trade Perdenti (€)': lambda c: round(c.media_perdenti(), 2),
+    'Perdita Media Trade Perdenti (%)': lambda c: round(c.percentuale_capitale(c.media_perdenti()), 2),
+    'Profitto Massimo Trade (€)': lambda c: round(c.profitto_massimo[0], 2),
+    'Profitto Massimo Trade (%)': lambda c: round(c.percentuale_capitale(c.profitto_massimo[0]), 2),
+    'Data Profitto Massimo': lambda c: _data(c.profitto_massimo[1]),
+    'Perdita Massima Trade (€)': lambda c: round(c.perdita_massima[0], 2),
+    'Perdita Massima Trade (%)': lambda c: round(c.percentuale_capitale(c.perdita_massima[0]), 2),
+    'Data Perdita Massima': lambda c: _data(c.perdita_massima[1]),
+    'Durata Media Trade (giorni)': lambda c: round(c.durata_media(), 1),
+    'Max Drawdown (€)': lambda c: round(c.drawdown[0], 2),
+    'Max Drawdown (%)': lambda c: round(c.drawdown[1], 2),
+    'Ratio Sharpe': lambda c: round(c.sharpe(), 2),
+    'Ratio Sortino': lambda c: round(c.sortino(), 2),
+    'Ratio Calmar': lambda c: round(c.calmar(), 2),
+}
+
+
+def calcola_metriche(
+    trade: np.ndarray,
+    equity_values: np.ndarray,
+    date_index: pd.DatetimeIndex,
+    capitale_iniziale: float,
+    metriche: list = None,
+) -> dict:
+    """
+    Calcola le metriche di performance di un backtest a partire dagli array del motore.
+
+    Ogni metrica è calcolata in O(n) con NumPy e solo se richiesta: le grandezze intermedie
+    (rendimenti, drawdown, statistiche dei trade) vengono calcolate una sola volta e solo se
+    servono a una delle metriche richieste.
+
+    Args:
+        trade (np.ndarray): Round-trip del backtest (array strutturato DTYPE_TRADE di backtesting_engine).
+        equity_values (np.ndarray): Equity per ogni barra.
+        date_index (pd.DatetimeIndex): Indice temporale del backtest.
+        capitale_iniziale (float): Capitale iniziale.
+        metriche (list, optional): Nomi delle metriche da calcolare (vedi METRICHE_DISPONIBILI).
+            Se None le calcola tutte. I nomi non riconosciuti vengono ignorati.
+
+    Returns:
+        dict: Metriche richieste, nell'ordine di METRICHE_DISPONIBILI.
+    """
+    with strumentazione.fase(strumentazione.FASE_METRICHE):
+        contesto = _ContestoMetriche(trade, np.asarray(equity_values, dtype=float), date_index, capitale_iniziale)
+        richieste = METRICHE_DISPONIBILI if metriche is None else set(metriche)
+        return {
+            nome: _CALCOLO_METRICHE[nome](contesto)
+            for nome in METRICHE_DISPONIBILI
+            if nome in richieste
+        }
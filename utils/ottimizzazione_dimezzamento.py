@@ -0,0 +1,126 @@
+# ottimizzazione_dimezzamento.py
+# Ottimizzazione per dimezzamento successivo (successive halving): tutte le combinazioni vengono
+# valutate su un breve tratto di storico, solo le migliori passano a un tratto più lungo e così via
+# fino al periodo completo. Le combinazioni chiaramente scadenti non pagano mai il backtest completo.
+
+import math
+
+import pandas as pd
+
+from utils.campionamento import campiona_combinazioni
+from utils.ottimizzazione_engine import prepara_ricerca_adattiva, risultato_vuoto
+
+
+def piano_dimezzamento(n_combinazioni: int, frazione_iniziale: float, fattore_riduzione: int) -> list:
+    """
+    Turni del dimezzamento successivo.
+
+    Returns:
+        list: Coppie (frazione dello storico, combinazioni valutate) per turno; l'ultimo turno usa
+            tutto lo storico.
+    """
+    piano = []
+    frazione = frazione_iniziale
+    while frazione < 1.0 and n_combinazioni > 1:
+        piano.append((frazione, n_combinazioni))
+        frazione *= fattore_riduzione
+        n_combinazioni = math.ceil(n_combinazioni / fattore_riduzione)
+    piano.append((1.0, n_combinazioni))
+    return piano
+
+
+def run_successive_halving(
+    dati: pd.DataFrame,
+    strategia_nome: str,
+    parametri_ottimizzazione_config: dict,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+    metrica_ottimizzazione: str = 'Rendimento della strategia (%)',
+    investimento_fisso_per_trade: float = None,
+    frazione_iniziale: float = 0.25,
+    fattore_riduzione: int = 2,
+    barre_minime: int = 100,
+    max_combinazioni: int = None,
+    metodo_campionamento: str = 'griglia',
+    seme_campionamento: int = None,
+    use_parallel: bool = False,
+    n_jobs: int = -1,
+    progress_callback=None,
+    cache_risultati=None
+) -> tuple:
+    """
+    Ottimizzazione per dimezzamento successivo.
+
+    Al primo turno ogni combinazione viene valutata sulla parte più recente dello storico
+    (frazione_iniziale); a ogni turno resta solo la migliore 1/fattore_riduzione delle combinazioni e il
+    tratto di storico, sempre terminante all'ultima barra, si allunga di fattore_riduzione volte
+    fino a coprire tutto il periodo.
+
+    Args:
+        dati, strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+        abilita_short, stop_loss_percent, take_profit_percent, trailing_stop_percent, metrica_ottimizzazione,
+        investimento_fisso_per_trade: Come in run_optimization.
+        frazione_iniziale (float, optional): Frazione dello storico usata al primo turno (default: 0.25).
+        fattore_riduzione (int, optional): Fattore di riduzione delle combinazioni e di allungamento
+            dello storico a ogni turno (default: 2).
+        barre_minime (int, optional): Lunghezza minima del tratto di storico, per lasciare agli indicatori
+            barre sufficienti dopo il periodo di riscaldamento.
+        max_combinazioni, metodo_campionamento, seme_campionamento: Combinazioni di partenza, come in
+            run_optimization (default: griglia completa).
+        use_parallel, n_jobs, cache_risultati: Passati a run_optimization per ogni turno; dati preparati,
+            cache degli indicatori e pool di processi sono condivisi da tutti i turni (RicercaAdattiva).
+        progress_callback (callable, optional): Funzione chiamata con (valutazioni eseguite, valutazioni totali
+            del piano).
+
+    Returns:
+        tuple: Come run_optimization (best_params, best_results, all_results, best_equity_curve,
+        best_buy_hold_equity, best_trades), con i risultati del turno finale sull'intero periodo.
+    """
+    if fattore_riduzione < 2 or not 0 < frazione_iniziale <= 1:
+        print(f"Avviso ottimizzazione: fattore_riduzione ({fattore_riduzione}) deve essere almeno 2 e "
+              f"frazione_iniziale ({frazione_iniziale}) compresa tra 0 e 1. Uso 2 e 0.25.")
+        fattore_riduzione, frazione_iniziale = 2, 0.25
+    ricerca = prepara_ricerca_adattiva(
+        dati=dati, strategia_nome=strategia_nome, parametri_ottimizzazione_config=parametri_ottimizzazione_config,
+        capitale_iniziale=capitale_iniziale, commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short, stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+        trailing_stop_percent=trailing_stop_percent, metrica_ottimizzazione=metrica_ottimizzazione,
+        investimento_fisso_per_trade=investimento_fisso_per_trade, use_parallel=use_parallel, n_jobs=n_jobs,
+        cache_risultati=cache_risultati, progress_callback=progress_callback,
+        descrizione="Ottimizzazione per dimezzamento successivo"
+    )
+    if ricerca is None:
+        return risultato_vuoto()
+    with ricerca:
+        sopravvissute = list(campiona_combinazioni(
+            ricerca.param_values, max_combinazioni, metodo_campionamento, seme_campionamento,
+            vincolo=ricerca.filtro_vincoli
+        ))
+        if not sopravvissute:
+            print("Avviso ottimizzazione: Nessuna combinazione valida da valutare.")
+            return risultato_vuoto()
+        piano = piano_dimezzamento(len(sopravvissute), frazione_iniziale, fattore_riduzione)
+        valutazioni_totali = sum(n for _, n in piano)
+        print(f"Inizio dimezzamento successivo per la strategia: {strategia_nome}")
+        print("Piano: " + ", ".join(f"{n} combinazioni su {frazione:.0%} dello storico" for frazione, n in piano))
+
+        for turno, (frazione, n_combinazioni) in enumerate(piano, start=1):
+            sopravvissute = sopravvissute[:n_combinazioni]
+            n_barre = len(dati) if frazione >= 1.0 else min(len(dati), max(barre_minime, int(round(len(dati) * frazione))))
+            print(f"Turno {turno}/{len(piano)}: {len(sopravvissute)} combinazioni sulle ultime {n_barre} barre")
+            performance = ricerca.valuta_lotto(sopravvissute, valutazioni_totali, dati=dati.iloc[len(dati) - n_barre:])
+            if performance is None:
+                return risultato_vuoto()
+
+            # Ordina per metrica (le combinazioni non valide in fondo) mantenendo l'ordine di partenza a parità
+            ordine = sorted(range(len(sopravvissute)), key=lambda indice: performance[indice], reverse=True)
+            sopravvissute = [sopravvissute[i] for i in ordine]
+
+    backtest_equivalenti = sum(frazione * n for frazione, n in piano)
+    # Il risultato è quello del turno finale sull'intero periodo
+    return ricerca.concludi(f"{ricerca.valutazioni} valutazioni, pari a circa {backtest_equivalenti:.0f} "
+                            f"backtest completi invece di {piano[0][1]}", solo_ultimo_lotto=True)
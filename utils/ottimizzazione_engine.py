@@ -2,13 +2,26 @@
 
 import pandas as pd
 import numpy as np
-import itertools # Utile per la grid search
 import time # Per misurare il tempo di esecuzione (opzionale)
 import importlib # Per importare moduli dinamicamente
 import math # Per gestire i valori NaN in modo compatibile
+import inspect
+import os
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 # Importa la funzione di backtesting
-from utils.backtesting_engine import run_backtest
+from utils.backtesting_engine import run_backtest, run_backtest_batch, run_stop_sweep, DTYPE_TRADE
+from utils.metriche_backtest import calcola_metriche
+from utils.cache_indicatori import CacheIndicatori
+from utils.cache_risultati import CacheRisultati, MODULI_MOTORE, impronta_codice, impronta_dati, chiave_parametri
+from utils.memoria_condivisa import DatiCondivisi
+from utils.tabella_risultati import TabellaRisultati
+from utils.campionamento import (
+    METODI_CAMPIONAMENTO, campiona_combinazioni, numero_combinazioni, numero_combinazioni_valide,
+    crea_filtro_vincoli, vincoli_applicabili
+)
+from utils import strumentazione
 
 # Importa il dizionario delle strategie disponibili dal file di configurazione centralizzato
 from utils.strategies_config import STRATEGIE_DISPONIBILI
@@ -16,6 +29,795 @@ from utils.strategies_config import STRATEGIE_DISPONIBILI
 # Definisci un valore NaN compatibile sia con pandas che numpy
 MISSING_VALUE = float('nan')
 
+# Metriche usate in ordine se la metrica di ottimizzazione richiesta non è tra i risultati del backtest
+ALTERNATIVE_METRICS = [
+    'Profitto/Perdita Totale (%)',
+    'Rendimento della strategia (%)',
+    'Capitale Finale (€)',
+    'Profitto/Perdita Totale (€)'
+]
+
+# Combinazioni generate per volta in modalità compatta con la cache dei risultati: l'archivio viene
+# interrogato per le sole chiavi del lotto invece di caricare tutto il contesto
+COMBINAZIONI_PER_LOTTO_CACHE = 4096
+
+# Mappatura dei nomi delle colonne dal formato delle strategie (maiuscolo) a quello del backtest
+COLONNE_BACKTEST = {
+    'OPEN': 'Open',
+    'HIGH': 'High',
+    'LOW': 'Low',
+    'CLOSE': 'Close',
+    'VOLUME': 'Volume'
+}
+
+
+def valori_parametri(parametri_ottimizzazione_config: dict) -> tuple[list, list]:
+    """
+    Nomi e valori possibili (da min a max con passo step) dei parametri da ottimizzare.
+    I parametri con configurazione incompleta vengono ignorati con un avviso.
+
+    Returns:
+        tuple[list, list]: (nomi dei parametri, lista dei valori di ciascun parametro).
+    """
+    param_names = []
+    param_values = []
+    for param_name, param_config in parametri_ottimizzazione_config.items():
+        if 'min' in param_config and 'max' in param_config and 'step' in param_config:
+            param_names.append(param_name)
+            values = np.arange(param_config['min'], param_config['max'] + param_config['step'], param_config['step'])
+            param_values.append(values.tolist())
+        else:
+            print(f"Avviso ottimizzazione: Configurazione incompleta per il parametro '{param_name}'. Richiede 'min', 'max', 'step'. Parametro ignorato.")
+    return param_names, param_values
+
+
+def _carica_classe_strategia(strategia_nome: str):
+    """
+    Importa dinamicamente la classe della strategia indicata in STRATEGIE_DISPONIBILI.
+
+    Returns:
+        type: Classe della strategia, oppure None (con messaggio di errore) se non disponibile.
+    """
+    if strategia_nome not in STRATEGIE_DISPONIBILI:
+        print(f"Errore ottimizzazione: Strategia '{strategia_nome}' non trovata in STRATEGIE_DISPONIBILI.")
+        return None
+
+    # Ottieni il percorso del modulo dalla configurazione
+    modulo_path = f"utils.logica_strategie.{STRATEGIE_DISPONIBILI[strategia_nome]['module']}"
+    try:
+        modulo_strategia = importlib.import_module(modulo_path)
+        # Ottieni la classe dal modulo usando il nome indicato nella configurazione
+        return getattr(modulo_strategia, STRATEGIE_DISPONIBILI[strategia_nome]['class'])
+    except ImportError as e:
+        print(f"Errore ottimizzazione: Impossibile importare il modulo strategia '{modulo_path}'. Dettagli: {e}")
+    except Exception as e:
+        print(f"Errore ottimizzazione: Errore generico durante l'import o la verifica del modulo strategia. Dettagli: {e}")
+    return None
+
+
+def _prepara_dati_strategia(dati: pd.DataFrame) -> pd.DataFrame:
+    """
+    Prepara (una sola volta per ottimizzazione) i dati nel formato atteso dalle strategie:
+    MultiIndex appiattito e nomi delle colonne in maiuscolo.
+
+    Returns:
+        pd.DataFrame: Copia dei dati con colonne in maiuscolo, oppure None se mancano colonne OHLCV.
+    """
+    strumentazione.conta('preparazioni_dati')
+    dati_per_strategia = dati.copy()
+
+    # Standardizza i nomi delle colonne per la strategia (maiuscole)
+    if isinstance(dati_per_strategia.columns, pd.MultiIndex):
+        dati_per_strategia.columns = dati_per_strategia.columns.get_level_values(0)
+
+    # Verifica che le colonne necessarie esistano prima di convertirle in maiuscolo
+    required_cols = ['Open', 'High', 'Low', 'Close', 'Volume']
+    missing_cols = [col for col in required_cols if col not in dati_per_strategia.columns]
+    if missing_cols:
+        print(f"Errore: DataFrame mancante di colonne OHLCV essenziali. Mancanti: {missing_cols}")
+        print(f"Colonne disponibili: {dati_per_strategia.columns.tolist()}")
+        return None
+
+    dati_per_strategia.columns = [col.upper() for col in dati_per_strategia.columns]
+    return dati_per_strategia
+
+
+def _prepara_dati_backtest(dati_con_segnali: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rinomina le colonne OHLCV nel formato richiesto dal backtest (prima lettera maiuscola).
+
+    Returns:
+        pd.DataFrame: DataFrame pronto per run_backtest, oppure None se mancano colonne OHLC.
+    """
+    missing_cols = [old_col for old_col in ['OPEN', 'HIGH', 'LOW', 'CLOSE'] if old_col not in dati_con_segnali.columns]
+    if missing_cols:
+        print(f"Errore: DataFrame mancante di colonne OHLC essenziali. Mancanti: {missing_cols}")
+        print(f"Colonne disponibili: {dati_con_segnali.columns.tolist()}")
+        return None
+    with strumentazione.fase(strumentazione.FASE_PREPARAZIONE_DATI):
+        return dati_con_segnali.rename(columns=COLONNE_BACKTEST)
+
+
+def _supporta_cache_indicatori(strategy_class) -> bool:
+    """
+    True se il costruttore della strategia accetta il parametro 'cache_indicatori'.
+    """
+    try:
+        return 'cache_indicatori' in inspect.signature(strategy_class).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _genera_dati_backtest(strategy_class, dati_per_strategia: pd.DataFrame, current_params: dict,
+                          cache_indicatori: CacheIndicatori = None) -> pd.DataFrame:
+    """
+    Istanzia la strategia con i parametri correnti, genera i segnali e prepara i dati per il backtest.
+    Se viene passata una cache_indicatori, la strategia la usa per condividere gli indicatori tra le combinazioni.
+
+    Returns:
+        pd.DataFrame: Dati con segnali pronti per il backtest, oppure None se la combinazione va saltata.
+    """
+    strumentazione.conta('combinazioni')
+    try:
+        with strumentazione.fase(strumentazione.FASE_GENERAZIONE_SEGNALI):
+            if cache_indicatori is not None:
+                strategy_instance = strategy_class(df=dati_per_strategia, cache_indicatori=cache_indicatori, **current_params)
+            else:
+                strategy_instance = strategy_class(df=dati_per_strategia, **current_params)
+            dati_con_segnali = strategy_instance.generate_signals()
+    except Exception as e:
+        strumentazione.conta('combinazioni_saltate')
+        print(f"Errore durante la generazione segnali per parametri {current_params}: {e}. Combinazione saltata.")
+        return None
+
+    if dati_con_segnali is None or dati_con_segnali.empty or 'Signal' not in dati_con_segnali.columns:
+        strumentazione.conta('combinazioni_saltate')
+        print(f"Avviso ottimizzazione: Generazione segnali fallita o dati non validi per parametri {current_params}. Combinazione saltata.")
+        return None
+
+    return _prepara_dati_backtest(dati_con_segnali)
+
+
+def _risultati_combinazione(current_params: dict, metriche_risultati: dict, metrica_ottimizzazione: str) -> tuple[dict, float]:
+    """
+    Costruisce la riga dei risultati di una combinazione e ne estrae la performance.
+
+    Copia tutte le metriche numeriche (convertite in tipi Python standard) e valuta la metrica
+    di ottimizzazione, usando ALTERNATIVE_METRICS se quella richiesta non è disponibile.
+
+    Returns:
+        tuple[dict, float]: Risultati della combinazione e performance, oppure None se non valida
+        (in tal caso la metrica viene registrata come 0.0).
+    """
+    current_combination_results = current_params.copy()
+
+    # Copia tutte le metriche nei risultati
+    for key, value in metriche_risultati.items():
+        if isinstance(value, (int, float)) or hasattr(value, 'item'):
+            try:
+                # Converti valori numpy in Python standard
+                if hasattr(value, 'item'):
+                    current_combination_results[key] = value.item()
+                else:
+                    current_combination_results[key] = float(value)
+            except (ValueError, TypeError) as e:
+                print(f"Errore nella conversione della metrica {key}: {e}")
+
+    # Verifica la metrica principale di ottimizzazione
+    if metrica_ottimizzazione in metriche_risultati:
+        current_performance = metriche_risultati[metrica_ottimizzazione]
+
+        # Verifica che il valore non sia NaN prima di assegnarlo
+        if not pd.isna(current_performance) and not math.isnan(current_performance):
+            current_combination_results[metrica_ottimizzazione] = current_performance
+            return current_combination_results, current_performance
+        current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
+        return current_combination_results, None
+
+    # Se la metrica non esiste, prova a usare una metrica alternativa
+    for alt_metric in ALTERNATIVE_METRICS:
+        if alt_metric in metriche_risultati:
+            current_performance = metriche_risultati[alt_metric]
+            if not pd.isna(current_performance) and not math.isnan(current_performance):
+                current_combination_results[metrica_ottimizzazione] = current_performance
+                strumentazione.conta(f"metrica_alternativa: {alt_metric}")
+                return current_combination_results, current_performance
+
+    print(f"Avviso ottimizzazione: Metrica '{metrica_ottimizzazione}' non trovata nei risultati del backtest per parametri {current_params}.")
+    print(f"Metriche disponibili: {list(metriche_risultati.keys())}")
+    current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
+    return current_combination_results, None
+
+
+def _nuovo_migliore() -> dict:
+    """
+    Stato iniziale del miglior risultato trovato durante l'ottimizzazione.
+    """
+    return {
+        'performance': -float('inf'),
+        'params': {},
+        'results': {},
+        'equity_curve': pd.Series(dtype=float),
+        'buy_hold_equity': pd.Series(dtype=float),
+        'trades': np.empty(0, dtype=DTYPE_TRADE)
+    }
+
+
+def _aggiorna_migliore(migliore: dict, performance, params, metriche_risultati, equity_curve, buy_hold_equity, trades):
+    """
+    Aggiorna (in place) il miglior risultato con copie degli artefatti della combinazione corrente.
+    """
+    migliore['performance'] = performance
+    migliore['params'] = params.copy()
+    migliore['results'] = metriche_risultati.copy()
+    migliore['equity_curve'] = equity_curve.copy() if equity_curve is not None else pd.Series(dtype=float)
+    migliore['buy_hold_equity'] = buy_hold_equity.copy() if buy_hold_equity is not None else pd.Series(dtype=float)
+    migliore['trades'] = trades.copy() if trades is not None else np.empty(0, dtype=DTYPE_TRADE)
+    print(f"Nuovo miglior risultato: {performance:.2f} con parametri {migliore['params']}")
+
+
+def _apri_cache_risultati(cache_risultati, dati: pd.DataFrame, strategia_nome: str, impostazioni: dict,
+                          carica: bool = True) -> tuple:
+    """
+    Apre l'archivio dei risultati e carica le combinazioni già valutate nello stesso contesto
+    (stessi dati, impostazioni e codice della strategia e del backtest).
+
+    Args:
+        carica (bool, optional): Se False non carica i risultati memorizzati (verranno cercati
+            a lotti con _cerca_risultati).
+
+    Returns:
+        tuple: (archivio, contesto, risultati memorizzati), oppure (None, None, {}) se la cache
+        è disattivata o non utilizzabile (l'ottimizzazione prosegue senza cache).
+    """
+    if cache_risultati is None:
+        return None, None, {}
+    try:
+        archivio = cache_risultati if isinstance(cache_risultati, CacheRisultati) else CacheRisultati(cache_risultati)
+        codice = impronta_codice(f"utils.logica_strategie.{STRATEGIE_DISPONIBILI[strategia_nome]['module']}", *MODULI_MOTORE)
+        contesto = CacheRisultati.contesto(impronta_dati(dati), strategia_nome, impostazioni, codice)
+        return archivio, contesto, archivio.carica(contesto) if carica else {}
+    except Exception as e:
+        print(f"Avviso ottimizzazione: cache dei risultati non disponibile ({e}). Proseguo senza cache.")
+        return None, None, {}
+
+
+def _cerca_risultati(archivio: CacheRisultati, contesto: str, chiavi: list) -> dict:
+    """
+    Righe memorizzate per le chiavi indicate.
+
+    Returns:
+        dict: {chiave: riga dei risultati}; vuoto se l'archivio non è leggibile (le combinazioni vengono rivalutate).
+    """
+    try:
+        return archivio.cerca(contesto, chiavi)
+    except Exception as e:
+        print(f"Avviso ottimizzazione: impossibile leggere i risultati dalla cache ({e}).")
+        return {}
+
+
+def _salva_risultati_nuovi(archivio: CacheRisultati, contesto: str, all_results: list, param_names: list, gia_salvati: int) -> int:
+    """
+    Salva nell'archivio le righe di all_results non ancora salvate.
+
+    Returns:
+        int: Numero di righe di all_results salvate finora.
+    """
+    if archivio is None or gia_salvati >= len(all_results):
+        return gia_salvati
+    try:
+        archivio.salva(contesto, all_results[gia_salvati:], param_names)
+    except Exception as e:
+        print(f"Avviso ottimizzazione: impossibile salvare i risultati nella cache ({e}).")
+    return len(all_results)
+
+def _ricostruisci_migliore(strategy_class, dati: pd.DataFrame, righe, param_names: list,
+                           metrica_ottimizzazione: str, performance_da_battere: float, parametri_backtest: dict,
+                           backtest_batch: bool = False):
+    """
+    Cerca tra le righe dei risultati (lette dalla cache o restituite dai worker paralleli) una migliore
+    di performance_da_battere e ne riesegue il backtest per ricostruire equity e trade (non contenuti
+    nelle righe). A parità di metrica vale la prima riga, come nel ciclo sequenziale. Con backtest_batch
+    i segnali vengono allineati all'indice completo dei dati, come nell'esecuzione a blocchi.
+
+    Returns:
+        dict: Miglior risultato nel formato di _nuovo_migliore, oppure None se non ce n'è uno migliore.
+    """
+    candidati = sorted(
+        (riga for riga in righe
+         if isinstance(riga.get(metrica_ottimizzazione), (int, float))
+         and math.isfinite(riga[metrica_ottimizzazione])
+         and riga[metrica_ottimizzazione] > performance_da_battere),
+        key=lambda riga: riga[metrica_ottimizzazione], reverse=True
+    )
+    if not candidati:
+        return None
+    dati_per_strategia = _prepara_dati_strategia(dati)
+    if dati_per_strategia is None:
+        return None
+    if backtest_batch:
+        dati_batch = _prepara_dati_backtest(dati_per_strategia)
+        if not isinstance(dati_batch.index, pd.DatetimeIndex):
+            dati_batch.index = pd.to_datetime(dati_batch.index)
+    for riga in candidati:
+        params = {nome: riga[nome] for nome in param_names}
+        dati_per_backtest = _genera_dati_backtest(strategy_class, dati_per_strategia, params)
+        if dati_per_backtest is None:
+            continue
+        try:
+            if backtest_batch:
+                segnali = dati_per_backtest['Signal'].reindex(dati_batch.index).fillna(0).to_numpy(dtype=float)
+                trades_blocco, equity_blocco, buy_hold_equity, metriche_blocco = run_backtest_batch(
+                    dati_batch, segnali[:, np.newaxis], restituisci_trade_log=True, **parametri_backtest
+                )
+                trades, equity_curve, metriche_risultati = trades_blocco[0], equity_blocco.iloc[:, 0], metriche_blocco.iloc[0].to_dict()
+            else:
+                trades, equity_curve, buy_hold_equity, metriche_risultati = run_backtest(dati_per_backtest, **parametri_backtest)
+        except Exception as e:
+            print(f"Errore durante il backtest per parametri {params}: {e}. Combinazione saltata.")
+            continue
+        _, performance = _risultati_combinazione(params, metriche_risultati, metrica_ottimizzazione)
+        # Le righe non valide (performance None) sono memorizzate con un valore di ripiego: si passa alla successiva
+        if performance is not None:
+            migliore = _nuovo_migliore()
+            _aggiorna_migliore(migliore, performance, params, metriche_risultati, equity_curve, buy_hold_equity, trades)
+            return migliore
+    return None
+
+
+# Stato di ciascun processo worker dell'ottimizzazione parallela (impostato da _inizializza_worker)
+_stato_worker = {}
+
+
+def _imposta_tratto(stato: dict, tratto: tuple) -> tuple:
+    """
+    Seleziona nello stato (di un worker o di una SessioneOttimizzazione) le barre tratto = (inizio, fine)
+    dei dati preparati. La cache degli indicatori è legata al tratto (gli indicatori dipendono dalle barre
+    su cui sono calcolati) e viene ricreata solo quando il tratto cambia.
+
+    Returns:
+        tuple: (dati del tratto, cache degli indicatori o None se la strategia non la supporta).
+    """
+    if stato.get('tratto') != tratto:
+        inizio, fine = tratto
+        dati_per_strategia = stato['dati_per_strategia']
+        dati_tratto = dati_per_strategia if (inizio, fine) == (0, len(dati_per_strategia)) else dati_per_strategia.iloc[inizio:fine]
+        stato.update(
+            tratto=tratto,
+            dati_tratto=dati_tratto,
+            cache_indicatori=CacheIndicatori(dati_tratto) if _supporta_cache_indicatori(stato['strategy_class']) else None,
+        )
+    return stato['dati_tratto'], stato['cache_indicatori']
+
+
+def _inizializza_worker(descrittore: dict, strategia_nome: str, param_names: list, parametri_backtest: dict,
+                        metrica_ottimizzazione: str, metriche_richieste: list):
+    """
+    Inizializzatore dei processi worker: si collega ai dati in memoria condivisa (senza copiarli)
+    e carica una volta per processo la classe della strategia.
+    """
+    blocco, dati_per_strategia = DatiCondivisi.collega(descrittore)
+    _stato_worker.update(
+        blocco=blocco,  # Riferimento che mantiene valida la memoria condivisa
+        dati_per_strategia=dati_per_strategia,
+        strategy_class=_carica_classe_strategia(strategia_nome),
+        tratto=None,
+        param_names=param_names,
+        parametri_backtest=parametri_backtest,
+        metrica_ottimizzazione=metrica_ottimizzazione,
+        metriche_richieste=metriche_richieste,
+    )
+
+
+def _valuta_combinazione_worker(combo: tuple, dati_per_strategia: pd.DataFrame, cache_indicatori: CacheIndicatori) -> tuple[dict, float]:
+    """
+    Valuta una combinazione di parametri in un processo worker.
+
+    Returns:
+        tuple[dict, float]: Riga dei risultati e performance (None se la combinazione non è valida).
+    """
+    metrica_ottimizzazione = _stato_worker['metrica_ottimizzazione']
+    current_params = dict(zip(_stato_worker['param_names'], combo))
+    current_combination_results = current_params.copy()
+
+    dati_per_backtest = _genera_dati_backtest(
+        _stato_worker['strategy_class'], dati_per_strategia, current_params, cache_indicatori
+    )
+    if dati_per_backtest is None:
+        current_combination_results[metrica_ottimizzazione] = -float('inf')  # Usa un valore molto negativo invece di 0.0
+        return current_combination_results, None
+
+    try:
+        _, _, _, metriche_risultati = run_backtest(
+            dati_per_backtest, metriche_richieste=_stato_worker['metriche_richieste'],
+            **_stato_worker['parametri_backtest']
+        )
+    except Exception as e:
+        print(f"Errore durante il backtest per parametri {current_params}: {e}. Combinazione saltata.")
+        current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
+        return current_combination_results, None
+    return _risultati_combinazione(current_params, metriche_risultati, metrica_ottimizzazione)
+
+
+def _valuta_blocco_worker(blocco: list, tratto: tuple) -> list:
+    """
+    Valuta un blocco di combinazioni sulle barre tratto = (inizio, fine) in un processo worker
+    (un solo task per blocco).
+
+    Returns:
+        list: Coppie (riga dei risultati, performance) nell'ordine del blocco.
+    """
+    dati_tratto, cache_indicatori = _imposta_tratto(_stato_worker, tratto)
+    return [_valuta_combinazione_worker(combo, dati_tratto, cache_indicatori) for combo in blocco]
+
+
+def _dimensione_blocco_parallelo(n_combinazioni: int, n_processi: int) -> int:
+    """
+    Combinazioni per task: circa 4 blocchi per processo per ammortizzare l'invio dei task
+    mantenendo bilanciato il carico, al massimo 32 per aggiornare spesso il progresso.
+    """
+    return max(1, min(32, math.ceil(n_combinazioni / (n_processi * 4))))
+
+
+def _risultati_paralleli(executor, combinazioni, dimensione_blocco: int, max_blocchi_in_sospeso: int,
+                         tratto: tuple, non_completate: list = None):
+    """
+    Invia le combinazioni all'executor a blocchi e ne restituisce i risultati man mano che i blocchi terminano.
+
+    Le combinazioni possono essere una lista o un iteratore, consumato solo man mano che si inviano i blocchi.
+    I blocchi in esecuzione più quelli terminati in attesa di un blocco precedente non superano mai
+    max_blocchi_in_sospeso, quindi la memoria occupata resta limitata anche con griglie molto grandi.
+    Se un blocco fallisce, prima di propagare l'eccezione le combinazioni inviate ma non ancora restituite
+    nell'ordine della griglia vengono aggiunte (in ordine) a non_completate, per poterle rivalutare.
+
+    Yields:
+        tuple: (risultati del blocco appena terminato, blocchi ora disponibili nell'ordine della griglia).
+            Ogni blocco è una lista di coppie (riga dei risultati, performance).
+    """
+    combinazioni = iter(combinazioni)
+    in_esecuzione = {}      # future -> numero del blocco
+    terminati = {}          # numero del blocco -> risultati, in attesa dei blocchi precedenti
+    inviati = {}            # numero del blocco -> combinazioni, finché il blocco non è restituito in ordine
+    prossimo_da_inviare = 0
+    prossimo_in_ordine = 0
+    blocchi_esauriti = False
+
+    try:
+        while True:
+            while not blocchi_esauriti and len(in_esecuzione) + len(terminati) < max_blocchi_in_sospeso:
+                blocco = list(islice(combinazioni, dimensione_blocco))
+                if not blocco:
+                    blocchi_esauriti = True
+                    break
+                inviati[prossimo_da_inviare] = blocco
+                in_esecuzione[executor.submit(_valuta_blocco_worker, blocco, tratto)] = prossimo_da_inviare
+                prossimo_da_inviare += 1
+            if not in_esecuzione:
+                return
+
+            completati, _ = wait(in_esecuzione, return_when=FIRST_COMPLETED)
+            for future in completati:
+                numero_blocco = in_esecuzione.pop(future)
+                risultati_blocco = future.result()
+                terminati[numero_blocco] = risultati_blocco
+                pronti = []
+                while prossimo_in_ordine in terminati:
+                    pronti.append(terminati.pop(prossimo_in_ordine))
+                    del inviati[prossimo_in_ordine]
+                    prossimo_in_ordine += 1
+                yield risultati_blocco, pronti
+    except Exception:
+        if non_completate is not None:
+            non_completate.extend(combo for numero in sorted(inviati) for combo in inviati[numero])
+        raise
+
+
+class SessioneOttimizzazione:
+    """
+    Risorse di valutazione condivise dalle chiamate a run_optimization di una stessa ottimizzazione,
+    ad esempio i lotti delle ottimizzazioni adattive (surrogata, evolutiva, a raffinamento, a dimezzamento).
+
+    Classe della strategia e dati preparati vengono caricati una sola volta e la cache degli indicatori
+    resta valida da un lotto all'altro. Con use_parallel la memoria condivisa e il pool di processi
+    vengono creati al primo lotto con più di una combinazione e riutilizzati fino a chiudi(); se il pool
+    si interrompe, i lotti successivi vengono valutati in sequenziale.
+
+    Ogni chiamata può usare tutti i dati della sessione o un loro tratto contiguo (es. le barre più
+    recenti nei turni del dimezzamento successivo).
+
+    Uso:
+        with SessioneOttimizzazione(dati, strategia_nome, parametri_ottimizzazione_config, ...) as sessione:
+            run_optimization(dati, strategia_nome, parametri_ottimizzazione_config, ..., sessione=sessione)
+    """
+
+    def __init__(self, dati: pd.DataFrame, strategia_nome: str, parametri_ottimizzazione_config: dict,
+                 capitale_iniziale: float, commissione_percentuale: float, abilita_short: bool,
+                 stop_loss_percent: float = None, take_profit_percent: float = None,
+                 trailing_stop_percent: float = None, metrica_ottimizzazione: str = 'Rendimento della strategia (%)',
+                 investimento_fisso_per_trade: float = None, metriche_complete: bool = True,
+                 use_parallel: bool = False, n_jobs: int = -1):
+        """
+        Args:
+            dati, strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+            abilita_short, stop_loss_percent, take_profit_percent, trailing_stop_percent, metrica_ottimizzazione,
+            investimento_fisso_per_trade, metriche_complete: Come in run_optimization (le chiamate che usano
+                la sessione devono avere gli stessi valori).
+            use_parallel (bool, optional): Se True le combinazioni vengono valutate con un pool di processi.
+            n_jobs (int, optional): Numero di processi del pool (-1 = tutti i core disponibili).
+        """
+        self.strategia_nome = strategia_nome
+        self.param_names, self.param_values = valori_parametri(parametri_ottimizzazione_config)
+        self.parametri_backtest = dict(
+            capitale_iniziale=capitale_iniziale, commissione_percentuale=commissione_percentuale,
+            abilita_short=abilita_short, investimento_fisso_per_trade=investimento_fisso_per_trade,
+            stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+            trailing_stop_percent=trailing_stop_percent
+        )
+        self.metrica_ottimizzazione = metrica_ottimizzazione
+        # Metriche calcolate per ogni combinazione (None = tutte)
+        self.metriche_richieste = None if metriche_complete else [metrica_ottimizzazione] + ALTERNATIVE_METRICS
+        self.use_parallel = use_parallel
+        self.n_processi = (n_jobs if n_jobs is not None and n_jobs > 0 else (os.cpu_count() or 1)) if use_parallel else 0
+        self.strategy_class = _carica_classe_strategia(strategia_nome)
+        self.dati_per_strategia = _prepara_dati_strategia(dati) if self.strategy_class is not None else None
+        self._stato = {'dati_per_strategia': self.dati_per_strategia, 'strategy_class': self.strategy_class}
+        self._dati_condivisi = None
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.chiudi()
+        return False
+
+    def tratto(self, dati: pd.DataFrame, strategia_nome: str, param_names: list, parametri_backtest: dict,
+               metrica_ottimizzazione: str, metriche_richieste: list) -> tuple:
+        """
+        Posizione di `dati` tra i dati della sessione, se la sessione può valutarli con la stessa strategia
+        e le stesse impostazioni (i dati devono essere quelli della sessione o un loro tratto contiguo).
+
+        Returns:
+            tuple: (inizio, fine) delle barre, oppure None se dati o impostazioni non corrispondono.
+        """
+        if self.dati_per_strategia is None or len(dati) == 0:
+            return None
+        if (strategia_nome, list(param_names), parametri_backtest, metrica_ottimizzazione, metriche_richieste) != (
+                self.strategia_nome, self.param_names, self.parametri_backtest, self.metrica_ottimizzazione,
+                self.metriche_richieste):
+            return None
+        indice = self.dati_per_strategia.index
+        inizio = int(indice.searchsorted(dati.index[0])) if indice.is_monotonic_increasing else 0
+        fine = inizio + len(dati)
+        if fine > len(indice) or not indice[inizio:fine].equals(dati.index):
+            return None
+        return inizio, fine
+
+    def dati_tratto(self, tratto: tuple) -> tuple:
+        """
+        Dati preparati e cache degli indicatori per le barre tratto = (inizio, fine).
+
+        Returns:
+            tuple: (dati del tratto, cache degli indicatori), oppure (None, None) se i dati non sono validi.
+        """
+        if self.dati_per_strategia is None:
+            return None, None
+        return _imposta_tratto(self._stato, tratto)
+
+    def executor(self):
+        """
+        Pool di processi della sessione, creato alla prima richiesta.
+
+        Returns:
+            ProcessPoolExecutor: Il pool, oppure None se la sessione è sequenziale o il pool non è disponibile.
+        """
+        if self._executor is None and self.n_processi > 0:
+            try:
+                # I dati OHLCV vengono copiati una sola volta in memoria condivisa: ai worker
+                # arrivano solo il descrittore (all'avvio) e le tuple dei parametri
+                self._dati_condivisi = DatiCondivisi(self.dati_per_strategia)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.n_processi,
+                    initializer=_inizializza_worker,
+                    initargs=(self._dati_condivisi.descrittore, self.strategia_nome, self.param_names,
+                              self.parametri_backtest, self.metrica_ottimizzazione, self.metriche_richieste)
+                )
+            except Exception as e:
+                self.interrompi_parallelo(e)
+        return self._executor
+
+    def interrompi_parallelo(self, errore: Exception):
+        """
+        Chiude pool e memoria condivisa dopo un errore: le valutazioni successive sono sequenziali.
+        """
+        print(f"Esecuzione parallela non disponibile ({errore}). Proseguo in modalità sequenziale.")
+        self.n_processi = 0
+        self.chiudi()
+
+    def chiudi(self):
+        """
+        Termina il pool di processi e rilascia la memoria condivisa (se creati).
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._dati_condivisi is not None:
+            self._dati_condivisi.rilascia()
+            self._dati_condivisi = None
+
+
+def risultato_vuoto() -> tuple:
+    """
+    Risultato di un'ottimizzazione senza nessuna combinazione valutata, nel formato di run_optimization.
+    """
+    return {}, {}, [], pd.Series(dtype=float), pd.Series(dtype=float), []
+
+
+def _performance_riga(riga: dict, metrica_ottimizzazione: str) -> float:
+    """
+    Metrica di ottimizzazione di una riga dei risultati (-inf se mancante o non finita).
+    """
+    valore = riga.get(metrica_ottimizzazione)
+    return float(valore) if isinstance(valore, (int, float)) and math.isfinite(valore) else -float('inf')
+
+
+class RicercaAdattiva(SessioneOttimizzazione):
+    """
+    Sessione di un'ottimizzazione adattiva (surrogata, evolutiva, a raffinamento, a dimezzamento), che
+    valuta con run_optimization i lotti di combinazioni proposti dalla ricerca.
+
+    Oltre alle risorse condivise della sessione contiene la griglia dei parametri con i vincoli della
+    strategia, le righe dei risultati di tutti i lotti e il lotto con la combinazione migliore. Le ricerche
+    che lavorano sulle posizioni nella griglia (indice del valore di ogni parametro) le convertono con
+    valori() e posizioni(). Va creata con prepara_ricerca_adattiva, che verifica strategia e parametri.
+    """
+
+    def __init__(self, dati: pd.DataFrame, strategia_nome: str, parametri_ottimizzazione_config: dict,
+                 capitale_iniziale: float, commissione_percentuale: float, abilita_short: bool,
+                 stop_loss_percent: float = None, take_profit_percent: float = None,
+                 trailing_stop_percent: float = None, metrica_ottimizzazione: str = 'Rendimento della strategia (%)',
+                 investimento_fisso_per_trade: float = None, use_parallel: bool = False, n_jobs: int = -1,
+                 cache_risultati=None, progress_callback=None, descrizione: str = 'Ottimizzazione'):
+        """
+        Args:
+            dati, strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+            abilita_short, stop_loss_percent, take_profit_percent, trailing_stop_percent, metrica_ottimizzazione,
+            investimento_fisso_per_trade, use_parallel, n_jobs: Come in SessioneOttimizzazione.
+            cache_risultati: Passata a run_optimization per ogni lotto.
+            progress_callback (callable, optional): Funzione chiamata con (valutazioni di tutti i lotti,
+                totale previsto).
+            descrizione (str, optional): Nome dell'ottimizzazione nei messaggi (es. 'Ottimizzazione evolutiva').
+        """
+        super().__init__(
+            dati, strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+            abilita_short, stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+            trailing_stop_percent=trailing_stop_percent, metrica_ottimizzazione=metrica_ottimizzazione,
+            investimento_fisso_per_trade=investimento_fisso_per_trade, use_parallel=use_parallel, n_jobs=n_jobs
+        )
+        # Argomenti di run_optimization comuni a tutti i lotti
+        self.parametri_comuni = dict(
+            dati=dati, strategia_nome=strategia_nome, parametri_ottimizzazione_config=parametri_ottimizzazione_config,
+            capitale_iniziale=capitale_iniziale, commissione_percentuale=commissione_percentuale,
+            abilita_short=abilita_short, stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+            trailing_stop_percent=trailing_stop_percent, metrica_ottimizzazione=metrica_ottimizzazione,
+            investimento_fisso_per_trade=investimento_fisso_per_trade, use_parallel=use_parallel, n_jobs=n_jobs,
+            cache_risultati=cache_risultati
+        )
+        vincoli = STRATEGIE_DISPONIBILI.get(strategia_nome, {}).get('constraints', [])
+        self.filtro_vincoli = crea_filtro_vincoli(self.param_names, vincoli)
+        self.n_valide = numero_combinazioni_valide(self.param_names, self.param_values, vincoli)
+        self.livelli = [len(valori) for valori in self.param_values]
+        self._indice_valori = [{valore: posizione for posizione, valore in enumerate(valori)}
+                               for valori in self.param_values]
+        self.progress_callback = progress_callback
+        self.descrizione = descrizione
+        self.valutazioni = 0
+        self.all_results = []
+        self.migliore = {'performance': -float('inf'), 'risultato': risultato_vuoto()}
+        self.ultimo_risultato = risultato_vuoto()
+        self.start_time = time.time()
+
+    def valori(self, posizioni: tuple) -> tuple:
+        """
+        Combinazione di valori dei parametri corrispondente alle posizioni nella griglia.
+        """
+        return tuple(self.param_values[j][p] for j, p in enumerate(posizioni))
+
+    def posizioni(self, combinazione: tuple) -> tuple:
+        """
+        Posizioni nella griglia dei valori di una combinazione.
+        """
+        return tuple(self._indice_valori[j][v] for j, v in enumerate(combinazione))
+
+    def rispetta_vincoli(self, posizioni: tuple) -> bool:
+        """
+        True se la combinazione alle posizioni indicate rispetta i vincoli della strategia.
+        """
+        return self.filtro_vincoli is None or self.filtro_vincoli(self.valori(posizioni))
+
+    def valuta_lotto(self, combinazioni: list, totale: int, dati: pd.DataFrame = None) -> list:
+        """
+        Valuta un lotto di combinazioni e aggiorna le righe dei risultati e il lotto migliore.
+
+        Args:
+            combinazioni (list): Combinazioni (tuple di valori) da valutare.
+            totale (int): Valutazioni previste in tutto, per progress_callback.
+            dati (pd.DataFrame, optional): Tratto contiguo dei dati della sessione su cui valutare il lotto
+                (default: tutti i dati).
+
+        Returns:
+            list: Metrica di ottimizzazione di ogni combinazione, nello stesso ordine (-inf se non valida),
+                oppure None se la valutazione del lotto non è riuscita.
+        """
+        valutazioni_prima = self.valutazioni
+        callback_lotto = None
+        if self.progress_callback:
+            def callback_lotto(correnti, _totale):
+                self.progress_callback(valutazioni_prima + correnti, max(totale, valutazioni_prima + correnti))
+
+        parametri = self.parametri_comuni if dati is None else dict(self.parametri_comuni, dati=dati)
+        risultato = run_optimization(
+            **parametri, sessione=self, combinazioni=combinazioni,
+            progress_callback=callback_lotto, total_combinations=len(combinazioni)
+        )
+        righe = risultato[2]
+        if len(righe) != len(combinazioni):
+            print(f"Avviso ottimizzazione: valutazione del lotto non riuscita. {self.descrizione} interrotta.")
+            return None
+        self.valutazioni += len(combinazioni)
+        self.all_results.extend(righe)
+        self.ultimo_risultato = risultato
+        performance = [_performance_riga(riga, self.metrica_ottimizzazione) for riga in righe]
+        if risultato[0] and max(performance) > self.migliore['performance']:
+            self.migliore = {'performance': max(performance), 'risultato': risultato}
+            print(f"Miglior risultato finora: {max(performance):.2f} con parametri {risultato[0]}")
+        return performance
+
+    def concludi(self, dettagli: str, solo_ultimo_lotto: bool = False) -> tuple:
+        """
+        Stampa il riepilogo dell'ottimizzazione e ne restituisce il risultato.
+
+        Args:
+            dettagli (str): Informazioni aggiunte al riepilogo (es. combinazioni valutate).
+            solo_ultimo_lotto (bool, optional): Se True restituisce il risultato dell'ultimo lotto invece
+                del lotto migliore con le righe di tutti i lotti.
+
+        Returns:
+            tuple: Come run_optimization (best_params, best_results, all_results, best_equity_curve,
+            best_buy_hold_equity, best_trades).
+        """
+        if solo_ultimo_lotto:
+            risultato = self.ultimo_risultato
+        else:
+            best_params, best_results, _, best_equity_curve, best_buy_hold_equity, best_trades = self.migliore['risultato']
+            risultato = (best_params, best_results, self.all_results, best_equity_curve, best_buy_hold_equity, best_trades)
+        print(f"{self.descrizione} completata in {time.time() - self.start_time:.2f} secondi ({dettagli}).")
+        print(f"Migliori parametri trovati: {risultato[0]}")
+        return risultato
+
+
+def prepara_ricerca_adattiva(**parametri):
+    """
+    Crea la RicercaAdattiva di un'ottimizzazione adattiva, dopo aver verificato strategia e parametri.
+
+    Args:
+        **parametri: Argomenti di RicercaAdattiva.
+
+    Returns:
+        RicercaAdattiva: La ricerca (da chiudere a fine ottimizzazione, es. con with), oppure None se la
+            strategia non esiste o nessun parametro è configurato correttamente.
+    """
+    if parametri['strategia_nome'] not in STRATEGIE_DISPONIBILI:
+        print(f"Errore: Strategia '{parametri['strategia_nome']}' non trovata nella configurazione.")
+        return None
+    ricerca = RicercaAdattiva(**parametri)
+    if not ricerca.param_names:
+        print("Avviso ottimizzazione: Nessun parametro valido configurato per l'ottimizzazione.")
+        ricerca.chiudi()
+        return None
+    return ricerca
+
+
 def run_optimization(
     dati: pd.DataFrame, # DataFrame con dati OHLCV (senza indicatori/segnali iniziali)
     strategia_nome: str, # Nome della strategia da ottimizzare (deve essere in STRATEGIE_DISPONIBILI).
@@ -42,7 +844,29 @@ def run_optimization(
     # Callback per aggiornare il progresso
     progress_callback = None,
     # Numero totale di combinazioni (per il calcolo del progresso)
-    total_combinations = None
+    total_combinations = None,
+    # Valuta le combinazioni a blocchi con run_backtest_batch (solo esecuzione sequenziale)
+    backtest_batch: bool = False,
+    # Numero di combinazioni valutate per ogni chiamata batch
+    dimensione_blocco_batch: int = 256,
+    # Se False, per ogni combinazione calcola solo la metrica di ottimizzazione (e le alternative)
+    metriche_complete: bool = True,
+    # File SQLite (o CacheRisultati) in cui salvare/riprendere le combinazioni valutate (None = disattivata)
+    cache_risultati = None,
+    # Combinazioni per task nell'esecuzione parallela (None = automatico)
+    dimensione_blocco_parallelo: int = None,
+    # Come scegliere le max_combinazioni da testare: 'griglia', 'casuale', 'lhs' o 'sobol'
+    metodo_campionamento: str = 'griglia',
+    # Seme per un campionamento riproducibile
+    seme_campionamento: int = None,
+    # Combinazioni esplicite da valutare (tuple nell'ordine dei parametri), al posto della griglia
+    combinazioni: list = None,
+    # Risultati in tabella colonnare e artefatti solo per il migliore, ricostruiti alla fine (griglie molto grandi)
+    risultati_compatti: bool = False,
+    # Combinazioni migliori tenute in classifica in modalità compatta
+    top_k: int = 10,
+    # Risorse condivise tra più chiamate (SessioneOttimizzazione), es. i lotti delle ottimizzazioni adattive
+    sessione = None
 ) -> tuple:
     """
     Esegue l'ottimizzazione dei parametri per una data strategia utilizzando il backtesting.
@@ -66,19 +890,70 @@ def run_optimization(
             da massimizzare (default: 'Rendimento della strategia (%)').
         investimento_fisso_per_trade (float, optional): Importo fisso da investire per ogni trade.
         max_combinazioni (int, optional): Numero massimo di combinazioni da testare. Se None, testa tutte le combinazioni.
-        use_parallel (bool, optional): Se True, esegue l'ottimizzazione in parallelo utilizzando joblib.
+            Quali combinazioni vengono testate dipende da metodo_campionamento.
+        use_parallel (bool, optional): Se True, esegue l'ottimizzazione in parallelo con un pool di processi.
+            I dati OHLCV vengono messi una sola volta in memoria condivisa e ogni worker vi si collega
+            senza copiarli; ai worker vengono inviate solo le combinazioni di parametri. Se il pool non
+            è disponibile l'ottimizzazione prosegue in modalità sequenziale.
         n_jobs (int, optional): Numero di processi da utilizzare per l'ottimizzazione parallela.
             Se -1, utilizza tutti i core disponibili.
+        progress_callback (callable, optional): Funzione chiamata con (combinazioni processate, totale).
+        total_combinations (int, optional): Numero totale di combinazioni per il calcolo del progresso.
+        backtest_batch (bool, optional): Se True (e use_parallel è False) i segnali di blocchi di combinazioni
+            vengono allineati all'indice completo dei dati e valutati con una sola chiamata a run_backtest_batch,
+            condividendo i prezzi e senza copie del DataFrame per combinazione. Le barre di riscaldamento degli
+            indicatori restano senza segnali, quindi tutte le combinazioni sono valutate sullo stesso periodo.
+        dimensione_blocco_batch (int, optional): Numero di combinazioni per ogni chiamata batch (default: 256).
+        metriche_complete (bool, optional): Se True (default) ogni riga di all_results contiene tutte le metriche.
+            Se False per ogni combinazione vengono calcolate solo la metrica
+            di ottimizzazione e le ALTERNATIVE_METRICS; le metriche complete vengono calcolate una sola
+            volta, alla fine, per i parametri migliori.
+        cache_risultati (str | CacheRisultati, optional): Archivio SQLite dei risultati. Le combinazioni già
+            valutate con gli stessi dati, strategia e impostazioni vengono lette dall'archivio invece di essere
+            rieseguite, e quelle nuove vi vengono salvate durante l'esecuzione: un'ottimizzazione interrotta
+            riprende da dove si era fermata e allargando un range vengono valutati solo i punti nuovi.
+            Per il miglior risultato letto dall'archivio il backtest viene rieseguito una volta per
+            ricostruire equity e trade.
+        dimensione_blocco_parallelo (int, optional): Combinazioni inviate a ogni worker per task
+            nell'esecuzione parallela. Se None viene scelta in base al numero di combinazioni e di processi.
+            I risultati vengono elaborati man mano che i blocchi terminano (progresso e miglior risultato
+            aggiornati in corso d'opera) e i blocchi in sospeso sono al massimo due per processo.
+        metodo_campionamento (str, optional): Scelta delle max_combinazioni combinazioni (vedi utils.campionamento):
+            'griglia' (default) = le prime della griglia nell'ordine di itertools.product;
+            'casuale', 'lhs' (Latin hypercube) o 'sobol' = punti distinti ben distribuiti su tutto lo spazio
+            dei parametri, estratti senza costruire la griglia completa.
+        seme_campionamento (int, optional): Seme per estrazioni riproducibili ('casuale', 'lhs', 'sobol').
+        combinazioni (list, optional): Combinazioni da valutare (tuple di valori nell'ordine dei parametri di
+            parametri_ottimizzazione_config). Se indicate sostituiscono griglia e campionamento; usate ad
+            esempio dall'ottimizzazione guidata da modello surrogato per valutare un lotto di candidati.
+            Non vengono filtrate con i vincoli della strategia ("constraints" in STRATEGIE_DISPONIBILI),
+            che valgono per griglia e campionamento.
+        risultati_compatti (bool, optional): Se True i risultati di ogni combinazione vengono scritti in una
+            tabella colonnare preallocata (TabellaRisultati) invece che in un dizionario per combinazione, e
+            durante il ciclo non vengono copiati equity e trade dei risultati migliori: viene tenuta solo la
+            classifica delle top_k combinazioni e il backtest della migliore viene rieseguito alla fine per
+            ricostruirne gli artefatti. La memoria resta contenuta anche con milioni di combinazioni.
+            In questo caso all_results è un pd.DataFrame (una riga per combinazione). Senza combinazioni
+            esplicite la griglia (o il campione) viene generata e valutata man mano, senza costruire la lista
+            delle combinazioni; con cache_risultati l'archivio viene interrogato a lotti di
+            COMBINAZIONI_PER_LOTTO_CACHE combinazioni, solo per le chiavi del lotto.
+        top_k (int, optional): Combinazioni tenute in classifica in modalità compatta (default: 10).
+        sessione (SessioneOttimizzazione, optional): Sessione aperta con gli stessi dati (o dati di cui `dati`
+            è un tratto contiguo), strategia e impostazioni: dati preparati, cache degli indicatori e pool di
+            processi vengono riutilizzati invece di essere ricreati a ogni chiamata. In questo caso
+            use_parallel e n_jobs sono quelli della sessione. Se None viene creata una sessione solo per
+            questa chiamata.
 
     Returns:
         tuple: Una tupla contenente:
             - best_params (dict): Dizionario con i parametri che hanno dato il miglior risultato.
             - best_results (dict): Dizionario con le metriche complete del backtest per i migliori parametri.
             - all_results (list): Lista di dizionari, uno per ogni combinazione testata,
-              contenente i parametri e il valore della metrica di ottimizzazione.
+              contenente i parametri e il valore della metrica di ottimizzazione
+              (pd.DataFrame con una riga per combinazione se risultati_compatti è True).
             - best_equity_curve (pd.Series): Serie pandas con l'equity curve del miglior backtest.
             - best_buy_hold_equity (pd.Series): Serie pandas con l'equity curve Buy & Hold del miglior backtest.
-            - best_trades (list): Lista dei trade eseguiti nel miglior backtest.
+            - best_trades (np.ndarray): Round-trip del miglior backtest (array strutturato DTYPE_TRADE).
             Ritorna ({}, {}, [], pd.Series(), pd.Series(), []) se l'ottimizzazione fallisce o non ci sono combinazioni valide.
     """
 
@@ -88,48 +963,48 @@ def run_optimization(
     print(f"Nota: I parametri SL, TP e TS sono fissi e non vengono ottimizzati")
 
     # --- Carica il modulo della strategia dinamicamente ---
-    if strategia_nome not in STRATEGIE_DISPONIBILI:
-        print(f"Errore ottimizzazione: Strategia '{strategia_nome}' non trovata in STRATEGIE_DISPONIBILI.")
-        return {}, {}, [], pd.Series(dtype=float), pd.Series(dtype=float), []
-
-    try:
-        # Ottieni il percorso del modulo dalla configurazione
-        modulo_path = f"utils.logica_strategie.{STRATEGIE_DISPONIBILI[strategia_nome]['module']}"
-        modulo_strategia = importlib.import_module(modulo_path)
-        
-        # Ottieni il nome della classe dalla configurazione
-        class_name = STRATEGIE_DISPONIBILI[strategia_nome]['class']
-        
-        # Ottieni la classe dal modulo
-        strategy_class = getattr(modulo_strategia, class_name)
-
-    except ImportError as e:
-        print(f"Errore ottimizzazione: Impossibile importare il modulo strategia '{modulo_path}'. Dettagli: {e}")
-        return {}, {}, [], pd.Series(dtype=float), pd.Series(dtype=float), []
-    except Exception as e:
-        print(f"Errore ottimizzazione: Errore generico durante l'import o la verifica del modulo strategia. Dettagli: {e}")
+    strategy_class = _carica_classe_strategia(strategia_nome)
+    if strategy_class is None:
         return {}, {}, [], pd.Series(dtype=float), pd.Series(dtype=float), []
 
     # --- Prepara le combinazioni di parametri per la Grid Search ---
-    param_names = []
-    param_values = []
-
-    for param_name, param_config in parametri_ottimizzazione_config.items():
-        if 'min' in param_config and 'max' in param_config and 'step' in param_config:
-            param_names.append(param_name)
-            values = np.arange(param_config['min'], param_config['max'] + param_config['step'], param_config['step'])
-            param_values.append(values.tolist())
-        else:
-            print(f"Avviso ottimizzazione: Configurazione incompleta per il parametro '{param_name}'. Richiede 'min', 'max', 'step'. Parametro ignorato.")
-
+    param_names, param_values = valori_parametri(parametri_ottimizzazione_config)
     if not param_names:
         print("Avviso ottimizzazione: Nessun parametro valido configurato per l'ottimizzazione.")
         return {}, {}, [], pd.Series(dtype=float), pd.Series(dtype=float), []
 
-    param_combinations = list(itertools.product(*param_values))
+    # Combinazioni da valutare: quelle indicate, la griglia completa, oppure max_combinazioni punti scelti con metodo_campionamento
+    # (le combinazioni che violano i vincoli dichiarati della strategia non vengono generate)
+    vincoli = STRATEGIE_DISPONIBILI[strategia_nome].get('constraints', [])
+    filtro_vincoli = crea_filtro_vincoli(param_names, vincoli)
+    numero_totale = numero_combinazioni_valide(param_names, param_values, vincoli)
+    if filtro_vincoli is not None:
+        print(f"Vincoli {vincoli_applicabili(param_names, vincoli)}: {numero_totale} combinazioni valide "
+              f"su {numero_combinazioni(param_values)} della griglia")
+    n_da_valutare = numero_totale
+    if combinazioni is not None:
+        param_combinations = [tuple(combo) for combo in combinazioni]
+    elif max_combinazioni is not None and max_combinazioni > 0 and max_combinazioni < numero_totale:
+        n_da_valutare = max_combinazioni
+        if metodo_campionamento not in METODI_CAMPIONAMENTO:
+            print(f"Avviso ottimizzazione: Metodo di campionamento '{metodo_campionamento}' non valido "
+                  f"(disponibili: {METODI_CAMPIONAMENTO}). Uso 'griglia'.")
+            metodo_campionamento = 'griglia'
+        print(f"Limitazione a {max_combinazioni} combinazioni su {numero_totale} totali (campionamento: {metodo_campionamento})")
+    if combinazioni is None:
+        param_combinations = campiona_combinazioni(
+            param_values, n_da_valutare, metodo_campionamento if n_da_valutare < numero_totale else 'griglia',
+            seme_campionamento, vincolo=filtro_vincoli
+        )
+        if not risultati_compatti:
+            param_combinations = list(param_combinations)
+    # In modalità compatta le combinazioni generate (griglia o campione) vengono consumate man mano durante
+    # la valutazione, senza costruirne la lista: n_combinazioni è allora il numero previsto
+    combinazioni_in_streaming = not isinstance(param_combinations, list)
+    n_combinazioni = n_da_valutare if combinazioni_in_streaming else len(param_combinations)
 
     # Stima del tempo di elaborazione (assumendo circa 0.5 secondi per combinazione)
-    tempo_stimato_sec = len(param_combinations) * 0.5
+    tempo_stimato_sec = n_combinazioni * 0.5
     tempo_stimato_min = tempo_stimato_sec / 60
     
     if tempo_stimato_min < 1:
@@ -139,9 +1014,9 @@ def run_optimization(
     else:
         stima_tempo = f"{tempo_stimato_min/60:.1f} ore"
     
-    print(f"Numero totale di combinazioni da testare: {len(param_combinations)} (tempo stimato: {stima_tempo})")
-    if len(param_combinations) > 5000:
-         print(f"Avviso ottimizzazione: Elevato numero di combinazioni ({len(param_combinations)}). L'ottimizzazione potrebbe richiedere molto tempo. Considera di ridurre i range o aumentare gli step.")
+    print(f"Numero totale di combinazioni da testare: {n_combinazioni} (tempo stimato: {stima_tempo})")
+    if n_combinazioni > 5000:
+         print(f"Avviso ottimizzazione: Elevato numero di combinazioni ({n_combinazioni}). L'ottimizzazione potrebbe richiedere molto tempo. Considera di ridurre i range o aumentare gli step.")
 
     # --- Esegui Backtest per ogni combinazione ---
     best_performance = -float('inf')
@@ -149,399 +1024,350 @@ def run_optimization(
     best_results = {}
     best_equity_curve = pd.Series(dtype=float)
     best_buy_hold_equity = pd.Series(dtype=float)
-    best_trades = []
+    best_trades = np.empty(0, dtype=DTYPE_TRADE)
     all_results = []
+    migliore = _nuovo_migliore()
 
     start_time = time.time()
-    processed_count = 0
-    
-    # Limita il numero di combinazioni se specificato
-    if max_combinazioni is not None and max_combinazioni > 0 and max_combinazioni < len(param_combinations):
-        print(f"Limitazione a {max_combinazioni} combinazioni su {len(param_combinations)} totali")
-        param_combinations = param_combinations[:max_combinazioni]
-        
-    # Implementazione dell'ottimizzazione parallela se richiesta
-    if use_parallel and len(param_combinations) > 1:
-        try:
-            from joblib import Parallel, delayed
-            import multiprocessing
-            
-            # Determina il numero di processi da utilizzare
-            if n_jobs == -1:
-                n_jobs = multiprocessing.cpu_count()
-            
-            print(f"Esecuzione ottimizzazione in parallelo con {n_jobs} processi")
-            
-            # Funzione per eseguire un singolo backtest in parallelo
-            def run_single_backtest(combo, param_names):
-                current_params = dict(zip(param_names, combo))
-                current_combination_results = current_params.copy()
-                
-                try:
-                    # Crea un'istanza della strategia con i parametri correnti
-                    strategy_instance = strategy_class(df=dati.copy(), **current_params)
-                    dati_con_segnali = strategy_instance.generate_signals()
-                    
-                    if dati_con_segnali is None or dati_con_segnali.empty or 'Signal' not in dati_con_segnali.columns:
-                        current_combination_results[metrica_ottimizzazione] = MISSING_VALUE
-                        return current_combination_results, None, None, None, None, None
-                        
-                    trades, equity_curve, buy_hold_equity, metriche_risultati = run_backtest(
-                        dati_con_segnali,
-                        capitale_iniziale=capitale_iniziale,
-                        commissione_percentuale=commissione_percentuale,
-                        abilita_short=abilita_short,
-                        investimento_fisso_per_trade=investimento_fisso_per_trade,
-                        stop_loss_percent=stop_loss_percent,
-                        take_profit_percent=take_profit_percent,
-                        trailing_stop_percent=trailing_stop_percent
+
+    # Metriche calcolate per ogni combinazione (None = tutte)
+    metriche_richieste = None if metriche_complete else [metrica_ottimizzazione] + ALTERNATIVE_METRICS
+
+    parametri_backtest = dict(
+        capitale_iniziale=capitale_iniziale, commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short, investimento_fisso_per_trade=investimento_fisso_per_trade,
+        stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+        trailing_stop_percent=trailing_stop_percent
+    )
+
+    # --- Sessione: dati preparati, cache degli indicatori ed eventuale pool di processi ---
+    tratto = None
+    if sessione is not None:
+        tratto = sessione.tratto(dati, strategia_nome, param_names, parametri_backtest, metrica_ottimizzazione, metriche_richieste)
+        if tratto is None:
+            print("Avviso ottimizzazione: dati o impostazioni diversi da quelli della sessione. Uso una sessione dedicata.")
+    sessione_locale = None
+    if tratto is None:
+        # Sessione solo per questa chiamata: il pool eventualmente creato viene chiuso al termine delle valutazioni
+        sessione = sessione_locale = SessioneOttimizzazione(
+            dati, strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+            abilita_short, stop_loss_percent, take_profit_percent, trailing_stop_percent, metrica_ottimizzazione,
+            investimento_fisso_per_trade, metriche_complete, use_parallel=use_parallel, n_jobs=n_jobs
+        )
+        tratto = (0, len(dati))
+
+    # Dati per la strategia (nomi colonne in maiuscolo), preparati una sola volta dalla sessione
+    dati_per_strategia, cache_indicatori = sessione.dati_tratto(tratto)
+    if dati_per_strategia is None:
+        return {}, {}, [], pd.Series(dtype=float), pd.Series(dtype=float), []
+
+    # L'esecuzione a blocchi vale solo senza parallelismo (anche se restano poche combinazioni da valutare)
+    backtest_batch = backtest_batch and not sessione.use_parallel
+
+    # --- Cache persistente: salta le combinazioni già valutate con gli stessi dati e impostazioni ---
+    impostazioni_backtest = {
+        'capitale_iniziale': capitale_iniziale,
+        'commissione_percentuale': commissione_percentuale,
+        'abilita_short': abilita_short,
+        'investimento_fisso_per_trade': investimento_fisso_per_trade,
+        'stop_loss_percent': stop_loss_percent,
+        'take_profit_percent': take_profit_percent,
+        'trailing_stop_percent': trailing_stop_percent,
+        'metrica_ottimizzazione': metrica_ottimizzazione,
+        'metriche_complete': metriche_complete,
+        'backtest_batch': backtest_batch,
+    }
+    # (in streaming l'archivio viene interrogato lotto per lotto, solo per le combinazioni del lotto)
+    archivio_risultati, contesto_cache, risultati_memorizzati = _apri_cache_risultati(
+        cache_risultati, dati, strategia_nome, impostazioni_backtest, carica=not combinazioni_in_streaming
+    )
+    chiavi_combinazioni = []
+    risultati_in_cache = {}
+    if archivio_risultati is not None and not combinazioni_in_streaming:
+        chiavi_combinazioni = [chiave_parametri(dict(zip(param_names, combo))) for combo in param_combinations]
+        risultati_in_cache = {k: risultati_memorizzati[k] for k in chiavi_combinazioni if k in risultati_memorizzati}
+        param_combinations = [
+            combo for combo, chiave in zip(param_combinations, chiavi_combinazioni) if chiave not in risultati_in_cache
+        ]
+        n_combinazioni = len(param_combinations)
+        print(f"Cache risultati: {len(risultati_in_cache)} combinazioni già valutate, {n_combinazioni} da valutare")
+    gia_valutate = len(risultati_in_cache)
+
+    # Modalità compatta: tabella colonnare e nessuna copia degli artefatti durante il ciclo
+    if risultati_compatti:
+        all_results = TabellaRisultati(param_names, metrica_ottimizzazione, n_combinazioni, top_k)
+
+    def valuta(combinazioni_da_valutare, n_da_processare: int, destinazione, completate_prima: int) -> int:
+        """
+        Valuta le combinazioni (lista o iteratore, consumato man mano) con le risorse della sessione: in
+        parallelo se ha un pool, altrimenti in sequenziale o a blocchi. Le righe vengono aggiunte a
+        destinazione nell'ordine delle combinazioni e salvate nella cache dei risultati; il progresso
+        riportato parte da completate_prima.
+
+        Returns:
+            int: Numero di righe (le prime aggiunte a destinazione) calcolate dai worker paralleli.
+        """
+        combinazioni_da_valutare = iter(combinazioni_da_valutare)
+        processed_count = 0
+        righe_salvate = 0
+        righe_parallele = 0
+
+        executor = sessione.executor() if n_da_processare > 1 else None
+        if executor is not None:
+            n_processi = sessione.n_processi
+            dimensione_blocco = dimensione_blocco_parallelo or _dimensione_blocco_parallelo(n_da_processare, n_processi)
+            non_completate = []
+            print(f"Esecuzione ottimizzazione in parallelo con {n_processi} processi (blocchi da {dimensione_blocco} combinazioni)")
+            try:
+                combinazioni_completate = 0
+                performance_in_corso = -float('inf')
+                for risultati_blocco, blocchi_in_ordine in _risultati_paralleli(
+                    executor, combinazioni_da_valutare, dimensione_blocco, 2 * n_processi, tratto, non_completate
+                ):
+                    # Miglior risultato provvisorio (quello definitivo è scelto nell'ordine della griglia)
+                    for current_combination_results, current_performance in risultati_blocco:
+                        if current_performance is not None and current_performance > performance_in_corso:
+                            performance_in_corso = current_performance
+                            parametri_riga = {nome: current_combination_results[nome] for nome in param_names}
+                            print(f"Nuovo miglior risultato: {current_performance:.2f} con parametri {parametri_riga}")
+                    combinazioni_completate += len(risultati_blocco)
+
+                    # destinazione resta nell'ordine della griglia: vi entrano solo i blocchi contigui
+                    for blocco_in_ordine in blocchi_in_ordine:
+                        destinazione.extend(riga for riga, _ in blocco_in_ordine)
+                        righe_parallele += len(blocco_in_ordine)
+                    righe_salvate = _salva_risultati_nuovi(archivio_risultati, contesto_cache, destinazione, param_names, righe_salvate)
+
+                    elapsed_time = time.time() - start_time
+                    print(f"Processate {combinazioni_completate}/{n_da_processare} combinazioni. Tempo trascorso: {elapsed_time:.2f}s")
+                    if progress_callback and total_combinations:
+                        progress_callback(completate_prima + combinazioni_completate, total_combinations)
+                print(f"Completati {righe_parallele} backtest in parallelo")
+            except Exception as e:
+                # I blocchi già riportati in destinazione restano validi: si prosegue in sequenziale con quelli
+                # inviati ma non completati e con le combinazioni non ancora inviate
+                sessione.interrompi_parallelo(e)
+                combinazioni_da_valutare = chain(non_completate, combinazioni_da_valutare)
+            processed_count = righe_parallele
+
+        if backtest_batch:
+            # Prezzi OHLC condivisi da tutte le combinazioni, nel formato del backtest
+            dati_batch = _prepara_dati_backtest(dati_per_strategia)
+            if not isinstance(dati_batch.index, pd.DatetimeIndex):
+                dati_batch.index = pd.to_datetime(dati_batch.index)
+            # Esecuzione a blocchi: i segnali di più combinazioni vengono valutati con una sola chiamata batch
+            for blocco in iter(lambda: list(islice(combinazioni_da_valutare, max(1, dimensione_blocco_batch))), []):
+                # Risultati del blocco nell'ordine delle combinazioni
+                risultati_blocco = [None] * len(blocco)
+                posizioni_valide = []
+                parametri_validi = []
+                colonne_segnali = []
+
+                for posizione, combo in enumerate(blocco):
+                    current_params = dict(zip(param_names, combo))
+                    dati_per_backtest = _genera_dati_backtest(strategy_class, dati_per_strategia, current_params, cache_indicatori)
+                    if dati_per_backtest is None:
+                        risultati_blocco[posizione] = current_params.copy()
+                        risultati_blocco[posizione][metrica_ottimizzazione] = -float('inf')  # Usa un valore molto negativo invece di 0.0
+                        continue
+                    # Allinea i segnali all'indice comune: le barre di riscaldamento degli indicatori non hanno segnali
+                    posizioni_valide.append(posizione)
+                    parametri_validi.append(current_params)
+                    colonne_segnali.append(
+                        dati_per_backtest['Signal'].reindex(dati_batch.index).fillna(0).to_numpy(dtype=float)
                     )
-                    
-                    # Stampa tutte le metriche disponibili per debug
-                    print(f"Metriche disponibili: {list(metriche_risultati.keys())}")
-                    
-                    # Copia tutte le metriche nei risultati
-                    for key, value in metriche_risultati.items():
-                        if isinstance(value, (int, float)) or hasattr(value, 'item'):
-                            try:
-                                # Converti valori numpy in Python standard
-                                if hasattr(value, 'item'):
-                                    current_combination_results[key] = value.item()
-                                else:
-                                    current_combination_results[key] = float(value)
-                            except (ValueError, TypeError) as e:
-                                print(f"Errore nella conversione della metrica {key}: {e}")
-                    
-                    if metrica_ottimizzazione in metriche_risultati:
-                        current_performance = metriche_risultati[metrica_ottimizzazione]
-                        # Verifica che il valore non sia NaN prima di assegnarlo
-                        if not pd.isna(current_performance) and not math.isnan(current_performance):
-                            current_combination_results[metrica_ottimizzazione] = current_performance
-                            return current_combination_results, current_params, metriche_risultati, equity_curve, buy_hold_equity, trades
-                        else:
-                            current_combination_results[metrica_ottimizzazione] = -float('inf')  # Usa un valore molto negativo invece di 0.0
-                            return current_combination_results, None, None, None, None, None
+
+                if parametri_validi:
+                    try:
+                        trades_blocco, equity_blocco, buy_hold_equity, metriche_blocco = run_backtest_batch(
+                            dati_batch,
+                            np.column_stack(colonne_segnali),
+                            capitale_iniziale=capitale_iniziale,
+                            commissione_percentuale=commissione_percentuale,
+                            abilita_short=abilita_short,
+                            investimento_fisso_per_trade=investimento_fisso_per_trade,
+                            stop_loss_percent=stop_loss_percent,
+                            take_profit_percent=take_profit_percent,
+                            trailing_stop_percent=trailing_stop_percent,
+                            restituisci_trade_log=True,
+                            metriche_richieste=metriche_richieste
+                        )
+                    except Exception as e:
+                        print(f"Errore durante il backtest batch di {len(parametri_validi)} combinazioni: {e}. Combinazioni saltate.")
+                        for posizione, current_params in zip(posizioni_valide, parametri_validi):
+                            risultati_blocco[posizione] = current_params.copy()
+                            risultati_blocco[posizione][metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
                     else:
-                        # Se la metrica non esiste, prova a usare una metrica alternativa
-                        alternative_metrics = [
-                            'Profitto/Perdita Totale (%)', 
-                            'Rendimento della strategia (%)',
-                            'Capitale Finale (€)',
-                            'Profitto/Perdita Totale (€)'
-                        ]
-                        
-                        for alt_metric in alternative_metrics:
-                            if alt_metric in metriche_risultati:
-                                current_performance = metriche_risultati[alt_metric]
-                                if not pd.isna(current_performance) and not math.isnan(current_performance):
-                                    current_combination_results[metrica_ottimizzazione] = current_performance
-                                    print(f"Usando metrica alternativa '{alt_metric}' invece di '{metrica_ottimizzazione}'")
-                                    return current_combination_results, current_params, metriche_risultati, equity_curve, buy_hold_equity, trades
-                                break
-                        
-                        current_combination_results[metrica_ottimizzazione] = -float('inf')  # Usa un valore molto negativo invece di 0.0
-                        return current_combination_results, None, None, None, None, None
-                        
-                except Exception as e:
-                    print(f"Errore durante il backtest per parametri {current_params}: {e}")
-                    current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
-                    return current_combination_results, None, None, None, None, None
-            
-            # Esegui i backtest in parallelo
-            results = Parallel(n_jobs=n_jobs)(
-                delayed(run_single_backtest)(combo, param_names) for combo in param_combinations
-            )
-            
-            # Elabora i risultati
-            for result, params, metrics, equity, bh_equity, trades in results:
-                all_results.append(result)
-                
-                if params is not None and metrics is not None:
-                    current_performance = result[metrica_ottimizzazione]
-                    # Verifica che il valore non sia NaN prima di confrontarlo
-                    if not pd.isna(current_performance) and not math.isnan(current_performance) and current_performance > best_performance:
-                        best_performance = current_performance
-                        best_params = params.copy()
-                        best_results = metrics.copy()
-                        best_equity_curve = equity.copy() if equity is not None else pd.Series(dtype=float)
-                        best_buy_hold_equity = bh_equity.copy() if bh_equity is not None else pd.Series(dtype=float)
-                        best_trades = trades.copy() if trades is not None else []
-            
-            processed_count = len(param_combinations)
-            print(f"Completati {processed_count} backtest in parallelo")
-            
-        except ImportError:
-            print("Modulo joblib non disponibile. Esecuzione in modalità sequenziale.")
-            # Continua con l'esecuzione sequenziale se joblib non è disponibile
-            for combo in param_combinations:
-                current_params = dict(zip(param_names, combo))
-                current_combination_results = current_params.copy()
+                        for j, (posizione, current_params) in enumerate(zip(posizioni_valide, parametri_validi)):
+                            metriche_risultati = metriche_blocco.iloc[j].to_dict()
+                            risultati_blocco[posizione], current_performance = _risultati_combinazione(
+                                current_params, metriche_risultati, metrica_ottimizzazione
+                            )
+                            if not risultati_compatti and current_performance is not None and current_performance > migliore['performance']:
+                                _aggiorna_migliore(
+                                    migliore, current_performance, current_params, metriche_risultati,
+                                    equity_blocco.iloc[:, j], buy_hold_equity, trades_blocco[j]
+                                )
 
-                try:
-                    # Crea un'istanza della strategia con i parametri correnti
-                    strategy_instance = strategy_class(df=dati.copy(), **current_params)
-                    dati_con_segnali = strategy_instance.generate_signals()
+                destinazione.extend(risultati_blocco)
+                processed_count += len(blocco)
+                righe_salvate = _salva_risultati_nuovi(archivio_risultati, contesto_cache, destinazione, param_names, righe_salvate)
 
-                    if dati_con_segnali is None or dati_con_segnali.empty or 'Signal' not in dati_con_segnali.columns:
-                         print(f"Avviso ottimizzazione: Generazione segnali fallita o dati non validi per parametri {current_params}. Combinazione saltata.")
-                         current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
-                         all_results.append(current_combination_results)
-                         processed_count += 1
-                         continue
+                elapsed_time = time.time() - start_time
+                print(f"Processate {processed_count}/{n_da_processare} combinazioni. Tempo trascorso: {elapsed_time:.2f}s")
+                if progress_callback and total_combinations:
+                    progress_callback(completate_prima + processed_count, total_combinations)
 
-                except Exception as e:
-                    print(f"Errore durante la generazione segnali per parametri {current_params}: {e}. Combinazione saltata.")
-                    current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
-                    all_results.append(current_combination_results)
+        else:
+            # Dopo un'esecuzione parallela interrotta restano solo le combinazioni non ancora valutate
+            for combo in combinazioni_da_valutare:
+                current_params = dict(zip(param_names, combo))
+                current_combination_results = current_params.copy()
+
+                dati_per_backtest = _genera_dati_backtest(strategy_class, dati_per_strategia, current_params, cache_indicatori)
+                if dati_per_backtest is None:
+                    current_combination_results[metrica_ottimizzazione] = -float('inf')  # Usa un valore molto negativo invece di 0.0
+                    destinazione.append(current_combination_results)
                     processed_count += 1
                     continue
 
                 try:
                     trades, equity_curve, buy_hold_equity, metriche_risultati = run_backtest(
-                        dati_con_segnali,
+                        dati_per_backtest,
                         capitale_iniziale=capitale_iniziale,
                         commissione_percentuale=commissione_percentuale,
                         abilita_short=abilita_short,
                         investimento_fisso_per_trade=investimento_fisso_per_trade,
                         stop_loss_percent=stop_loss_percent,
                         take_profit_percent=take_profit_percent,
-                        trailing_stop_percent=trailing_stop_percent
+                        trailing_stop_percent=trailing_stop_percent,
+                        metriche_richieste=metriche_richieste
                     )
 
-                    # Stampa tutte le metriche disponibili per debug
-                    print(f"Metriche disponibili: {list(metriche_risultati.keys())}")
-                    
-                    # Copia tutte le metriche nei risultati
-                    for key, value in metriche_risultati.items():
-                        if isinstance(value, (int, float)) or hasattr(value, 'item'):
-                            try:
-                                # Converti valori numpy in Python standard
-                                if hasattr(value, 'item'):
-                                    current_combination_results[key] = value.item()
-                                else:
-                                    current_combination_results[key] = float(value)
-                            except (ValueError, TypeError) as e:
-                                print(f"Errore nella conversione della metrica {key}: {e}")
-
-                    # Verifica la metrica principale di ottimizzazione
-                    if metrica_ottimizzazione in metriche_risultati:
-                        current_performance = metriche_risultati[metrica_ottimizzazione]
-                        print(f"Valore della metrica '{metrica_ottimizzazione}': {current_performance}")
-                        
-                        # Verifica che il valore non sia NaN prima di assegnarlo
-                        if not pd.isna(current_performance) and not math.isnan(current_performance):
-                            current_combination_results[metrica_ottimizzazione] = current_performance
-                            if current_performance > best_performance:
-                                best_performance = current_performance
-                                best_params = current_params.copy()
-                                best_results = metriche_risultati.copy()
-                                best_equity_curve = equity_curve.copy() if equity_curve is not None else pd.Series(dtype=float)
-                                best_buy_hold_equity = buy_hold_equity.copy() if buy_hold_equity is not None else pd.Series(dtype=float)
-                                best_trades = trades.copy() if trades is not None else []
-                                print(f"Nuovo miglior risultato: {best_performance:.2f} con parametri {best_params}")
-                        else:
-                            current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
-                    else:
-                        # Se la metrica non esiste, prova a usare una metrica alternativa
-                        alternative_metrics = [
-                            'Profitto/Perdita Totale (%)', 
-                            'Rendimento della strategia (%)',
-                            'Capitale Finale (€)',
-                            'Profitto/Perdita Totale (€)'
-                        ]
-                        
-                        for alt_metric in alternative_metrics:
-                            if alt_metric in metriche_risultati:
-                                current_performance = metriche_risultati[alt_metric]
-                                if not pd.isna(current_performance) and not math.isnan(current_performance):
-                                    current_combination_results[metrica_ottimizzazione] = current_performance
-                                    print(f"Usando metrica alternativa '{alt_metric}' invece di '{metrica_ottimizzazione}'")
-                                    
-                                    # Aggiorna i migliori parametri se la performance è migliore
-                                    if current_performance > best_performance:
-                                        best_performance = current_performance
-                                        best_params = current_params.copy()
-                                        best_results = metriche_risultati.copy()
-                                        best_equity_curve = equity_curve.copy() if equity_curve is not None else pd.Series(dtype=float)
-                                        best_buy_hold_equity = buy_hold_equity.copy() if buy_hold_equity is not None else pd.Series(dtype=float)
-                                        best_trades = trades.copy() if trades is not None else []
-                                        print(f"Nuovo miglior risultato: {best_performance:.2f} con parametri {best_params}")
-                                    break
-                        else:
-                            print(f"Avviso ottimizzazione: Metrica '{metrica_ottimizzazione}' non trovata nei risultati del backtest per parametri {current_params}.")
-                            print(f"Metriche disponibili: {list(metriche_risultati.keys())}")
-                            current_combination_results[metrica_ottimizzazione] = -float('inf')  # Usa un valore molto negativo invece di 0.0
-
-                    all_results.append(current_combination_results)
+                    current_combination_results, current_performance = _risultati_combinazione(
+                        current_params, metriche_risultati, metrica_ottimizzazione
+                    )
+                    if not risultati_compatti and current_performance is not None and current_performance > migliore['performance']:
+                        _aggiorna_migliore(
+                            migliore, current_performance, current_params, metriche_risultati,
+                            equity_curve, buy_hold_equity, trades
+                        )
+                    destinazione.append(current_combination_results)
 
                 except Exception as e:
                     print(f"Errore durante il backtest per parametri {current_params}: {e}. Combinazione saltata.")
-                    current_combination_results[metrica_ottimizzazione] = -float('inf')  # Usa un valore molto negativo invece di 0.0
-                    all_results.append(current_combination_results)
+                    current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
+                    destinazione.append(current_combination_results)
 
                 processed_count += 1
-                if processed_count % 10 == 0 or processed_count == len(param_combinations):
+                if processed_count % 10 == 0 or processed_count == n_da_processare:
                      elapsed_time = time.time() - start_time
-                     print(f"Processate {processed_count}/{len(param_combinations)} combinazioni. Tempo trascorso: {elapsed_time:.2f}s")
-    else:
-        # Esecuzione sequenziale standard
-        for combo in param_combinations:
-            current_params = dict(zip(param_names, combo))
-            current_combination_results = current_params.copy()
+                     print(f"Processate {processed_count}/{n_da_processare} combinazioni. Tempo trascorso: {elapsed_time:.2f}s")
+                     righe_salvate = _salva_risultati_nuovi(archivio_risultati, contesto_cache, destinazione, param_names, righe_salvate)
+                     # Aggiorna il progresso tramite callback se disponibile
+                     if progress_callback and total_combinations:
+                         progress_callback(completate_prima + processed_count, total_combinations)
 
-            try:
-                # Crea un'istanza della strategia con i parametri correnti
-                # Assicurati che i dati abbiano le colonne nel formato corretto per la strategia
-                dati_per_strategia = dati.copy()
-                
-                # Standardizza i nomi delle colonne per la strategia (maiuscole)
-                if isinstance(dati_per_strategia.columns, pd.MultiIndex):
-                    dati_per_strategia.columns = dati_per_strategia.columns.get_level_values(0)
-                
-                # Verifica che le colonne necessarie esistano prima di convertirle in maiuscolo
-                required_cols = ['Open', 'High', 'Low', 'Close', 'Volume']
-                missing_cols = [col for col in required_cols if col not in dati_per_strategia.columns]
-                if missing_cols:
-                    print(f"Errore: DataFrame mancante di colonne OHLCV essenziali. Mancanti: {missing_cols}")
-                    print(f"Colonne disponibili: {dati_per_strategia.columns.tolist()}")
-                    return {}, {}, [], pd.Series(dtype=float), pd.Series(dtype=float), []
-                
-                # Converti i nomi delle colonne in maiuscolo
-                dati_per_strategia.columns = [col.upper() for col in dati_per_strategia.columns]
-                
-                strategy_instance = strategy_class(df=dati_per_strategia, **current_params)
-                dati_con_segnali = strategy_instance.generate_signals()
+        _salva_risultati_nuovi(archivio_risultati, contesto_cache, destinazione, param_names, righe_salvate)
+        return righe_parallele
 
-                if dati_con_segnali is None or dati_con_segnali.empty or 'Signal' not in dati_con_segnali.columns:
-                     print(f"Avviso ottimizzazione: Generazione segnali fallita o dati non validi per parametri {current_params}. Combinazione saltata.")
-                     current_combination_results[metrica_ottimizzazione] = -float('inf')  # Usa un valore molto negativo invece di 0.0
-                     all_results.append(current_combination_results)
-                     processed_count += 1
-                     continue
+    righe_parallele = 0
+    try:
+        if combinazioni_in_streaming and archivio_risultati is not None:
+            # Per ogni lotto si cercano nell'archivio solo le sue combinazioni, si valutano le mancanti e
+            # le righe vengono unite nell'ordine della griglia
+            completate = 0
+            for lotto in iter(lambda: list(islice(param_combinations, COMBINAZIONI_PER_LOTTO_CACHE)), []):
+                chiavi_lotto = [chiave_parametri(dict(zip(param_names, combo))) for combo in lotto]
+                in_cache = _cerca_risultati(archivio_risultati, contesto_cache, chiavi_lotto)
+                righe_nuove = []
+                valuta(
+                    [combo for combo, chiave in zip(lotto, chiavi_lotto) if chiave not in in_cache],
+                    len(lotto) - len(in_cache), righe_nuove, completate + len(in_cache)
+                )
+                righe_nuove = iter(righe_nuove)
+                all_results.extend(in_cache[chiave] if chiave in in_cache else next(righe_nuove) for chiave in chiavi_lotto)
+                gia_valutate += len(in_cache)
+                completate += len(lotto)
+                if progress_callback and total_combinations:
+                    progress_callback(completate, total_combinations)
+            print(f"Cache risultati: {gia_valutate} combinazioni già valutate, {completate - gia_valutate} valutate ora")
+        else:
+            righe_parallele = valuta(param_combinations, n_combinazioni, all_results, gia_valutate)
+    finally:
+        if sessione_locale is not None:
+            sessione_locale.chiudi()
 
-            except Exception as e:
-                print(f"Errore durante la generazione segnali per parametri {current_params}: {e}. Combinazione saltata.")
-                current_combination_results[metrica_ottimizzazione] = -float('inf')  # Usa un valore molto negativo invece di 0.0
-                all_results.append(current_combination_results)
-                processed_count += 1
-                continue
+    best_performance = migliore['performance']
+    best_params = migliore['params']
+    best_results = migliore['results']
+    best_equity_curve = migliore['equity_curve']
+    best_buy_hold_equity = migliore['buy_hold_equity']
+    best_trades = migliore['trades']
 
-            try:
-                # Assicurati che i dati abbiano le colonne nel formato corretto per il backtest (prima lettera maiuscola)
-                dati_per_backtest = dati_con_segnali.copy()
-                
-                # Rinomina le colonne nel formato richiesto dal backtest
-                column_mapping = {
-                    'OPEN': 'Open', 
-                    'HIGH': 'High', 
-                    'LOW': 'Low', 
-                    'CLOSE': 'Close', 
-                    'VOLUME': 'Volume'
-                }
-                
-                # Verifica che le colonne necessarie esistano prima di rinominarle
-                missing_cols = [old_col for old_col in ['OPEN', 'HIGH', 'LOW', 'CLOSE'] if old_col not in dati_per_backtest.columns]
-                if missing_cols:
-                    print(f"Errore: DataFrame mancante di colonne OHLC essenziali. Mancanti: {missing_cols}")
-                    print(f"Colonne disponibili: {dati_per_backtest.columns.tolist()}")
-                    current_combination_results[metrica_ottimizzazione] = -float('inf')
-                    all_results.append(current_combination_results)
-                    processed_count += 1
-                    continue
-                
-                for old_col, new_col in column_mapping.items():
-                    if old_col in dati_per_backtest.columns:
-                        dati_per_backtest.rename(columns={old_col: new_col}, inplace=True)
-                
-                trades, equity_curve, buy_hold_equity, metriche_risultati = run_backtest(
-                    dati_per_backtest,
-                    capitale_iniziale=capitale_iniziale,
-                    commissione_percentuale=commissione_percentuale,
-                    abilita_short=abilita_short,
-                    investimento_fisso_per_trade=investimento_fisso_per_trade,
-                    stop_loss_percent=stop_loss_percent,
-                    take_profit_percent=take_profit_percent,
-                    trailing_stop_percent=trailing_stop_percent
-                )
+    # Metriche complete solo per il miglior risultato, dagli artefatti già salvati
+    if not metriche_complete and best_params and not risultati_compatti:
+        best_results = calcola_metriche(
+            best_trades, best_equity_curve.to_numpy(), best_equity_curve.index, capitale_iniziale
+        )
 
-                # Stampa tutte le metriche disponibili per debug
-                print(f"Metriche disponibili: {list(metriche_risultati.keys())}")
-                
-                # Copia tutte le metriche nei risultati
-                for key, value in metriche_risultati.items():
-                    if isinstance(value, (int, float)) or hasattr(value, 'item'):
-                        try:
-                            # Converti valori numpy in Python standard
-                            if hasattr(value, 'item'):
-                                current_combination_results[key] = value.item()
-                            else:
-                                current_combination_results[key] = float(value)
-                        except (ValueError, TypeError) as e:
-                            print(f"Errore nella conversione della metrica {key}: {e}")
-
-                # Verifica la metrica principale di ottimizzazione
-                if metrica_ottimizzazione in metriche_risultati:
-                    current_performance = metriche_risultati[metrica_ottimizzazione]
-                    print(f"Valore della metrica '{metrica_ottimizzazione}': {current_performance}")
-                    
-                    # Verifica che il valore non sia NaN prima di assegnarlo
-                    if not pd.isna(current_performance) and not math.isnan(current_performance):
-                        current_combination_results[metrica_ottimizzazione] = current_performance
-                        if current_performance > best_performance:
-                            best_performance = current_performance
-                            best_params = current_params.copy()
-                            best_results = metriche_risultati.copy()
-                            best_equity_curve = equity_curve.copy() if equity_curve is not None else pd.Series(dtype=float)
-                            best_buy_hold_equity = buy_hold_equity.copy() if buy_hold_equity is not None else pd.Series(dtype=float)
-                            best_trades = trades.copy() if trades is not None else []
-                            print(f"Nuovo miglior risultato: {best_performance:.2f} con parametri {best_params}")
-                    else:
-                        current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
-                else:
-                    # Se la metrica non esiste, prova a usare una metrica alternativa
-                    alternative_metrics = [
-                        'Profitto/Perdita Totale (%)', 
-                        'Rendimento della strategia (%)',
-                        'Capitale Finale (€)',
-                        'Profitto/Perdita Totale (€)'
-                    ]
-                    
-                    for alt_metric in alternative_metrics:
-                        if alt_metric in metriche_risultati:
-                            current_performance = metriche_risultati[alt_metric]
-                            if not pd.isna(current_performance) and not math.isnan(current_performance):
-                                current_combination_results[metrica_ottimizzazione] = current_performance
-                                print(f"Usando metrica alternativa '{alt_metric}' invece di '{metrica_ottimizzazione}'")
-                                
-                                # Aggiorna i migliori parametri se la performance è migliore
-                                if current_performance > best_performance:
-                                    best_performance = current_performance
-                                    best_params = current_params.copy()
-                                    best_results = metriche_risultati.copy()
-                                    best_equity_curve = equity_curve.copy() if equity_curve is not None else pd.Series(dtype=float)
-                                    best_buy_hold_equity = buy_hold_equity.copy() if buy_hold_equity is not None else pd.Series(dtype=float)
-                                    best_trades = trades.copy() if trades is not None else []
-                                    print(f"Nuovo miglior risultato: {best_performance:.2f} con parametri {best_params}")
-                                break
-                    else:
-                        print(f"Avviso ottimizzazione: Metrica '{metrica_ottimizzazione}' non trovata nei risultati del backtest per parametri {current_params}.")
-                        print(f"Metriche disponibili: {list(metriche_risultati.keys())}")
-                        current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
+    if risultati_compatti:
+        # Artefatti ricostruiti solo per la migliore combinazione della classifica
+        migliore_compatto = _ricostruisci_migliore(
+            strategy_class, dati, all_results.migliori(), param_names, metrica_ottimizzazione,
+            -float('inf'), parametri_backtest, backtest_batch=backtest_batch
+        )
+        if migliore_compatto is not None:
+            best_performance = migliore_compatto['performance']
+            best_params = migliore_compatto['params']
+            best_results = migliore_compatto['results']
+            best_equity_curve = migliore_compatto['equity_curve']
+            best_buy_hold_equity = migliore_compatto['buy_hold_equity']
+            best_trades = migliore_compatto['trades']
+    elif righe_parallele:
+        # I worker restituiscono solo le righe dei risultati: equity e trade del migliore
+        # vengono ricostruiti rieseguendone il backtest (con le metriche complete)
+        migliore_parallelo = _ricostruisci_migliore(
+            strategy_class, dati, all_results[:righe_parallele], param_names, metrica_ottimizzazione,
+            best_performance, parametri_backtest
+        )
+        if migliore_parallelo is not None:
+            best_performance = migliore_parallelo['performance']
+            best_params = migliore_parallelo['params']
+            best_results = migliore_parallelo['results']
+            best_equity_curve = migliore_parallelo['equity_curve']
+            best_buy_hold_equity = migliore_parallelo['buy_hold_equity']
+            best_trades = migliore_parallelo['trades']
 
-                all_results.append(current_combination_results)
+    if archivio_risultati is not None:
+        # In streaming le righe lette dall'archivio sono già nella tabella, nell'ordine della griglia
+        if not combinazioni_in_streaming:
+            # Il miglior risultato potrebbe essere tra quelli già in cache
+            migliore_cache = _ricostruisci_migliore(
+                strategy_class, dati, risultati_in_cache.values(), param_names, metrica_ottimizzazione, best_performance,
+                parametri_backtest, backtest_batch=backtest_batch
+            )
+            if migliore_cache is not None:
+                best_performance = migliore_cache['performance']
+                best_params = migliore_cache['params']
+                best_results = migliore_cache['results']
+                best_equity_curve = migliore_cache['equity_curve']
+                best_buy_hold_equity = migliore_cache['buy_hold_equity']
+                best_trades = migliore_cache['trades']
 
-            except Exception as e:
-                print(f"Errore durante il backtest per parametri {current_params}: {e}. Combinazione saltata.")
-                current_combination_results[metrica_ottimizzazione] = 0.0  # Usa 0.0 invece di NaN
-                all_results.append(current_combination_results)
-
-            processed_count += 1
-            if processed_count % 10 == 0 or processed_count == len(param_combinations):
-                 elapsed_time = time.time() - start_time
-                 print(f"Processate {processed_count}/{len(param_combinations)} combinazioni. Tempo trascorso: {elapsed_time:.2f}s")
-                 # Aggiorna il progresso tramite callback se disponibile
-                 if progress_callback and total_combinations:
-                     progress_callback(processed_count, total_combinations)
+            # Risultati nell'ordine della griglia: righe dalla cache e righe appena calcolate
+            risultati_nuovi = iter(all_results)
+            righe_in_ordine = (
+                risultati_in_cache[chiave] if chiave in risultati_in_cache else next(risultati_nuovi)
+                for chiave in chiavi_combinazioni
+            )
+            if risultati_compatti:
+                all_results = TabellaRisultati(param_names, metrica_ottimizzazione, len(chiavi_combinazioni), top_k)
+                all_results.extend(righe_in_ordine)
+            else:
+                all_results = list(righe_in_ordine)
+        if not isinstance(cache_risultati, CacheRisultati):
+            archivio_risultati.chiudi()
 
     end_time = time.time()
     total_time = end_time - start_time
@@ -556,6 +1382,9 @@ def run_optimization(
     # Stampa i migliori parametri dopo le metriche di performance
     print(f"Migliori parametri trovati: {best_params}")
 
+    if risultati_compatti:
+        return best_params, best_results, all_results.to_dataframe(), best_equity_curve, best_buy_hold_equity, best_trades
+
     # Assicurati che tutti i risultati siano serializzabili
     for result in all_results:
         for key in list(result.keys()):
@@ -566,3 +1395,78 @@ def run_optimization(
                     result[key] = float(result[key])
 
     return best_params, best_results, all_results, best_equity_curve, best_buy_hold_equity, best_trades
+
+
+def run_stop_optimization(
+    dati: pd.DataFrame, # DataFrame con dati OHLCV (senza indicatori/segnali iniziali)
+    strategia_nome: str, # Nome della strategia (deve essere in STRATEGIE_DISPONIBILI)
+    parametri_strategia: dict, # Parametri (fissi) della strategia, es. i migliori trovati da run_optimization
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    valori_stop_loss: list = (None,),
+    valori_take_profit: list = (None,),
+    valori_trailing_stop: list = (None,),
+    metrica_ottimizzazione: str = 'Rendimento della strategia (%)',
+    investimento_fisso_per_trade: float = None,
+) -> tuple:
+    """
+    Ottimizza Stop Loss, Take Profit e Trailing Stop per una strategia con parametri fissi.
+
+    I segnali vengono generati una sola volta e l'intera griglia di stop viene valutata con
+    run_stop_sweep, senza rieseguire la strategia per ogni combinazione di stop.
+
+    Args:
+        dati (pd.DataFrame): DataFrame con dati storici (OHLCV).
+        strategia_nome (str): Nome della strategia (deve essere in STRATEGIE_DISPONIBILI).
+        parametri_strategia (dict): Parametri della strategia, fissi durante l'ottimizzazione degli stop.
+        capitale_iniziale, commissione_percentuale, abilita_short, investimento_fisso_per_trade: Come in run_optimization.
+        valori_stop_loss, valori_take_profit, valori_trailing_stop (list, optional): Valori (%) da provare
+            per ciascuno stop; None = stop disabilitato.
+        metrica_ottimizzazione (str): Metrica da massimizzare (con le stesse ALTERNATIVE_METRICS di run_optimization).
+
+    Returns:
+        tuple: Una tupla contenente:
+            - migliori_stop (dict): {'stop_loss_percent', 'take_profit_percent', 'trailing_stop_percent'}
+              della combinazione migliore (None = stop disabilitato).
+            - metriche (pd.DataFrame): Tabella delle metriche indicizzata per (sl, tp, ts).
+            Ritorna ({}, pd.DataFrame()) se l'ottimizzazione fallisce.
+    """
+    strategy_class = _carica_classe_strategia(strategia_nome)
+    if strategy_class is None:
+        return {}, pd.DataFrame()
+    dati_per_strategia = _prepara_dati_strategia(dati)
+    if dati_per_strategia is None:
+        return {}, pd.DataFrame()
+    dati_per_backtest = _genera_dati_backtest(strategy_class, dati_per_strategia, parametri_strategia)
+    if dati_per_backtest is None:
+        return {}, pd.DataFrame()
+
+    start_time = time.time()
+    metriche = run_stop_sweep(
+        dati_per_backtest,
+        capitale_iniziale=capitale_iniziale,
+        commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short,
+        valori_stop_loss=valori_stop_loss,
+        valori_take_profit=valori_take_profit,
+        valori_trailing_stop=valori_trailing_stop,
+        investimento_fisso_per_trade=investimento_fisso_per_trade,
+    )
+    print(f"Valutate {len(metriche)} combinazioni di stop in {time.time() - start_time:.2f} secondi.")
+
+    # Metrica di ottimizzazione, con le stesse alternative di run_optimization
+    colonna = next((m for m in [metrica_ottimizzazione] + ALTERNATIVE_METRICS if m in metriche.columns), None)
+    if colonna is None or metriche[colonna].isna().all():
+        print(f"Avviso ottimizzazione: Metrica '{metrica_ottimizzazione}' non disponibile nei risultati dello sweep degli stop.")
+        return {}, metriche
+    if colonna != metrica_ottimizzazione:
+        print(f"Usando metrica alternativa '{colonna}' invece di '{metrica_ottimizzazione}'")
+
+    migliore = metriche[colonna].idxmax()
+    migliori_stop = {
+        nome: None if pd.isna(valore) else getattr(valore, 'item', lambda: valore)()
+        for nome, valore in zip(metriche.index.names, migliore)
+    }
+    print(f"Migliori stop trovati: {migliori_stop} ({colonna}: {metriche[colonna].max():.2f})")
+    return migliori_stop, metriche
@@ -0,0 +1,171 @@
+# ottimizzazione_evolutiva.py
+# Ottimizzazione dei parametri con un algoritmo evolutivo (genetico).
+#
+# Una popolazione di combinazioni evolve per generazioni: i genitori sono scelti per torneo, i figli
+# nascono per incrocio uniforme e mutazione e le combinazioni migliori passano invariate alla
+# generazione successiva (elitismo). I geni sono le posizioni nella griglia di ogni parametro, quindi
+# interi e float restano sempre sul passo configurato. Ogni generazione viene valutata come un unico
+# lotto con run_optimization (quindi anche in parallelo e con la cache dei risultati).
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.campionamento import campiona_combinazioni
+from utils.ottimizzazione_engine import prepara_ricerca_adattiva, risultato_vuoto
+
+# Tentativi di generare un figlio nuovo e valido prima di passare al successivo
+_MAX_TENTATIVI_FIGLIO = 20
+
+
+def _torneo(rng: np.random.Generator, idoneita: np.ndarray, dimensione_torneo: int) -> int:
+    """
+    Selezione per torneo: l'individuo migliore tra dimensione_torneo estratti a caso.
+    """
+    partecipanti = rng.integers(len(idoneita), size=dimensione_torneo)
+    return int(partecipanti[np.argmax(idoneita[partecipanti])])
+
+
+def _incrocio(rng: np.random.Generator, padre: tuple, madre: tuple, probabilita_incrocio: float) -> list:
+    """
+    Incrocio uniforme: ogni gene viene dall'uno o dall'altro genitore con uguale probabilità.
+    """
+    if rng.random() >= probabilita_incrocio:
+        return list(padre)
+    return [p if rng.random() < 0.5 else m for p, m in zip(padre, madre)]
+
+
+def _mutazione(rng: np.random.Generator, geni: list, livelli: np.ndarray, probabilita_mutazione: float,
+               ampiezza_mutazione: float) -> tuple:
+    """
+    Mutazione gaussiana delle posizioni nella griglia (almeno un passo, limitata agli estremi del range).
+    """
+    for j, n in enumerate(livelli):
+        if n > 1 and rng.random() < probabilita_mutazione:
+            spostamento = int(round(rng.normal(0.0, max(1.0, ampiezza_mutazione * (n - 1)))))
+            if spostamento == 0:
+                spostamento = 1 if rng.random() < 0.5 else -1
+            geni[j] = int(min(n - 1, max(0, geni[j] + spostamento)))
+    return tuple(geni)
+
+
+def run_evolutionary_optimization(
+    dati: pd.DataFrame,
+    strategia_nome: str,
+    parametri_ottimizzazione_config: dict,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+    metrica_ottimizzazione: str = 'Rendimento della strategia (%)',
+    investimento_fisso_per_trade: float = None,
+    n_valutazioni: int = 200,
+    dimensione_popolazione: int = 20,
+    n_elite: int = 2,
+    dimensione_torneo: int = 3,
+    probabilita_incrocio: float = 0.9,
+    probabilita_mutazione: float = None,
+    ampiezza_mutazione: float = 0.15,
+    seme: int = None,
+    use_parallel: bool = False,
+    n_jobs: int = -1,
+    progress_callback=None,
+    cache_risultati=None
+) -> tuple:
+    """
+    Ottimizzazione con algoritmo evolutivo entro un budget di combinazioni valutate.
+
+    La popolazione iniziale è un campione di Sobol della griglia (vincoli della strategia rispettati).
+    A ogni generazione le n_elite combinazioni migliori sopravvivono invariate e il resto della
+    popolazione è formato da figli nuovi (mai valutati e validi per i vincoli); solo i figli vengono
+    valutati, in un unico lotto. Le combinazioni non valide hanno idoneità minima.
+
+    Args:
+        dati, strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+        abilita_short, stop_loss_percent, take_profit_percent, trailing_stop_percent, metrica_ottimizzazione,
+        investimento_fisso_per_trade: Come in run_optimization.
+        n_valutazioni (int, optional): Numero massimo di combinazioni da valutare (default: 200).
+        dimensione_popolazione (int, optional): Individui per generazione (default: 20).
+        n_elite (int, optional): Migliori individui copiati nella generazione successiva (default: 2).
+        dimensione_torneo (int, optional): Partecipanti a ogni torneo di selezione (default: 3).
+        probabilita_incrocio (float, optional): Probabilità di incrocio tra i due genitori (default: 0.9).
+        probabilita_mutazione (float, optional): Probabilità di mutazione di ogni gene
+            (default: 1 / numero di parametri).
+        ampiezza_mutazione (float, optional): Deviazione standard della mutazione come frazione del range
+            di ogni parametro (default: 0.15, almeno un passo).
+        seme (int, optional): Seme del generatore casuale (stesso seme = stessa evoluzione).
+        use_parallel, n_jobs, cache_risultati: Passati a run_optimization per ogni generazione; dati preparati,
+            cache degli indicatori e pool di processi sono condivisi da tutte le generazioni (RicercaAdattiva).
+        progress_callback (callable, optional): Funzione chiamata con (combinazioni valutate, n_valutazioni).
+
+    Returns:
+        tuple: Come run_optimization (best_params, best_results, all_results, best_equity_curve,
+        best_buy_hold_equity, best_trades); all_results contiene le combinazioni di tutte le generazioni.
+    """
+    ricerca = prepara_ricerca_adattiva(
+        dati=dati, strategia_nome=strategia_nome, parametri_ottimizzazione_config=parametri_ottimizzazione_config,
+        capitale_iniziale=capitale_iniziale, commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short, stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+        trailing_stop_percent=trailing_stop_percent, metrica_ottimizzazione=metrica_ottimizzazione,
+        investimento_fisso_per_trade=investimento_fisso_per_trade, use_parallel=use_parallel, n_jobs=n_jobs,
+        cache_risultati=cache_risultati, progress_callback=progress_callback,
+        descrizione="Ottimizzazione evolutiva"
+    )
+    if ricerca is None:
+        return risultato_vuoto()
+    n_valutazioni = min(n_valutazioni, ricerca.n_valide)
+    dimensione_popolazione = max(2, min(dimensione_popolazione, n_valutazioni))
+    n_elite = min(max(0, n_elite), dimensione_popolazione - 1)
+    if probabilita_mutazione is None:
+        probabilita_mutazione = 1.0 / len(ricerca.param_names)
+    livelli = np.array(ricerca.livelli)
+
+    print(f"Inizio ottimizzazione evolutiva per la strategia: {strategia_nome}")
+    print(f"Budget: {n_valutazioni} combinazioni (popolazione di {dimensione_popolazione}, elite {n_elite})")
+
+    rng = np.random.default_rng(seme)
+    valutate = {}           # posizioni -> idoneità (metrica di ottimizzazione, -inf se non valida)
+    popolazione = []
+    lotto = [ricerca.posizioni(combo) for combo in campiona_combinazioni(
+        ricerca.param_values, dimensione_popolazione, 'sobol', seme, vincolo=ricerca.filtro_vincoli
+    )]
+    generazione = 0
+    with ricerca:
+        while lotto:
+            generazione += 1
+            performance = ricerca.valuta_lotto([ricerca.valori(posizioni) for posizioni in lotto], n_valutazioni)
+            if performance is None:
+                break
+            valutate.update(zip(lotto, performance))
+
+            # Nuova popolazione: elite della popolazione precedente più i figli appena valutati
+            popolazione = sorted(popolazione, key=lambda posizioni: valutate[posizioni], reverse=True)[:n_elite] + lotto
+            popolazione = sorted(popolazione, key=lambda posizioni: valutate[posizioni], reverse=True)[:dimensione_popolazione]
+            print(f"Generazione {generazione}: {len(valutate)}/{n_valutazioni} combinazioni valutate, "
+                  f"migliore {ricerca.migliore['performance']:.2f}. Tempo trascorso: {time.time() - ricerca.start_time:.2f}s")
+
+            mancanti = n_valutazioni - len(valutate)
+            if mancanti <= 0:
+                break
+
+            # --- Selezione, incrocio e mutazione ---
+            idoneita = np.array([valutate[posizioni] for posizioni in popolazione])
+            n_figli = min(dimensione_popolazione - n_elite, mancanti)
+            figli = {}
+            for _ in range(n_figli * _MAX_TENTATIVI_FIGLIO):
+                if len(figli) >= n_figli:
+                    break
+                padre = popolazione[_torneo(rng, idoneita, dimensione_torneo)]
+                madre = popolazione[_torneo(rng, idoneita, dimensione_torneo)]
+                figlio = _mutazione(rng, _incrocio(rng, padre, madre, probabilita_incrocio), livelli,
+                                    probabilita_mutazione, ampiezza_mutazione)
+                if figlio not in valutate and figlio not in figli and ricerca.rispetta_vincoli(figlio):
+                    figli[figlio] = None
+            if not figli:
+                print("Avviso ottimizzazione: nessuna nuova combinazione generata. Popolazione convergente, evoluzione interrotta.")
+            lotto = list(figli)
+
+    return ricerca.concludi(f"{len(valutate)} combinazioni valutate in {generazione} generazioni")
@@ -0,0 +1,320 @@
+# ottimizzazione_multi_ticker.py
+# Ottimizzazione robusta su più titoli: la stessa griglia di parametri viene valutata su ogni ticker
+# in un'unica esecuzione e i risultati sono aggregati per combinazione (media, mediana e caso peggiore
+# della metrica). Un unico pool di processi lavora su tutte le coppie (ticker, blocco di combinazioni);
+# i dati di ogni ticker sono copiati una sola volta in memoria condivisa e ogni worker tiene una cache
+# degli indicatori per ticker.
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+
+from utils.backtesting_engine import run_backtest
+from utils.cache_indicatori import CacheIndicatori
+from utils.memoria_condivisa import DatiCondivisi
+from utils.campionamento import campiona_combinazioni, crea_filtro_vincoli
+from utils.ottimizzazione_engine import (
+    ALTERNATIVE_METRICS, valori_parametri, _carica_classe_strategia, _prepara_dati_strategia,
+    _supporta_cache_indicatori, _genera_dati_backtest, _risultati_combinazione, _dimensione_blocco_parallelo
+)
+from utils.strategies_config import STRATEGIE_DISPONIBILI
+
+# Criteri di ordinamento delle combinazioni: colonna aggregata corrispondente
+CRITERI_ROBUSTEZZA = {
+    'media': 'Media',
+    'mediana': 'Mediana',
+    'peggiore': 'Peggiore',
+}
+
+
+# Stato del processo (worker o principale) che valuta le combinazioni sui ticker
+_stato_multi_ticker = {}
+
+
+def _prepara_stato_multi_ticker(dati_per_ticker: dict, strategia_nome: str, param_names: list,
+                                parametri_backtest: dict, metrica_ottimizzazione: str, blocchi=None):
+    """
+    Prepara una volta per processo classe della strategia e dati dei ticker (cache degli indicatori
+    create al primo uso di ogni ticker).
+    """
+    _stato_multi_ticker.clear()
+    _stato_multi_ticker.update(
+        blocchi=blocchi,  # Riferimenti che mantengono valida l'eventuale memoria condivisa
+        dati_per_ticker=dati_per_ticker,
+        strategy_class=_carica_classe_strategia(strategia_nome),
+        cache_per_ticker={},
+        param_names=param_names,
+        parametri_backtest=parametri_backtest,
+        metrica_ottimizzazione=metrica_ottimizzazione,
+    )
+
+
+def _inizializza_worker_multi_ticker(descrittori: dict, strategia_nome: str, param_names: list,
+                                     parametri_backtest: dict, metrica_ottimizzazione: str):
+    """
+    Inizializzatore dei processi worker: si collega ai dati di tutti i ticker in memoria condivisa.
+    """
+    blocchi = []
+    dati_per_ticker = {}
+    for ticker, descrittore in descrittori.items():
+        blocco, dati_per_ticker[ticker] = DatiCondivisi.collega(descrittore)
+        blocchi.append(blocco)
+    _prepara_stato_multi_ticker(dati_per_ticker, strategia_nome, param_names, parametri_backtest,
+                                metrica_ottimizzazione, blocchi)
+
+
+def _cache_ticker(ticker: str) -> CacheIndicatori:
+    """
+    Cache degli indicatori del ticker nel processo corrente (None se la strategia non la supporta).
+    """
+    cache_per_ticker = _stato_multi_ticker['cache_per_ticker']
+    if ticker not in cache_per_ticker:
+        strategy_class = _stato_multi_ticker['strategy_class']
+        cache_per_ticker[ticker] = (
+            CacheIndicatori(_stato_multi_ticker['dati_per_ticker'][ticker]) if _supporta_cache_indicatori(strategy_class) else None
+        )
+    return cache_per_ticker[ticker]
+
+
+def _valuta_blocco_ticker(compito: tuple) -> list:
+    """
+    Valuta un blocco di combinazioni su un ticker.
+
+    Args:
+        compito (tuple): (ticker, lista di combinazioni).
+
+    Returns:
+        list: Metrica di ottimizzazione per combinazione (NaN se la combinazione non è valida).
+    """
+    ticker, blocco = compito
+    metrica_ottimizzazione = _stato_multi_ticker['metrica_ottimizzazione']
+    dati_per_strategia = _stato_multi_ticker['dati_per_ticker'][ticker]
+    cache_indicatori = _cache_ticker(ticker)
+    performance = []
+    for combo in blocco:
+        current_params = dict(zip(_stato_multi_ticker['param_names'], combo))
+        dati_per_backtest = _genera_dati_backtest(
+            _stato_multi_ticker['strategy_class'], dati_per_strategia, current_params, cache_indicatori
+        )
+        if dati_per_backtest is None:
+            performance.append(math.nan)
+            continue
+        try:
+            _, _, _, metriche_risultati = run_backtest(
+                dati_per_backtest, metriche_richieste=[metrica_ottimizzazione] + ALTERNATIVE_METRICS,
+                **_stato_multi_ticker['parametri_backtest']
+            )
+        except Exception as e:
+            print(f"Errore durante il backtest di {ticker} per parametri {current_params}: {e}. Combinazione saltata.")
+            performance.append(math.nan)
+            continue
+        _, valore = _risultati_combinazione(current_params, metriche_risultati, metrica_ottimizzazione)
+        performance.append(math.nan if valore is None else float(valore))
+    return performance
+
+
+def aggrega_per_combinazione(param_names: list, param_combinations: list, tickers: list,
+                             prestazioni: np.ndarray, criterio_robustezza: str = 'mediana') -> pd.DataFrame:
+    """
+    Tabella dei risultati per combinazione: metrica su ogni ticker e statistiche tra i ticker.
+
+    Args:
+        prestazioni (np.ndarray): Matrice (combinazioni x ticker) della metrica (NaN se non valida).
+        criterio_robustezza (str, optional): Colonna aggregata usata per ordinare (vedi CRITERI_ROBUSTEZZA).
+
+    Returns:
+        pd.DataFrame: Parametri, una colonna per ticker, 'Media', 'Mediana', 'Peggiore' e 'Ticker validi',
+            ordinata dalla combinazione migliore: prima quelle valide su più ticker, poi secondo il criterio
+            (a parità, nell'ordine della griglia).
+    """
+    tabella = pd.DataFrame(param_combinations, columns=param_names)
+    for posizione, ticker in enumerate(tickers):
+        tabella[ticker] = prestazioni[:, posizione]
+    validi = np.isfinite(prestazioni)
+    n_validi = validi.sum(axis=1)
+    senza_validi = n_validi == 0
+    # Le combinazioni senza alcun ticker valido restano NaN (senza avvisi di NumPy sulle righe vuote)
+    righe = np.where(senza_validi[:, np.newaxis], 0.0, np.where(validi, prestazioni, np.nan))
+    tabella['Media'] = np.where(senza_validi, np.nan, np.nanmean(righe, axis=1))
+    tabella['Mediana'] = np.where(senza_validi, np.nan, np.nanmedian(righe, axis=1))
+    tabella['Peggiore'] = np.where(senza_validi, np.nan, np.nanmin(righe, axis=1))
+    tabella['Ticker validi'] = n_validi
+    colonna = CRITERI_ROBUSTEZZA[criterio_robustezza]
+    # Una combinazione non valida su un ticker non è robusta: non deve precedere quelle valide ovunque
+    return tabella.sort_values(['Ticker validi', colonna], ascending=False, kind='stable',
+                               na_position='last').reset_index(drop=True)
+
+
+def run_optimization_multi_ticker(
+    dati_per_ticker: dict,
+    strategia_nome: str,
+    parametri_ottimizzazione_config: dict,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+    metrica_ottimizzazione: str = 'Rendimento della strategia (%)',
+    investimento_fisso_per_trade: float = None,
+    criterio_robustezza: str = 'mediana',
+    max_combinazioni: int = None,
+    metodo_campionamento: str = 'griglia',
+    seme_campionamento: int = None,
+    use_parallel: bool = False,
+    n_jobs: int = -1,
+    progress_callback=None
+) -> tuple:
+    """
+    Valuta la stessa griglia di parametri su più ticker e aggrega i risultati per combinazione.
+
+    Ogni ticker è preparato una sola volta; con use_parallel le coppie (ticker, blocco di combinazioni)
+    sono distribuite su un unico pool di processi, altrimenti vengono valutate in sequenza con una cache
+    degli indicatori per ticker. Le combinazioni che violano i vincoli della strategia vengono saltate.
+
+    Args:
+        dati_per_ticker (dict): {ticker: DataFrame OHLCV} (ad es. da download_universe_data).
+        strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+        abilita_short, stop_loss_percent, take_profit_percent, trailing_stop_percent, metrica_ottimizzazione,
+        investimento_fisso_per_trade: Come in run_optimization.
+        criterio_robustezza (str, optional): 'media', 'mediana' (default) o 'peggiore': statistica della
+            metrica tra i ticker usata per scegliere la combinazione migliore.
+        max_combinazioni, metodo_campionamento, seme_campionamento: Combinazioni da valutare, come in
+            run_optimization (default: griglia completa).
+        use_parallel (bool, optional): Distribuisce ticker e combinazioni tra più processi.
+        n_jobs (int, optional): Numero di processi (-1 = tutti i core).
+        progress_callback (callable, optional): Funzione chiamata con (valutazioni eseguite, valutazioni totali),
+            dove una valutazione è una combinazione su un ticker.
+
+    Returns:
+        tuple: (best_params, risultati_aggregati): parametri della combinazione migliore secondo il criterio
+        ({} se nessuna è valida) e tabella di aggrega_per_combinazione.
+    """
+    risultato_vuoto = ({}, pd.DataFrame())
+    if criterio_robustezza not in CRITERI_ROBUSTEZZA:
+        print(f"Avviso ottimizzazione: criterio '{criterio_robustezza}' non valido "
+              f"(disponibili: {list(CRITERI_ROBUSTEZZA)}). Uso 'mediana'.")
+        criterio_robustezza = 'mediana'
+    if strategia_nome not in STRATEGIE_DISPONIBILI:
+        print(f"Errore: Strategia '{strategia_nome}' non trovata nella configurazione.")
+        return risultato_vuoto
+    if _carica_classe_strategia(strategia_nome) is None:
+        return risultato_vuoto
+
+    param_names, param_values = valori_parametri(parametri_ottimizzazione_config)
+    if not param_names:
+        print("Avviso ottimizzazione: Nessun parametro valido configurato per l'ottimizzazione.")
+        return risultato_vuoto
+
+    # Ogni ticker viene preparato (colonne in maiuscolo) una sola volta per tutta l'ottimizzazione
+    dati_preparati = {}
+    for ticker, dati in dati_per_ticker.items():
+        if dati is None or dati.empty:
+            continue
+        dati_per_strategia = _prepara_dati_strategia(dati)
+        if dati_per_strategia is None:
+            print(f"Avviso ottimizzazione: dati non validi per {ticker}, ticker escluso.")
+            continue
+        dati_preparati[ticker] = dati_per_strategia
+    tickers = list(dati_preparati)
+    if not tickers:
+        print("Avviso ottimizzazione: Nessun ticker con dati validi.")
+        return risultato_vuoto
+
+    filtro_vincoli = crea_filtro_vincoli(param_names, STRATEGIE_DISPONIBILI[strategia_nome].get('constraints', []))
+    param_combinations = list(campiona_combinazioni(
+        param_values, max_combinazioni, metodo_campionamento, seme_campionamento, vincolo=filtro_vincoli
+    ))
+    if not param_combinations:
+        print("Avviso ottimizzazione: Nessuna combinazione valida da valutare.")
+        return risultato_vuoto
+
+    parametri_backtest = dict(
+        capitale_iniziale=capitale_iniziale, commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short, investimento_fisso_per_trade=investimento_fisso_per_trade,
+        stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+        trailing_stop_percent=trailing_stop_percent
+    )
+    valutazioni_totali = len(param_combinations) * len(tickers)
+    print(f"Inizio ottimizzazione multi-ticker per la strategia: {strategia_nome} "
+          f"({len(param_combinations)} combinazioni su {len(tickers)} ticker, {valutazioni_totali} backtest)")
+
+    start_time = time.time()
+    prestazioni = np.full((len(param_combinations), len(tickers)), np.nan)
+    completati = set()      # (inizio del blocco, posizione del ticker) già valutati
+    valutazioni_eseguite = 0
+
+    def registra_compito(inizio: int, posizione_ticker: int, risultati: list):
+        nonlocal valutazioni_eseguite
+        prestazioni[inizio:inizio + len(risultati), posizione_ticker] = risultati
+        completati.add((inizio, posizione_ticker))
+        valutazioni_eseguite += len(risultati)
+        if progress_callback:
+            progress_callback(valutazioni_eseguite, valutazioni_totali)
+
+    n_processi = n_jobs if n_jobs is not None and n_jobs > 0 else (os.cpu_count() or 1)
+    # Blocchi limitati anche in sequenziale, così il progresso avanza durante la griglia di ogni ticker
+    dimensione_blocco = _dimensione_blocco_parallelo(valutazioni_totali, n_processi if use_parallel else 1)
+    # Compiti in ordine di blocco: a ogni blocco tutti i ticker avanzano insieme
+    compiti = [(inizio, posizione_ticker)
+               for inizio in range(0, len(param_combinations), dimensione_blocco)
+               for posizione_ticker in range(len(tickers))]
+
+    if use_parallel and valutazioni_totali > 1:
+        print(f"Esecuzione multi-ticker in parallelo con {n_processi} processi (blocchi da {dimensione_blocco} combinazioni)")
+        try:
+            with ExitStack() as risorse:
+                # I dati di ogni ticker vengono copiati una sola volta in memoria condivisa
+                descrittori = {ticker: risorse.enter_context(DatiCondivisi(dati_preparati[ticker])).descrittore
+                               for ticker in tickers}
+                executor = risorse.enter_context(ProcessPoolExecutor(
+                    max_workers=n_processi,
+                    initializer=_inizializza_worker_multi_ticker,
+                    initargs=(descrittori, strategia_nome, param_names, parametri_backtest, metrica_ottimizzazione)
+                ))
+                risultati = executor.map(
+                    _valuta_blocco_ticker,
+                    [(tickers[posizione_ticker], param_combinations[inizio:inizio + dimensione_blocco])
+                     for inizio, posizione_ticker in compiti]
+                )
+                for (inizio, posizione_ticker), risultati_compito in zip(compiti, risultati):
+                    registra_compito(inizio, posizione_ticker, risultati_compito)
+                    if len(completati) % len(tickers) == 0:
+                        print(f"Processati {valutazioni_eseguite}/{valutazioni_totali} backtest. "
+                              f"Tempo trascorso: {time.time() - start_time:.2f}s")
+        except Exception as e:
+            # I compiti già completati restano validi: si prosegue in sequenziale con i rimanenti
+            print(f"Esecuzione parallela non disponibile ({e}). Proseguo in modalità sequenziale.")
+
+    if len(completati) < len(compiti):
+        _prepara_stato_multi_ticker(dati_preparati, strategia_nome, param_names, parametri_backtest, metrica_ottimizzazione)
+        try:
+            for posizione_ticker, ticker in enumerate(tickers):
+                for inizio in range(0, len(param_combinations), dimensione_blocco):
+                    if (inizio, posizione_ticker) in completati:
+                        continue
+                    registra_compito(inizio, posizione_ticker, _valuta_blocco_ticker(
+                        (ticker, param_combinations[inizio:inizio + dimensione_blocco])
+                    ))
+                print(f"Completato {ticker}: {valutazioni_eseguite}/{valutazioni_totali} backtest. "
+                      f"Tempo trascorso: {time.time() - start_time:.2f}s")
+        finally:
+            _stato_multi_ticker.clear()
+
+    risultati_aggregati = aggrega_per_combinazione(param_names, param_combinations, tickers, prestazioni, criterio_robustezza)
+    colonna = CRITERI_ROBUSTEZZA[criterio_robustezza]
+    best_params = {}
+    if not risultati_aggregati.empty and pd.notna(risultati_aggregati.loc[0, colonna]):
+        best_params = {nome: risultati_aggregati.loc[0, nome] for nome in param_names}
+        best_params = {nome: valore.item() if hasattr(valore, 'item') else valore for nome, valore in best_params.items()}
+
+    print(f"Ottimizzazione multi-ticker completata in {time.time() - start_time:.2f} secondi.")
+    if best_params:
+        print(f"Migliori parametri ({criterio_robustezza} tra i ticker): {best_params} "
+              f"con {colonna.lower()} {risultati_aggregati.loc[0, colonna]:.2f}")
+    return best_params, risultati_aggregati
@@ -0,0 +1,151 @@
+# ottimizzazione_raffinamento.py
+# Ottimizzazione per raffinamento progressivo della griglia (coarse-to-fine): si valuta prima una
+# griglia rada su tutti i range dei parametri, poi si infittisce la griglia solo attorno alle celle
+# migliori, dimezzando il passo a ogni turno fino al passo richiesto. Con parametri float a passo
+# fine (es. multiplier del Supertrend, std delle Bande di Bollinger) si arriva allo stesso ottimo
+# con una frazione dei backtest della griglia completa.
+
+import math
+from itertools import product
+
+import pandas as pd
+
+from utils.ottimizzazione_engine import prepara_ricerca_adattiva, risultato_vuoto
+
+
+def passi_iniziali(livelli: list, punti_per_parametro: int) -> list:
+    """
+    Passo (in numero di valori della griglia fine) della griglia rada di ogni parametro.
+
+    Returns:
+        list: Un passo per parametro, tale che la griglia rada abbia circa punti_per_parametro valori.
+    """
+    punti_per_parametro = max(2, punti_per_parametro)
+    return [max(1, math.ceil((n - 1) / (punti_per_parametro - 1))) for n in livelli]
+
+
+def _griglia_rada(livelli: list, passi: list) -> list:
+    """
+    Posizioni della griglia rada: un valore ogni `passo`, più sempre l'ultimo valore del range.
+    """
+    assi = [sorted(set(range(0, n, passo)) | {n - 1}) for n, passo in zip(livelli, passi)]
+    return list(product(*assi))
+
+
+def _intorno(posizioni: tuple, livelli: list, passi_precedenti: list, passi: list) -> list:
+    """
+    Posizioni della griglia con i nuovi passi comprese fra le celle vicine (griglia precedente) di `posizioni`.
+    """
+    assi = []
+    for centro, n, passo_precedente, passo in zip(posizioni, livelli, passi_precedenti, passi):
+        ampiezza = math.ceil(passo_precedente / passo)
+        assi.append(sorted({centro + k * passo for k in range(-ampiezza, ampiezza + 1) if 0 <= centro + k * passo < n}))
+    return list(product(*assi))
+
+
+def run_coarse_to_fine(
+    dati: pd.DataFrame,
+    strategia_nome: str,
+    parametri_ottimizzazione_config: dict,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+    metrica_ottimizzazione: str = 'Rendimento della strategia (%)',
+    investimento_fisso_per_trade: float = None,
+    punti_per_parametro: int = 5,
+    fattore_raffinamento: int = 2,
+    celle_da_raffinare: int = 3,
+    use_parallel: bool = False,
+    n_jobs: int = -1,
+    progress_callback=None,
+    cache_risultati=None
+) -> tuple:
+    """
+    Ottimizzazione per raffinamento progressivo della griglia.
+
+    Il primo turno valuta circa punti_per_parametro valori di ogni range (estremi compresi). A ogni turno
+    il passo di ogni parametro si divide per fattore_raffinamento e si valutano le posizioni della griglia
+    più fitta comprese fra le celle vicine delle celle_da_raffinare combinazioni migliori trovate finora;
+    l'ultimo turno usa il passo richiesto in parametri_ottimizzazione_config. Le combinazioni già valutate
+    e quelle che violano i vincoli della strategia vengono saltate.
+
+    Args:
+        dati, strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+        abilita_short, stop_loss_percent, take_profit_percent, trailing_stop_percent, metrica_ottimizzazione,
+        investimento_fisso_per_trade: Come in run_optimization.
+        punti_per_parametro (int, optional): Valori per parametro della griglia rada iniziale (default: 5).
+        fattore_raffinamento (int, optional): Divisore del passo a ogni turno (default: 2).
+        celle_da_raffinare (int, optional): Combinazioni migliori attorno a cui infittire la griglia (default: 3).
+        use_parallel, n_jobs, cache_risultati: Passati a run_optimization per ogni turno; dati preparati,
+            cache degli indicatori e pool di processi sono condivisi da tutti i turni (RicercaAdattiva).
+        progress_callback (callable, optional): Funzione chiamata con (combinazioni valutate, stima del totale).
+
+    Returns:
+        tuple: Come run_optimization (best_params, best_results, all_results, best_equity_curve,
+        best_buy_hold_equity, best_trades); all_results contiene le combinazioni di tutti i turni.
+    """
+    if fattore_raffinamento < 2:
+        print(f"Avviso ottimizzazione: fattore_raffinamento ({fattore_raffinamento}) deve essere almeno 2. Uso 2.")
+        fattore_raffinamento = 2
+    ricerca = prepara_ricerca_adattiva(
+        dati=dati, strategia_nome=strategia_nome, parametri_ottimizzazione_config=parametri_ottimizzazione_config,
+        capitale_iniziale=capitale_iniziale, commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short, stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+        trailing_stop_percent=trailing_stop_percent, metrica_ottimizzazione=metrica_ottimizzazione,
+        investimento_fisso_per_trade=investimento_fisso_per_trade, use_parallel=use_parallel, n_jobs=n_jobs,
+        cache_risultati=cache_risultati, progress_callback=progress_callback,
+        descrizione="Ottimizzazione per raffinamento progressivo"
+    )
+    if ricerca is None:
+        return risultato_vuoto()
+    param_names = ricerca.param_names
+    livelli = ricerca.livelli
+    passi = passi_iniziali(livelli, punti_per_parametro)
+
+    # Stima del totale per la barra di avanzamento: griglia rada più (2 * fattore + 1)^d punti per cella
+    # raffinata a ogni turno, senza superare la griglia completa
+    turni_raffinamento = max((math.ceil(math.log(passo, fattore_raffinamento)) for passo in passi if passo > 1), default=0)
+    stima_totale = min(ricerca.n_valide, len(_griglia_rada(livelli, passi))
+                       + turni_raffinamento * celle_da_raffinare * (2 * fattore_raffinamento + 1) ** len(param_names))
+
+    print(f"Inizio raffinamento progressivo per la strategia: {strategia_nome}")
+    print(f"Griglia completa: {ricerca.n_valide} combinazioni valide; passi iniziali "
+          f"{dict(zip(param_names, passi))} (in valori della griglia completa)")
+
+    valutate = {}           # posizioni -> metrica di ottimizzazione (-inf se la combinazione non è valida)
+    lotto = _griglia_rada(livelli, passi)
+    turno = 0
+    with ricerca:
+        while True:
+            turno += 1
+            lotto = [posizioni for posizioni in dict.fromkeys(lotto)
+                     if posizioni not in valutate and ricerca.rispetta_vincoli(posizioni)]
+            if lotto:
+                print(f"Turno {turno}: {len(lotto)} combinazioni con passi {dict(zip(param_names, passi))}")
+                performance = ricerca.valuta_lotto([ricerca.valori(posizioni) for posizioni in lotto], stima_totale)
+                if performance is None:
+                    break
+                valutate.update(zip(lotto, performance))
+
+            if all(passo == 1 for passo in passi):
+                break
+
+            # --- Infittisce la griglia attorno alle celle migliori ---
+            passi_precedenti = passi
+            passi = [max(1, passo // fattore_raffinamento) for passo in passi]
+            # A parità di metrica restano le celle valutate prima
+            celle = sorted(
+                (posizioni for posizioni, valore in valutate.items() if valore > -float('inf')),
+                key=lambda posizioni: valutate[posizioni], reverse=True
+            )[:celle_da_raffinare]
+            if not celle:
+                print("Avviso ottimizzazione: nessuna combinazione valida da raffinare.")
+                break
+            lotto = [vicino for cella in celle for vicino in _intorno(cella, livelli, passi_precedenti, passi)]
+
+    if progress_callback and valutate:
+        progress_callback(len(valutate), len(valutate))  # La stima del totale è per eccesso: completa la barra
+    return ricerca.concludi(f"{len(valutate)} combinazioni valutate invece di {ricerca.n_valide}")
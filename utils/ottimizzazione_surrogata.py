@@ -0,0 +1,233 @@
+# ottimizzazione_surrogata.py
+# Ottimizzazione dei parametri guidata da un modello surrogato (stile bayesiano) con scikit-learn.
+#
+# Invece di valutare tutta la griglia, si valuta un primo campione di Sobol e poi, a lotti, le
+# combinazioni che un modello (foresta casuale o processo gaussiano) addestrato sui risultati già
+# ottenuti indica come più promettenti secondo l'Expected Improvement. Ogni lotto viene valutato
+# con run_optimization (quindi anche in parallelo e con la cache dei risultati).
+
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.campionamento import campiona_combinazioni
+from utils.ottimizzazione_engine import prepara_ricerca_adattiva, risultato_vuoto, run_optimization
+
+MODELLI_SURROGATI = ('foresta', 'gp')
+
+
+def _crea_modello(modello: str, n_dimensioni: int, seme: int):
+    """
+    Istanzia il modello surrogato di scikit-learn (import ritardato: dipendenza opzionale).
+    """
+    if modello == 'gp':
+        from sklearn.gaussian_process import GaussianProcessRegressor
+        from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
+        kernel = ConstantKernel(1.0) * Matern(length_scale=np.full(n_dimensioni, 0.3), nu=2.5) + WhiteKernel(1e-3)
+        return GaussianProcessRegressor(kernel=kernel, normalize_y=True, n_restarts_optimizer=2, random_state=seme)
+    from sklearn.ensemble import RandomForestRegressor
+    return RandomForestRegressor(n_estimators=200, min_samples_leaf=2, random_state=seme)
+
+
+def _previsione(modello, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Media e deviazione standard previste dal modello surrogato. Per la foresta l'incertezza
+    è la dispersione delle previsioni dei singoli alberi.
+    """
+    if hasattr(modello, 'estimators_'):
+        previsioni_alberi = np.stack([albero.predict(X) for albero in modello.estimators_])
+        return previsioni_alberi.mean(axis=0), previsioni_alberi.std(axis=0)
+    media, deviazione = modello.predict(X, return_std=True)
+    return media, deviazione
+
+
+def expected_improvement(media: np.ndarray, deviazione: np.ndarray, migliore: float, xi: float = 0.01) -> np.ndarray:
+    """
+    Expected Improvement (massimizzazione) rispetto al miglior valore osservato.
+    """
+    miglioramento = media - migliore - xi
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(deviazione > 0, miglioramento / deviazione, 0.0)
+    cdf = 0.5 * (1.0 + np.vectorize(math.erf)(z / math.sqrt(2.0)))
+    pdf = np.exp(-0.5 * z ** 2) / math.sqrt(2.0 * math.pi)
+    return np.where(deviazione > 0, miglioramento * cdf + deviazione * pdf, np.maximum(miglioramento, 0.0))
+
+
+def _codifica(posizioni: np.ndarray, livelli: np.ndarray) -> np.ndarray:
+    """
+    Posizioni (indici dei valori di ogni parametro) normalizzate in [0, 1] per il modello.
+    """
+    return posizioni / np.maximum(livelli - 1, 1)
+
+
+def _vicini(posizioni: tuple, livelli: np.ndarray):
+    """
+    Combinazioni che differiscono di un solo passo in un solo parametro.
+    """
+    for dimensione, posizione in enumerate(posizioni):
+        for passo in (-1, 1):
+            nuova = posizione + passo
+            if 0 <= nuova < livelli[dimensione]:
+                yield posizioni[:dimensione] + (nuova,) + posizioni[dimensione + 1:]
+
+
+def _scegli_lotto(candidati: list, punteggi: np.ndarray, livelli: np.ndarray, dimensione_lotto: int,
+                  raggio: float = 0.15) -> list:
+    """
+    Sceglie il lotto dei candidati con punteggio più alto, penalizzando quelli vicini ai già scelti
+    per non valutare più volte la stessa zona.
+    """
+    X = _codifica(np.array(candidati, dtype=float), livelli)
+    punteggi = punteggi.astype(float).copy()
+    scelti = []
+    for _ in range(min(dimensione_lotto, len(candidati))):
+        migliore = int(np.argmax(punteggi))
+        if punteggi[migliore] == -np.inf:
+            break
+        scelti.append(candidati[migliore])
+        distanza = np.linalg.norm(X - X[migliore], axis=1)
+        punteggi = np.where(punteggi > 0, punteggi * (1.0 - np.exp(-(distanza / raggio) ** 2)), punteggi)
+        punteggi[migliore] = -np.inf
+    return scelti
+
+
+def run_surrogate_optimization(
+    dati: pd.DataFrame,
+    strategia_nome: str,
+    parametri_ottimizzazione_config: dict,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+    metrica_ottimizzazione: str = 'Rendimento della strategia (%)',
+    investimento_fisso_per_trade: float = None,
+    n_valutazioni: int = 200,
+    n_iniziali: int = None,
+    dimensione_lotto: int = 8,
+    modello: str = 'foresta',
+    n_candidati: int = 2000,
+    seme: int = None,
+    use_parallel: bool = False,
+    n_jobs: int = -1,
+    progress_callback=None,
+    cache_risultati=None
+) -> tuple:
+    """
+    Ottimizzazione guidata da modello surrogato: trova parametri vicini all'ottimo con poche centinaia
+    di backtest anche quando la griglia completa ne richiederebbe decine di migliaia.
+
+    Args:
+        dati, strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+        abilita_short, stop_loss_percent, take_profit_percent, trailing_stop_percent, metrica_ottimizzazione,
+        investimento_fisso_per_trade: Come in run_optimization.
+        n_valutazioni (int, optional): Numero massimo di combinazioni da valutare in totale.
+        n_iniziali (int, optional): Combinazioni del campione iniziale di Sobol (None = 5 per parametro, almeno 10).
+        dimensione_lotto (int, optional): Combinazioni proposte dal modello a ogni iterazione (valutate insieme,
+            in parallelo se use_parallel è True).
+        modello (str, optional): 'foresta' (RandomForestRegressor, default) o 'gp' (GaussianProcessRegressor).
+        n_candidati (int, optional): Combinazioni casuali (più i vicini delle migliori) su cui valutare
+            l'acquisizione a ogni iterazione.
+        seme (int, optional): Seme per campionamento e modello, per esecuzioni riproducibili.
+        use_parallel, n_jobs, cache_risultati: Passati a run_optimization per ogni lotto; dati preparati,
+            cache degli indicatori e pool di processi sono condivisi da tutti i lotti (RicercaAdattiva).
+        progress_callback (callable, optional): Funzione chiamata con (combinazioni valutate, n_valutazioni).
+
+    Returns:
+        tuple: Come run_optimization (best_params, best_results, all_results, best_equity_curve,
+        best_buy_hold_equity, best_trades); all_results è nell'ordine di valutazione.
+        Se scikit-learn non è installato viene valutato un campione di Sobol di n_valutazioni combinazioni.
+    """
+    ricerca = prepara_ricerca_adattiva(
+        dati=dati, strategia_nome=strategia_nome, parametri_ottimizzazione_config=parametri_ottimizzazione_config,
+        capitale_iniziale=capitale_iniziale, commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short, stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+        trailing_stop_percent=trailing_stop_percent, metrica_ottimizzazione=metrica_ottimizzazione,
+        investimento_fisso_per_trade=investimento_fisso_per_trade, use_parallel=use_parallel, n_jobs=n_jobs,
+        cache_risultati=cache_risultati, progress_callback=progress_callback,
+        descrizione="Ottimizzazione surrogata"
+    )
+    if ricerca is None:
+        return risultato_vuoto()
+    param_names = ricerca.param_names
+    n_valutazioni = min(n_valutazioni, ricerca.n_valide)
+
+    try:
+        _crea_modello(modello, len(param_names), seme)
+    except ImportError:
+        print("Modulo scikit-learn non disponibile. Valuto un campione di Sobol delle stesse dimensioni.")
+        with ricerca:
+            return run_optimization(
+                **ricerca.parametri_comuni, sessione=ricerca, max_combinazioni=n_valutazioni,
+                metodo_campionamento='sobol', seme_campionamento=seme, progress_callback=progress_callback,
+                total_combinations=n_valutazioni
+            )
+    if modello not in MODELLI_SURROGATI:
+        print(f"Avviso ottimizzazione: Modello surrogato '{modello}' non valido (disponibili: {MODELLI_SURROGATI}). Uso 'foresta'.")
+        modello = 'foresta'
+    livelli = np.array(ricerca.livelli)
+
+    if n_iniziali is None:
+        n_iniziali = max(10, 5 * len(param_names))
+    n_iniziali = min(n_iniziali, n_valutazioni)
+
+    print(f"Inizio ottimizzazione surrogata ({modello}) per la strategia: {strategia_nome}")
+    print(f"Budget: {n_valutazioni} combinazioni ({n_iniziali} iniziali, lotti da {dimensione_lotto})")
+
+    valutate = []           # Posizioni delle combinazioni valutate
+    prestazioni = []        # Metrica di ottimizzazione (NaN se la combinazione non è valida)
+    rng = np.random.default_rng(seme)
+
+    lotto = [ricerca.posizioni(combo) for combo in campiona_combinazioni(
+        ricerca.param_values, n_iniziali, 'sobol', seme, vincolo=ricerca.filtro_vincoli
+    )]
+    iterazione = 0
+    with ricerca:
+        while lotto:
+            performance = ricerca.valuta_lotto([ricerca.valori(posizioni) for posizioni in lotto], n_valutazioni)
+            if performance is None:
+                break
+            valutate.extend(lotto)
+            prestazioni.extend(valore if math.isfinite(valore) else np.nan for valore in performance)
+
+            mancanti = n_valutazioni - len(valutate)
+            if mancanti <= 0:
+                break
+
+            # --- Addestra il surrogato e propone il lotto successivo ---
+            iterazione += 1
+            y = np.array(prestazioni)
+            validi = np.isfinite(y)
+            gia_valutate = set(valutate)
+            candidati = {
+                ricerca.posizioni(combo)
+                for combo in campiona_combinazioni(ricerca.param_values, n_candidati, 'casuale', int(rng.integers(1 << 31)),
+                                                   vincolo=ricerca.filtro_vincoli)
+            }
+            if validi.sum() >= 2:
+                # Vicini delle combinazioni migliori per affinare la ricerca attorno all'ottimo corrente
+                for posizione in np.argsort(np.where(validi, y, -np.inf))[::-1][:5]:
+                    candidati.update(_vicini(valutate[posizione], livelli))
+            candidati = [c for c in candidati if c not in gia_valutate and ricerca.rispetta_vincoli(c)]
+            if not candidati:
+                break
+
+            if validi.sum() >= 2:
+                # Le combinazioni non valide pesano come il peggior risultato osservato
+                y_modello = np.where(validi, y, np.nanmin(y))
+                surrogato = _crea_modello(modello, len(param_names), seme)
+                surrogato.fit(_codifica(np.array(valutate, dtype=float), livelli), y_modello)
+                media, deviazione = _previsione(surrogato, _codifica(np.array(candidati, dtype=float), livelli))
+                punteggi = expected_improvement(media, deviazione, np.nanmax(y))
+                if not np.any(punteggi > 0):
+                    punteggi = deviazione  # Nessun miglioramento atteso: esplora dove il modello è più incerto
+            else:
+                punteggi = rng.random(len(candidati))
+            lotto = _scegli_lotto(candidati, punteggi, livelli, min(dimensione_lotto, mancanti))
+            print(f"Iterazione {iterazione}: {len(valutate)}/{n_valutazioni} combinazioni valutate, "
+                  f"migliore {ricerca.migliore['performance']:.2f}. Tempo trascorso: {time.time() - ricerca.start_time:.2f}s")
+
+    return ricerca.concludi(f"{len(valutate)} combinazioni valutate")
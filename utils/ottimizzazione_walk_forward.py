@@ -0,0 +1,357 @@
+# ottimizzazione_walk_forward.py
+# Ottimizzazione walk-forward: lo storico viene diviso in finestre in-sample (IS) seguite da una
+# finestra out-of-sample (OOS); per ogni finestra si sceglie la combinazione migliore sul tratto IS
+# e la si applica al tratto OOS successivo. Le equity OOS concatenate danno una stima della
+# performance della strategia su dati mai visti durante l'ottimizzazione.
+#
+# Gli indicatori usano solo barre passate, quindi i segnali di una combinazione vengono generati
+# una sola volta sull'intero storico e tagliati sulle singole finestre: indicatori (tramite
+# CacheIndicatori) e segnali sono condivisi da tutte le finestre, anche sovrapposte, e gli
+# indicatori delle prime barre di ogni finestra hanno già alle spalle il periodo di riscaldamento.
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.backtesting_engine import run_backtest, DTYPE_TRADE, _equity_buy_hold
+from utils.metriche_backtest import calcola_metriche
+from utils.cache_indicatori import CacheIndicatori
+from utils.memoria_condivisa import DatiCondivisi
+from utils.campionamento import campiona_combinazioni, crea_filtro_vincoli
+from utils.ottimizzazione_engine import (
+    ALTERNATIVE_METRICS, valori_parametri, _carica_classe_strategia, _prepara_dati_strategia,
+    _supporta_cache_indicatori, _genera_dati_backtest, _risultati_combinazione, _dimensione_blocco_parallelo
+)
+from utils.strategies_config import STRATEGIE_DISPONIBILI
+
+
+def finestre_walk_forward(n_barre: int, n_finestre: int, rapporto_in_sample: float, ancorata: bool = False) -> list:
+    """
+    Divide lo storico in finestre walk-forward.
+
+    I tratti OOS sono consecutivi, lunghi uguali e coprono la parte finale dello storico; il primo
+    tratto IS è lungo circa rapporto_in_sample volte un tratto OOS (più le barre avanzate dalla
+    divisione). Con finestre mobili ogni tratto IS ha la stessa lunghezza e scorre in avanti; con
+    finestre ancorate parte sempre dalla prima barra e si allunga.
+
+    Args:
+        n_barre (int): Barre dello storico.
+        n_finestre (int): Numero di finestre (tratti OOS).
+        rapporto_in_sample (float): Lunghezza di un tratto IS rispetto a un tratto OOS.
+        ancorata (bool, optional): Se True i tratti IS partono tutti dalla prima barra.
+
+    Returns:
+        list: Terne (inizio IS, fine IS = inizio OOS, fine OOS) di posizioni (fine esclusa), oppure una
+            lista vuota se lo storico è troppo corto.
+    """
+    if n_finestre < 1 or rapporto_in_sample <= 0:
+        return []
+    barre_oos = int(n_barre // (n_finestre + rapporto_in_sample))
+    if barre_oos < 1:
+        return []
+    barre_is = n_barre - n_finestre * barre_oos
+    finestre = []
+    for numero in range(n_finestre):
+        fine_is = barre_is + numero * barre_oos
+        finestre.append((0 if ancorata else fine_is - barre_is, fine_is, fine_is + barre_oos))
+    return finestre
+
+
+def _tratto(dati_per_backtest: pd.DataFrame, indice_completo: pd.Index, inizio: int, fine: int) -> pd.DataFrame:
+    """
+    Righe di dati_per_backtest comprese tra le posizioni inizio e fine (esclusa) dell'indice completo dei dati
+    (le strategie possono scartare le barre iniziali di riscaldamento, quindi si taglia per data).
+    """
+    indice = dati_per_backtest.index
+    prima = indice.searchsorted(indice_completo[inizio])
+    ultima = len(indice) if fine >= len(indice_completo) else indice.searchsorted(indice_completo[fine])
+    return dati_per_backtest.iloc[prima:ultima]
+
+
+# Stato del processo (worker o principale) che valuta le combinazioni sulle finestre IS
+_stato_walk_forward = {}
+
+
+def _prepara_stato_walk_forward(dati_per_strategia: pd.DataFrame, strategia_nome: str, param_names: list,
+                                finestre: list, parametri_backtest: dict, metrica_ottimizzazione: str, blocco=None):
+    """
+    Prepara una volta per processo classe della strategia, cache degli indicatori e finestre da valutare.
+    """
+    strategy_class = _carica_classe_strategia(strategia_nome)
+    _stato_walk_forward.clear()
+    _stato_walk_forward.update(
+        blocco=blocco,  # Riferimento che mantiene valida l'eventuale memoria condivisa
+        dati_per_strategia=dati_per_strategia,
+        strategy_class=strategy_class,
+        cache_indicatori=CacheIndicatori(dati_per_strategia) if _supporta_cache_indicatori(strategy_class) else None,
+        param_names=param_names,
+        finestre=finestre,
+        parametri_backtest=parametri_backtest,
+        metrica_ottimizzazione=metrica_ottimizzazione,
+    )
+
+
+def _inizializza_worker_walk_forward(descrittore: dict, strategia_nome: str, param_names: list, finestre: list,
+                                     parametri_backtest: dict, metrica_ottimizzazione: str):
+    """
+    Inizializzatore dei processi worker: si collega ai dati in memoria condivisa (senza copiarli).
+    """
+    blocco, dati_per_strategia = DatiCondivisi.collega(descrittore)
+    _prepara_stato_walk_forward(dati_per_strategia, strategia_nome, param_names, finestre,
+                                parametri_backtest, metrica_ottimizzazione, blocco)
+
+
+def _valuta_combinazione_finestre(combo: tuple) -> list:
+    """
+    Genera i segnali di una combinazione sull'intero storico e ne valuta la metrica su ogni tratto IS.
+
+    Returns:
+        list: Performance per finestra (NaN dove la combinazione non è valida).
+    """
+    finestre = _stato_walk_forward['finestre']
+    current_params = dict(zip(_stato_walk_forward['param_names'], combo))
+    dati_per_backtest = _genera_dati_backtest(
+        _stato_walk_forward['strategy_class'], _stato_walk_forward['dati_per_strategia'], current_params,
+        _stato_walk_forward['cache_indicatori']
+    )
+    if dati_per_backtest is None:
+        return [math.nan] * len(finestre)
+
+    metrica_ottimizzazione = _stato_walk_forward['metrica_ottimizzazione']
+    performance = []
+    for inizio_is, fine_is, _ in finestre:
+        try:
+            _, _, _, metriche_risultati = run_backtest(
+                _tratto(dati_per_backtest, _stato_walk_forward['dati_per_strategia'].index, inizio_is, fine_is),
+                metriche_richieste=[metrica_ottimizzazione] + ALTERNATIVE_METRICS,
+                **_stato_walk_forward['parametri_backtest']
+            )
+        except Exception as e:
+            print(f"Errore durante il backtest per parametri {current_params}: {e}. Finestra saltata.")
+            performance.append(math.nan)
+            continue
+        _, valore = _risultati_combinazione(current_params, metriche_risultati, metrica_ottimizzazione)
+        performance.append(math.nan if valore is None else float(valore))
+    return performance
+
+
+def _valuta_blocco_finestre(blocco: list) -> list:
+    """
+    Valuta un blocco di combinazioni (un solo task per blocco).
+    """
+    return [_valuta_combinazione_finestre(combo) for combo in blocco]
+
+
+def run_walk_forward(
+    dati: pd.DataFrame,
+    strategia_nome: str,
+    parametri_ottimizzazione_config: dict,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    stop_loss_percent: float = None,
+    take_profit_percent: float = None,
+    trailing_stop_percent: float = None,
+    metrica_ottimizzazione: str = 'Rendimento della strategia (%)',
+    investimento_fisso_per_trade: float = None,
+    n_finestre: int = 5,
+    rapporto_in_sample: float = 3.0,
+    ancorata: bool = False,
+    max_combinazioni: int = None,
+    metodo_campionamento: str = 'griglia',
+    seme_campionamento: int = None,
+    use_parallel: bool = False,
+    n_jobs: int = -1,
+    progress_callback=None
+) -> tuple:
+    """
+    Ottimizzazione walk-forward con equity out-of-sample concatenata.
+
+    Ogni combinazione viene valutata su tutti i tratti IS in un solo task (segnali generati una volta
+    sull'intero storico); con use_parallel i blocchi di combinazioni sono distribuiti tra i processi.
+    Per ogni finestra la combinazione con la metrica IS migliore (a parità, la prima nell'ordine della
+    griglia) viene poi eseguita sul tratto OOS, partendo dal capitale con cui si è chiuso il tratto OOS
+    precedente. Le finestre senza combinazioni valide restano senza operazioni.
+
+    Args:
+        dati, strategia_nome, parametri_ottimizzazione_config, capitale_iniziale, commissione_percentuale,
+        abilita_short, stop_loss_percent, take_profit_percent, trailing_stop_percent, metrica_ottimizzazione,
+        investimento_fisso_per_trade: Come in run_optimization.
+        n_finestre (int, optional): Numero di finestre walk-forward (default: 5).
+        rapporto_in_sample (float, optional): Lunghezza di un tratto IS rispetto a un tratto OOS (default: 3).
+        ancorata (bool, optional): Tratti IS tutti a partire dalla prima barra invece che mobili (default: False).
+        max_combinazioni, metodo_campionamento, seme_campionamento: Combinazioni da valutare, come in
+            run_optimization (default: griglia completa).
+        use_parallel (bool, optional): Distribuisce le combinazioni tra più processi.
+        n_jobs (int, optional): Numero di processi (-1 = tutti i core).
+        progress_callback (callable, optional): Funzione chiamata con (combinazioni valutate, totale).
+
+    Returns:
+        tuple: (finestre, metriche, equity_curve, buy_hold_equity, trades):
+            - finestre (pd.DataFrame): Una riga per finestra con date dei tratti, parametri scelti,
+              metrica IS e OOS e capitale a fine finestra.
+            - metriche (dict): Metriche dell'equity OOS concatenata.
+            - equity_curve (pd.Series): Equity OOS concatenata.
+            - buy_hold_equity (pd.Series): Buy & Hold sullo stesso periodo OOS.
+            - trades (np.ndarray): Trade OOS di tutte le finestre (DTYPE_TRADE).
+    """
+    risultato_vuoto = (pd.DataFrame(), {}, pd.Series(dtype=float), pd.Series(dtype=float), np.empty(0, dtype=DTYPE_TRADE))
+
+    if strategia_nome not in STRATEGIE_DISPONIBILI:
+        print(f"Errore: Strategia '{strategia_nome}' non trovata nella configurazione.")
+        return risultato_vuoto
+    strategy_class = _carica_classe_strategia(strategia_nome)
+    if strategy_class is None:
+        return risultato_vuoto
+
+    param_names, param_values = valori_parametri(parametri_ottimizzazione_config)
+    if not param_names:
+        print("Avviso ottimizzazione: Nessun parametro valido configurato per l'ottimizzazione.")
+        return risultato_vuoto
+
+    finestre = finestre_walk_forward(len(dati), n_finestre, rapporto_in_sample, ancorata)
+    if not finestre:
+        print(f"Avviso ottimizzazione: storico di {len(dati)} barre troppo corto per {n_finestre} finestre walk-forward.")
+        return risultato_vuoto
+
+    filtro_vincoli = crea_filtro_vincoli(param_names, STRATEGIE_DISPONIBILI[strategia_nome].get('constraints', []))
+    param_combinations = list(campiona_combinazioni(
+        param_values, max_combinazioni, metodo_campionamento, seme_campionamento, vincolo=filtro_vincoli
+    ))
+    if not param_combinations:
+        print("Avviso ottimizzazione: Nessuna combinazione valida da valutare.")
+        return risultato_vuoto
+
+    dati_per_strategia = _prepara_dati_strategia(dati)
+    if dati_per_strategia is None:
+        return risultato_vuoto
+
+    parametri_backtest = dict(
+        capitale_iniziale=capitale_iniziale, commissione_percentuale=commissione_percentuale,
+        abilita_short=abilita_short, investimento_fisso_per_trade=investimento_fisso_per_trade,
+        stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+        trailing_stop_percent=trailing_stop_percent
+    )
+    tipo_finestre = "ancorate" if ancorata else "mobili"
+    print(f"Inizio walk-forward per la strategia: {strategia_nome} ({len(finestre)} finestre {tipo_finestre}, "
+          f"{len(param_combinations)} combinazioni, {finestre[0][1] - finestre[0][0]} barre IS e "
+          f"{finestre[0][2] - finestre[0][1]} barre OOS per la prima finestra)")
+
+    start_time = time.time()
+    # Matrice combinazioni x finestre della metrica IS
+    prestazioni = np.full((len(param_combinations), len(finestre)), np.nan)
+    valutate = 0
+
+    def registra_blocco(risultati_blocco):
+        nonlocal valutate
+        prestazioni[valutate:valutate + len(risultati_blocco)] = risultati_blocco
+        valutate += len(risultati_blocco)
+        # Avanzamento una volta per blocco parallelo, ogni 10 combinazioni in sequenziale
+        if len(risultati_blocco) > 1 or valutate % 10 == 0 or valutate == len(param_combinations):
+            print(f"Processate {valutate}/{len(param_combinations)} combinazioni. Tempo trascorso: {time.time() - start_time:.2f}s")
+            if progress_callback:
+                progress_callback(valutate, len(param_combinations))
+
+    if use_parallel and len(param_combinations) > 1:
+        n_processi = n_jobs if n_jobs is not None and n_jobs > 0 else (os.cpu_count() or 1)
+        dimensione_blocco = _dimensione_blocco_parallelo(len(param_combinations), n_processi)
+        print(f"Esecuzione walk-forward in parallelo con {n_processi} processi (blocchi da {dimensione_blocco} combinazioni)")
+        try:
+            with DatiCondivisi(dati_per_strategia) as dati_condivisi, ProcessPoolExecutor(
+                max_workers=n_processi,
+                initializer=_inizializza_worker_walk_forward,
+                initargs=(dati_condivisi.descrittore, strategia_nome, param_names, finestre,
+                          parametri_backtest, metrica_ottimizzazione)
+            ) as executor:
+                blocchi = (
+                    param_combinations[inizio:inizio + dimensione_blocco]
+                    for inizio in range(0, len(param_combinations), dimensione_blocco)
+                )
+                # map restituisce i blocchi nell'ordine della griglia
+                for risultati_blocco in executor.map(_valuta_blocco_finestre, blocchi):
+                    registra_blocco(risultati_blocco)
+        except Exception as e:
+            # I blocchi già registrati restano validi: si prosegue in sequenziale con i rimanenti
+            print(f"Esecuzione parallela non disponibile ({e}). Proseguo in modalità sequenziale.")
+
+    if valutate < len(param_combinations):
+        _prepara_stato_walk_forward(dati_per_strategia, strategia_nome, param_names, finestre,
+                                    parametri_backtest, metrica_ottimizzazione)
+        try:
+            for combo in param_combinations[valutate:]:
+                registra_blocco([_valuta_combinazione_finestre(combo)])
+        finally:
+            _stato_walk_forward.clear()
+
+    # --- Applicazione delle combinazioni vincenti ai tratti OOS ---
+    righe_finestre = []
+    equity_oos = []
+    trades_oos = []
+    capitale_corrente = capitale_iniziale
+    barre_oos_precedenti = 0        # Barre dell'equity concatenata prima della finestra corrente
+    segnali_per_combinazione = {}   # stessa combinazione vincente in più finestre: segnali generati una volta
+    for numero, (inizio_is, fine_is, fine_oos) in enumerate(finestre):
+        riga = {
+            'Finestra': numero + 1,
+            'Inizio IS': dati.index[inizio_is],
+            'Fine IS': dati.index[fine_is - 1],
+            'Inizio OOS': dati.index[fine_is],
+            'Fine OOS': dati.index[fine_oos - 1],
+        }
+        colonna = prestazioni[:, numero]
+        equity_finestra = None
+        if np.isfinite(colonna).any():
+            indice_migliore = int(np.nanargmax(colonna))
+            params = dict(zip(param_names, param_combinations[indice_migliore]))
+            riga.update(params)
+            riga[f"{metrica_ottimizzazione} IS"] = float(colonna[indice_migliore])
+
+            if indice_migliore not in segnali_per_combinazione:
+                segnali_per_combinazione[indice_migliore] = _genera_dati_backtest(strategy_class, dati_per_strategia, params)
+            dati_per_backtest = segnali_per_combinazione[indice_migliore]
+            tratto_oos = None if dati_per_backtest is None else _tratto(dati_per_backtest, dati_per_strategia.index, fine_is, fine_oos)
+            if tratto_oos is not None and not tratto_oos.empty:
+                try:
+                    trades, equity_finestra, _, metriche_oos = run_backtest(
+                        tratto_oos,
+                        **dict(parametri_backtest, capitale_iniziale=capitale_corrente)
+                    )
+                    _, performance_oos = _risultati_combinazione(params, metriche_oos, metrica_ottimizzazione)
+                    riga[f"{metrica_ottimizzazione} OOS"] = performance_oos
+                    # Barre dei trade relative al tratto OOS: le si riporta all'equity concatenata
+                    # (le posizioni aperte restano con barra_uscita = -1)
+                    trades = trades.copy()
+                    trades['barra_ingresso'] += barre_oos_precedenti
+                    trades['barra_uscita'][trades['barra_uscita'] >= 0] += barre_oos_precedenti
+                    trades_oos.append(trades)
+                except Exception as e:
+                    print(f"Errore durante il backtest OOS della finestra {numero + 1} per parametri {params}: {e}.")
+                    equity_finestra = None
+        else:
+            print(f"Avviso ottimizzazione: nessuna combinazione valida nella finestra {numero + 1}. Tratto OOS senza operazioni.")
+
+        if equity_finestra is None:
+            equity_finestra = pd.Series(float(capitale_corrente), index=dati.index[fine_is:fine_oos])
+        capitale_corrente = float(equity_finestra.iloc[-1])
+        riga['Capitale Finale (€)'] = round(capitale_corrente, 2)
+        equity_oos.append(equity_finestra)
+        barre_oos_precedenti += len(equity_finestra)
+        righe_finestre.append(riga)
+        parametri_scelti = {nome: riga[nome] for nome in param_names if nome in riga}
+        print(f"Finestra {numero + 1}/{len(finestre)}: parametri {parametri_scelti}, "
+              f"capitale a fine OOS {capitale_corrente:.2f}")
+
+    equity_curve = pd.concat(equity_oos)
+    trades = np.concatenate(trades_oos) if trades_oos else np.empty(0, dtype=DTYPE_TRADE)
+    chiusura = dati_per_strategia['CLOSE'].reindex(equity_curve.index).to_numpy(dtype=float)
+    buy_hold_equity = pd.Series(_equity_buy_hold(chiusura, capitale_iniziale), index=equity_curve.index)
+    indice_date = equity_curve.index if isinstance(equity_curve.index, pd.DatetimeIndex) else pd.to_datetime(equity_curve.index)
+    metriche = calcola_metriche(trades, equity_curve.to_numpy(dtype=float), indice_date, capitale_iniziale)
+
+    print(f"Walk-forward completato in {time.time() - start_time:.2f} secondi. "
+          f"Capitale finale OOS: {capitale_corrente:.2f}")
+    return pd.DataFrame(righe_finestre), metriche, equity_curve, buy_hold_equity, trades
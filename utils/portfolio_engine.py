@@ -0,0 +1,297 @@
+# portfolio_engine.py
+# Backtest di portafoglio: una strategia su molti ticker con capitale condiviso.
+
+import pandas as pd
+import numpy as np
+
+from utils.backtesting_engine import DTYPE_TRADE, MOTIVO_SEGNALE, MOTIVO_CHIUSURA_FINALE
+from utils.metriche_backtest import calcola_metriche
+from utils import strumentazione
+from utils.ottimizzazione_engine import _carica_classe_strategia, _prepara_dati_strategia, _genera_dati_backtest
+
+# Trade log di portafoglio: come DTYPE_TRADE con in più il ticker del round-trip
+DTYPE_TRADE_PORTAFOGLIO = np.dtype([('ticker', 'U16')] + DTYPE_TRADE.descr)
+
+
+def allinea_universo(dati_per_ticker: dict) -> tuple[pd.DatetimeIndex, list, np.ndarray, np.ndarray]:
+    """
+    Allinea i dati di più ticker su un unico calendario (unione delle date).
+
+    Args:
+        dati_per_ticker (dict): {ticker: DataFrame con colonne 'Close' e 'Signal'} (come per run_backtest).
+
+    Returns:
+        tuple: (date_index, tickers, chiusura, segnali), dove chiusura e segnali sono array 2D
+        (date x ticker). Le chiusure mancanti sono NaN e i relativi segnali 0.
+    """
+    tickers = [t for t, df in dati_per_ticker.items() if df is not None and not df.empty]
+    if not tickers:
+        return pd.DatetimeIndex([]), [], np.empty((0, 0)), np.empty((0, 0))
+
+    chiusure = {}
+    segnali = {}
+    for ticker in tickers:
+        df = dati_per_ticker[ticker]
+        if isinstance(df.columns, pd.MultiIndex):
+            df = df.copy()
+            df.columns = df.columns.get_level_values(0)
+        indice = df.index if isinstance(df.index, pd.DatetimeIndex) else pd.to_datetime(df.index)
+        chiusure[ticker] = pd.Series(df['Close'].to_numpy(dtype=float), index=indice)
+        segnali[ticker] = pd.Series(df['Signal'].to_numpy(dtype=float), index=indice)
+
+    tabella_chiusure = pd.DataFrame(chiusure).sort_index()
+    tabella_segnali = pd.DataFrame(segnali).reindex(tabella_chiusure.index)
+
+    chiusura = np.ascontiguousarray(tabella_chiusure.to_numpy(dtype=float))
+    segnali_2d = np.nan_to_num(tabella_segnali.to_numpy(dtype=float))
+    segnali_2d[np.isnan(chiusura)] = 0.0  # Nessun ordine senza un prezzo in quella data
+    return tabella_chiusure.index, tickers, chiusura, np.ascontiguousarray(segnali_2d)
+
+
+def _riempi_in_avanti(chiusura: np.ndarray) -> np.ndarray:
+    """
+    Forward fill per colonna di un array 2D (ultimo prezzo noto); NaN prima del primo prezzo.
+    """
+    righe = np.where(np.isnan(chiusura), 0, np.arange(chiusura.shape[0])[:, None])
+    np.maximum.accumulate(righe, axis=0, out=righe)
+    return chiusura[righe, np.arange(chiusura.shape[1])]
+
+
+def _simula_portafoglio(
+    chiusura: np.ndarray,
+    segnali: np.ndarray,
+    tickers: list,
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool,
+    max_posizioni: int,
+    investimento_fisso_per_trade: float = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Nucleo del backtest di portafoglio su array 2D (date x ticker).
+
+    Gli ordini vengono eseguiti alla chiusura della data del segnale. Lo stato cambia solo nelle
+    date con almeno un segnale: il ciclo gira su quelle date e, per ciascuna, chiusure e aperture
+    sono calcolate su tutti i ticker insieme. L'equity (valutata a fine giornata) viene poi
+    ricostruita in blocco come in _simula_backtest_vettoriale.
+
+    Regole:
+        - Un segnale opposto chiude la posizione; con abilita_short il segnale -1 apre (o inverte in) SHORT.
+        - Al massimo max_posizioni aperte contemporaneamente; a parità di data ha priorità l'ordine dei ticker.
+        - Ogni ingresso investe investimento_fisso_per_trade, oppure equity corrente / max_posizioni,
+          sempre nei limiti della cassa disponibile (capitale condiviso tra i ticker).
+        - Una posizione SHORT impegna come garanzia lo stesso importo di un LONG; la commissione
+          si applica sia all'ingresso che all'uscita.
+        - Le posizioni ancora aperte vengono chiuse all'ultima chiusura disponibile del ticker.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: round-trip (array DTYPE_TRADE_PORTAFOGLIO) ed equity per data.
+    """
+    n_date, n_ticker = chiusura.shape
+    comm = commissione_percentuale / 100
+    usa_importo_fisso = investimento_fisso_per_trade is not None and investimento_fisso_per_trade > 0
+    prezzi = np.nan_to_num(_riempi_in_avanti(chiusura))
+
+    direzione = np.zeros(n_ticker, dtype=np.int64)
+    quantita = np.zeros(n_ticker, dtype=np.int64)
+    ingresso = np.zeros(n_ticker, dtype=float)
+    barra_ingresso = np.full(n_ticker, -1, dtype=np.int64)
+    cassa = float(capitale_iniziale)
+    round_trip = []
+
+    date_evento = np.flatnonzero((segnali != 0).any(axis=1))
+    # Stato dopo ciascun evento: parte costante dell'equity e azioni con segno per ticker
+    base_evento = np.empty(len(date_evento), dtype=float)
+    azioni_evento = np.empty((len(date_evento), n_ticker), dtype=float)
+
+    for k, t in enumerate(date_evento.tolist()):
+        prezzo = prezzi[t]
+        segnale = segnali[t]
+
+        # --- Uscite: segnale opposto alla posizione aperta ---
+        chiudi = (direzione != 0) & (segnale == -direzione)
+        if chiudi.any():
+            idx = np.flatnonzero(chiudi)
+            pl = (direzione[idx] * quantita[idx] * (prezzo[idx] - ingresso[idx])
+                  - comm * quantita[idx] * (ingresso[idx] + prezzo[idx]))
+            cassa += float(np.sum(quantita[idx] * ingresso[idx]
+                                  + direzione[idx] * quantita[idx] * (prezzo[idx] - ingresso[idx])
+                                  - comm * quantita[idx] * prezzo[idx]))
+            round_trip.extend(zip(
+                [tickers[j] for j in idx], barra_ingresso[idx].tolist(), [t] * len(idx),
+                direzione[idx].tolist(), quantita[idx].tolist(), ingresso[idx].tolist(),
+                prezzo[idx].tolist(), [MOTIVO_SEGNALE] * len(idx), pl.tolist()
+            ))
+            direzione[idx] = 0
+            quantita[idx] = 0
+            ingresso[idx] = 0.0
+            barra_ingresso[idx] = -1
+
+        # --- Ingressi: ticker senza posizione, nei limiti degli slot e della cassa ---
+        candidati = np.flatnonzero((direzione == 0) & ((segnale == 1) | ((segnale == -1) & abilita_short)))
+        slot_liberi = max_posizioni - int(np.count_nonzero(direzione))
+        if len(candidati) and slot_liberi > 0:
+            if usa_importo_fisso:
+                importo = float(investimento_fisso_per_trade)
+            else:
+                equity_corrente = cassa + float(np.sum(quantita * ingresso + direzione * quantita * (prezzo - ingresso)))
+                importo = equity_corrente / max_posizioni
+            for j in candidati.tolist():
+                if slot_liberi == 0:
+                    break
+                q = int(min(importo, cassa) / (prezzo[j] * (1 + comm))) if prezzo[j] > 0 else 0
+                if q <= 0:
+                    continue
+                cassa -= q * prezzo[j] * (1 + comm)
+                direzione[j] = int(segnale[j])
+                quantita[j] = q
+                ingresso[j] = prezzo[j]
+                barra_ingresso[j] = t
+                slot_liberi -= 1
+
+        azioni_evento[k] = direzione * quantita
+        base_evento[k] = cassa + float(np.sum(quantita * ingresso - direzione * quantita * ingresso))
+
+    # Equity a fine giornata: stato dopo l'ultimo evento fino a quella data inclusa
+    ultimo_evento = np.searchsorted(date_evento, np.arange(n_date), side='right') - 1
+    ha_evento = ultimo_evento >= 0
+    ultimo_evento = np.where(ha_evento, ultimo_evento, 0)
+    if len(date_evento):
+        valore_posizioni = np.einsum('ij,ij->i', azioni_evento[ultimo_evento], prezzi)
+        equity_values = np.where(ha_evento, base_evento[ultimo_evento] + valore_posizioni, float(capitale_iniziale))
+    else:
+        equity_values = np.full(n_date, float(capitale_iniziale))
+
+    # Chiusura finale delle posizioni aperte all'ultima chiusura disponibile di ciascun ticker
+    ultima_barra_valida = n_date - 1 - np.argmax(~np.isnan(chiusura[::-1]), axis=0) if n_date else np.zeros(n_ticker, dtype=np.int64)
+    for j in np.flatnonzero(direzione).tolist():
+        t_finale = int(ultima_barra_valida[j])
+        prezzo_finale = float(chiusura[t_finale, j])
+        pl = (direzione[j] * quantita[j] * (prezzo_finale - ingresso[j])
+              - comm * quantita[j] * (ingresso[j] + prezzo_finale))
+        round_trip.append((tickers[j], int(barra_ingresso[j]), t_finale, int(direzione[j]), int(quantita[j]),
+                           float(ingresso[j]), prezzo_finale, MOTIVO_CHIUSURA_FINALE, float(pl)))
+
+    trade = np.array(round_trip, dtype=DTYPE_TRADE_PORTAFOGLIO)
+    trade.sort(order=['barra_ingresso', 'barra_uscita'], kind='stable')
+    return trade, equity_values
+
+
+def _equity_buy_hold_portafoglio(chiusura: np.ndarray, capitale_iniziale: float) -> np.ndarray:
+    """
+    Buy & Hold equipesato: capitale diviso in parti uguali tra i ticker, ciascuno investito al primo
+    prezzo disponibile (la quota resta liquida finché il ticker non ha dati).
+    """
+    n_date, n_ticker = chiusura.shape
+    if n_date == 0 or n_ticker == 0:
+        return np.full(n_date, float(capitale_iniziale))
+    prezzi = _riempi_in_avanti(chiusura)
+    primo_valido = np.argmax(~np.isnan(chiusura), axis=0)
+    primo_prezzo = chiusura[primo_valido, np.arange(n_ticker)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rapporto = prezzi / primo_prezzo
+    rapporto = np.where(np.isfinite(rapporto), rapporto, 1.0)
+    return rapporto.mean(axis=1) * capitale_iniziale
+
+
+def run_portfolio_backtest(
+    dati_per_ticker: dict, # {ticker: DataFrame con dati OHLC e colonna 'Signal'}
+    capitale_iniziale: float,
+    commissione_percentuale: float,
+    abilita_short: bool = False,
+    max_posizioni: int = 10, # Numero massimo di posizioni aperte contemporaneamente
+    investimento_fisso_per_trade: float = None, # Importo per trade (None = equity / max_posizioni)
+    metriche_richieste: list = None,
+) -> tuple[np.ndarray, pd.Series, pd.Series, dict]:
+    """
+    Esegue il backtest di una strategia su più ticker con un'unica cassa condivisa.
+
+    Prezzi e segnali vengono allineati in array 2D (date x ticker) e simulati in un'unica passata:
+    i ticker competono per il capitale disponibile e per un numero limitato di posizioni.
+
+    Args:
+        dati_per_ticker (dict): {ticker: DataFrame con colonne 'Close' e 'Signal'}.
+        capitale_iniziale (float): Capitale iniziale del portafoglio.
+        commissione_percentuale (float): Commissione percentuale per ogni operazione.
+        abilita_short (bool): Se True, il segnale -1 apre posizioni SHORT.
+        max_posizioni (int): Numero massimo di posizioni aperte contemporaneamente.
+        investimento_fisso_per_trade (float, optional): Importo fisso per trade.
+        metriche_richieste (list, optional): Metriche da calcolare (None = tutte).
+
+    Returns:
+        tuple: Una tupla contenente:
+            - trade (np.ndarray): Round-trip (array strutturato DTYPE_TRADE_PORTAFOGLIO, con il ticker).
+            - equity_curve (pd.Series): Equity complessiva del portafoglio.
+            - buy_hold_equity (pd.Series): Equity Buy & Hold equipesata sui ticker.
+            - metriche (dict): Metriche di performance calcolate sul portafoglio.
+    """
+    with strumentazione.fase(strumentazione.FASE_PREPARAZIONE_DATI):
+        date_index, tickers, chiusura, segnali = allinea_universo(dati_per_ticker)
+    if not tickers:
+        print("Errore backtest portafoglio: nessun ticker con dati validi.")
+        return np.empty(0, dtype=DTYPE_TRADE_PORTAFOGLIO), pd.Series(dtype=float), pd.Series(dtype=float), {}
+    max_posizioni = max(1, int(max_posizioni))
+
+    with strumentazione.fase(strumentazione.FASE_SIMULAZIONE):
+        trade, equity_values = _simula_portafoglio(
+            chiusura, segnali, tickers,
+            capitale_iniziale=capitale_iniziale,
+            commissione_percentuale=commissione_percentuale,
+            abilita_short=abilita_short,
+            max_posizioni=max_posizioni,
+            investimento_fisso_per_trade=investimento_fisso_per_trade,
+        )
+    equity_curve = pd.Series(equity_values, index=date_index, name='Equity')
+    buy_hold_equity = pd.Series(_equity_buy_hold_portafoglio(chiusura, capitale_iniziale), index=date_index, name='Buy & Hold')
+    metriche = calcola_metriche(trade, equity_values, date_index, capitale_iniziale, metriche_richieste)
+    return trade, equity_curve, buy_hold_equity, metriche
+
+
+def genera_segnali_universo(dati_per_ticker: dict, strategia_nome: str, parametri_strategia: dict) -> dict:
+    """
+    Genera i segnali della strategia per ogni ticker (dati OHLCV scaricati) nel formato di run_portfolio_backtest.
+
+    I ticker per cui la generazione fallisce vengono esclusi con un messaggio.
+
+    Returns:
+        dict: {ticker: DataFrame pronto per il backtest}.
+    """
+    strategy_class = _carica_classe_strategia(strategia_nome)
+    if strategy_class is None:
+        return {}
+    risultato = {}
+    for ticker, dati in dati_per_ticker.items():
+        if dati is None or dati.empty:
+            continue
+        dati_per_strategia = _prepara_dati_strategia(dati)
+        if dati_per_strategia is None:
+            print(f"Avviso portafoglio: dati non validi per {ticker}, ticker escluso.")
+            continue
+        dati_backtest = _genera_dati_backtest(strategy_class, dati_per_strategia, parametri_strategia)
+        if dati_backtest is not None:
+            risultato[ticker] = dati_backtest
+    return risultato
+
+
+def tabella_trade_portafoglio(trade: np.ndarray, date_index: pd.Index) -> pd.DataFrame:
+    """
+    Tabella leggibile dei round-trip di run_portfolio_backtest (date al posto delle barre).
+
+    Args:
+        trade (np.ndarray): Round-trip (DTYPE_TRADE_PORTAFOGLIO).
+        date_index (pd.Index): Indice dell'equity del portafoglio.
+
+    Returns:
+        pd.DataFrame: Una riga per round-trip (data di uscita vuota per le posizioni aperte).
+    """
+    aperti = trade['barra_uscita'] < 0
+    return pd.DataFrame({
+        'Ticker': trade['ticker'],
+        'Tipo': np.where(trade['direzione'] > 0, 'LONG', 'SHORT'),
+        'Data Ingresso': date_index[trade['barra_ingresso']],
+        'Data Uscita': pd.Series(date_index[np.where(aperti, 0, trade['barra_uscita'])]).mask(aperti),
+        'Quantità': trade['quantita'],
+        'Prezzo Ingresso': trade['prezzo_ingresso'],
+        'Prezzo Uscita': trade['prezzo_uscita'],
+        'P/L (€)': trade['pl'],
+    })
@@ -25,7 +25,12 @@ STRATEGIE_DISPONIBILI = {
         "parameters": {
             "short_sma_length": {"type": "int", "default": 10, "min_value": 5, "max_value": 30, "step": 1, "label": "SMA Veloce"},
             "long_sma_length": {"type": "int", "default": 50, "min_value": 20, "max_value": 100, "step": 5, "label": "SMA Lenta"}
-        }
+        },
+        # Vincoli tra parametri (sinistro, operatore, destro): le combinazioni che non li rispettano
+        # non vengono generate dall'ottimizzatore (la strategia le rifiuterebbe con un ValueError)
+        "constraints": [
+            ("short_sma_length", "<", "long_sma_length")
+        ]
     },
    "Livelli Bollinger Bands": {
         # Aggiornato per usare 'module' e 'class'
@@ -48,7 +53,18 @@ STRATEGIE_DISPONIBILI = {
             "periodo_dd": {"type": "int", "default": 3, "min_value": 1, "max_value": 20, "step": 1, "label": "Periodo %DD"},
             "soglia_buy": {"type": "int", "default": 20, "min_value": 10, "max_value": 50, "step": 5, "label": "Soglia Buy"},
             "soglia_sell": {"type": "int", "default": 80, "min_value": 50, "max_value": 90, "step": 5, "label": "Soglia Sell"}
-        }
+        },
+        "constraints": [
+            ("soglia_buy", "<", "soglia_sell"),
+            ("soglia_buy", ">=", 10),
+            ("soglia_sell", "<=", 90),
+            ("periodo_k", ">=", 1),
+            ("periodo_k", "<=", 50),
+            ("periodo_d", ">=", 1),
+            ("periodo_d", "<=", 20),
+            ("periodo_dd", ">=", 1),
+            ("periodo_dd", "<=", 20)
+        ]
     },
     "Supertrend": {
         "module": "supertrend_strategy", # Nome del file Python (senza .py)
@@ -0,0 +1,143 @@
+# strumentazione.py
+# Timer per fase e contatori per profilare backtest e ottimizzazione senza stampe nei cicli.
+#
+# Disattivata per default: fase() restituisce un context manager vuoto condiviso e conta()
+# esce subito, quindi il costo nei percorsi caldi è di una chiamata di funzione.
+#
+# Esempio:
+#     from utils import strumentazione
+#     with strumentazione.sessione():
+#         run_optimization(...)
+#         print(strumentazione.rapporto_tabella())
+#
+# Nota: i dati sono raccolti nel processo corrente (i worker paralleli hanno una copia separata).
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+# Fasi standard usate dai motori
+FASE_PREPARAZIONE_DATI = 'preparazione_dati'
+FASE_GENERAZIONE_SEGNALI = 'generazione_segnali'
+FASE_SIMULAZIONE = 'simulazione'
+FASE_METRICHE = 'metriche'
+
+_attiva = False
+_tempi = defaultdict(float)      # Secondi totali per fase
+_chiamate = defaultdict(int)     # Numero di esecuzioni per fase
+_contatori = defaultdict(int)    # Contatori liberi (combinazioni, trade, barre, ...)
+_NESSUNA_FASE = nullcontext()
+
+
+class _Fase:
+    """
+    Context manager che misura la durata di una fase e la accumula nel registro.
+    """
+    __slots__ = ('nome', 'inizio')
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.inizio = 0.0
+
+    def __enter__(self):
+        self.inizio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _tempi[self.nome] += time.perf_counter() - self.inizio
+        _chiamate[self.nome] += 1
+        return False
+
+
+def fase(nome: str):
+    """
+    Misura il blocco `with` come fase `nome` (tempo inclusivo delle fasi annidate).
+    Se la strumentazione è disattivata non misura nulla.
+    """
+    return _Fase(nome) if _attiva else _NESSUNA_FASE
+
+
+def conta(nome: str, quantita: int = 1):
+    """
+    Incrementa il contatore `nome` (nessun effetto se la strumentazione è disattivata).
+    """
+    if _attiva:
+        _contatori[nome] += quantita
+
+
+def abilita(attiva: bool = True):
+    """
+    Attiva (o disattiva) la raccolta di tempi e contatori.
+    """
+    global _attiva
+    _attiva = bool(attiva)
+
+
+def disabilita():
+    """
+    Disattiva la raccolta di tempi e contatori (i dati raccolti restano disponibili).
+    """
+    abilita(False)
+
+
+def attiva() -> bool:
+    """
+    True se la strumentazione sta raccogliendo dati.
+    """
+    return _attiva
+
+
+def azzera():
+    """
+    Cancella tempi e contatori raccolti.
+    """
+    _tempi.clear()
+    _chiamate.clear()
+    _contatori.clear()
+
+
+@contextmanager
+def sessione(azzera_dati: bool = True):
+    """
+    Attiva la strumentazione per la durata del blocco `with` e poi ripristina lo stato precedente.
+
+    Args:
+        azzera_dati (bool, optional): Se True (default) cancella i dati raccolti in precedenza.
+    """
+    stato_precedente = _attiva
+    if azzera_dati:
+        azzera()
+    abilita(True)
+    try:
+        yield
+    finally:
+        abilita(stato_precedente)
+
+
+def rapporto() -> dict:
+    """
+    Rapporto strutturato dei dati raccolti.
+
+    Returns:
+        dict: {'fasi': {nome: {'chiamate', 'tempo_totale_s', 'tempo_medio_ms'}}, 'contatori': {nome: valore}}.
+    """
+    fasi = {
+        nome: {
+            'chiamate': _chiamate[nome],
+            'tempo_totale_s': _tempi[nome],
+            'tempo_medio_ms': _tempi[nome] / _chiamate[nome] * 1000 if _chiamate[nome] else 0.0,
+        }
+        for nome in sorted(_tempi, key=_tempi.get, reverse=True)
+    }
+    return {'fasi': fasi, 'contatori': dict(_contatori)}
+
+
+def rapporto_tabella() -> pd.DataFrame:
+    """
+    Tempi per fase come DataFrame (una riga per fase, ordinate per tempo totale decrescente).
+    """
+    return pd.DataFrame.from_dict(
+        rapporto()['fasi'], orient='index', columns=['chiamate', 'tempo_totale_s', 'tempo_medio_ms']
+    )
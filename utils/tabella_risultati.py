@@ -0,0 +1,133 @@
+# tabella_risultati.py
+# Risultati di un'ottimizzazione in forma colonnare, per griglie molto grandi.
+#
+# Invece di un dizionario Python per combinazione, i valori di parametri e metriche sono scritti in
+# array NumPy preallocati (una colonna per parametro/metrica); un heap di dimensione fissa tiene gli
+# indici delle top_k combinazioni secondo la metrica di ottimizzazione. La memoria occupata dipende
+# solo dal numero di combinazioni e di colonne, non dal numero di chiavi dei singoli dizionari.
+
+import heapq
+import math
+
+import numpy as np
+import pandas as pd
+
+
+class TabellaRisultati:
+    """
+    Tabella colonnare dei risultati con le top_k combinazioni migliori.
+
+    Si usa come la lista all_results di run_optimization: supporta append/extend di righe (dict),
+    len(), iterazione e slicing, che restituiscono righe ricostruite come dict.
+    """
+
+    def __init__(self, param_names: list, metrica_ottimizzazione: str, capacita: int = 1024, top_k: int = 10):
+        """
+        Args:
+            param_names (list): Nomi dei parametri (colonne sempre presenti in ogni riga).
+            metrica_ottimizzazione (str): Metrica usata per la classifica delle top_k.
+            capacita (int, optional): Righe preallocate (la tabella cresce se necessario).
+            top_k (int, optional): Numero di combinazioni migliori da tenere in classifica.
+        """
+        self.param_names = list(param_names)
+        self.metrica_ottimizzazione = metrica_ottimizzazione
+        self.top_k = max(1, top_k)
+        self._capacita = max(1, capacita)
+        self._n_righe = 0
+        self._colonne = {}      # nome -> np.ndarray (int64 per i parametri interi, float64 altrimenti)
+        self._classifica = []   # heap di (performance, -indice riga, indice riga)
+
+    def __len__(self) -> int:
+        return self._n_righe
+
+    def __iter__(self):
+        for indice in range(self._n_righe):
+            yield self.riga(indice)
+
+    def __getitem__(self, posizione):
+        if isinstance(posizione, slice):
+            return [self.riga(indice) for indice in range(*posizione.indices(self._n_righe))]
+        if posizione < 0:
+            posizione += self._n_righe
+        if not 0 <= posizione < self._n_righe:
+            raise IndexError("Indice di riga fuori dalla tabella dei risultati.")
+        return self.riga(posizione)
+
+    def _nuova_colonna(self, nome: str, valore) -> np.ndarray:
+        """
+        Crea la colonna `nome` (NaN per le righe precedenti); i parametri interi restano interi.
+        """
+        if nome in self.param_names and isinstance(valore, (int, np.integer)) and not isinstance(valore, bool):
+            colonna = np.zeros(self._capacita, dtype=np.int64)
+        else:
+            colonna = np.full(self._capacita, np.nan)
+        self._colonne[nome] = colonna
+        return colonna
+
+    def _espandi(self):
+        """
+        Raddoppia la capacità di tutte le colonne.
+        """
+        nuova_capacita = self._capacita * 2
+        for nome, colonna in self._colonne.items():
+            espansa = np.full(nuova_capacita, np.nan) if colonna.dtype.kind == 'f' else np.zeros(nuova_capacita, dtype=colonna.dtype)
+            espansa[:self._capacita] = colonna
+            self._colonne[nome] = espansa
+        self._capacita = nuova_capacita
+
+    def append(self, riga: dict):
+        """
+        Aggiunge una riga (parametri e metriche numeriche; gli altri valori vengono ignorati).
+        """
+        if self._n_righe == self._capacita:
+            self._espandi()
+        indice = self._n_righe
+        for nome, valore in riga.items():
+            if not isinstance(valore, (int, float, np.integer, np.floating)):
+                continue
+            colonna = self._colonne.get(nome)
+            if colonna is None:
+                colonna = self._nuova_colonna(nome, valore)
+            colonna[indice] = valore
+        self._n_righe += 1
+
+        performance = riga.get(self.metrica_ottimizzazione)
+        if isinstance(performance, (int, float, np.integer, np.floating)) and math.isfinite(performance):
+            # A parità di performance resta in classifica la riga aggiunta prima (come nel ciclo sequenziale)
+            voce = (float(performance), -indice, indice)
+            if len(self._classifica) < self.top_k:
+                heapq.heappush(self._classifica, voce)
+            elif voce > self._classifica[0]:
+                heapq.heapreplace(self._classifica, voce)
+
+    def extend(self, righe):
+        """
+        Aggiunge più righe.
+        """
+        for riga in righe:
+            self.append(riga)
+
+    def riga(self, indice: int) -> dict:
+        """
+        Riga `indice` come dict (le metriche assenti in quella riga sono omesse).
+        """
+        risultato = {}
+        for nome, colonna in self._colonne.items():
+            valore = colonna[indice].item()
+            if nome in self.param_names or not (isinstance(valore, float) and math.isnan(valore)):
+                risultato[nome] = valore
+        return risultato
+
+    def migliori(self) -> list:
+        """
+        Righe delle top_k combinazioni, dalla migliore (a parità, nell'ordine di inserimento).
+        """
+        return [self.riga(indice) for _, _, indice in sorted(self._classifica, reverse=True)]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Tabella come DataFrame (una riga per combinazione, colonne dei parametri per prime).
+        """
+        ordine = [nome for nome in self.param_names if nome in self._colonne]
+        ordine += [nome for nome in self._colonne if nome not in self.param_names]
+        return pd.DataFrame({nome: self._colonne[nome][:self._n_righe] for nome in ordine})